@@ -0,0 +1,245 @@
+# llm_verilog_eval/evaluation_scripts/eval_pool.py
+"""
+Process pool running many testbench evaluations concurrently, and a pipeline feeding it from
+the generation loop (EvalPipeline).
+
+Workers run the testbenches in-process through testbench_api.py by default, or through
+evaluate_rtl.sh (in_process=False). Every evaluation builds in its own scratch directory
+(BUILD_DIR, honored by the tb/test_*.py scripts), so candidates of the same module do not
+overwrite each other's test_<module>.vvp / .lxt files.
+Each evaluation returns a verdict dict:
+    {"rtl", "log", "status": "pass" | "fail" | "compile_error" | "error", "passed",
+     "returncode", "compile_errors", "seconds", "worker_pid", "workdir",
+     "output" (reason of an "error")}
+"""
+import multiprocessing
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+
+from testbench_api import make_verdict, parse_compile_errors, run_testbench
+
+EVAL_SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "evaluate_rtl.sh")
+VERDICT_STATUSES = ("pass", "fail", "compile_error", "error")
+
+def _run_evaluate_rtl_script(rtl_path, log_path, testbench_script, dut_env_var, workdir):
+    try:
+        # Run through bash: no chmod of the shared script from many workers at once
+        eval_process = subprocess.run(
+            ["bash", EVAL_SCRIPT_PATH, os.path.abspath(rtl_path), testbench_script, dut_env_var,
+             os.path.abspath(log_path)],
+            capture_output=True, text=True, env={**os.environ, "BUILD_DIR": workdir}
+        )
+    except OSError as e:
+        return make_verdict(rtl_path, log_path, "error", output=str(e))
+    if eval_process.returncode == 0:
+        return make_verdict(rtl_path, log_path, "pass", eval_process.returncode)
+    compile_errors = parse_compile_errors(log_path)
+    if compile_errors:
+        status = "compile_error"
+    elif not os.path.exists(log_path):
+        status = "error" # evaluate_rtl.sh failed before running the testbench
+    else:
+        status = "fail"
+    return make_verdict(rtl_path, log_path, status, eval_process.returncode, compile_errors,
+                        output=(eval_process.stdout + eval_process.stderr)[-2000:] if status == "error" else "")
+
+def run_evaluation(rtl_path, log_path, testbench_script, dut_env_var, work_root=None, keep_workdir=False,
+                   in_process=True):
+    """Evaluates one RTL file in a fresh scratch directory under `work_root`. Returns its verdict."""
+    start = time.perf_counter()
+    workdir = tempfile.mkdtemp(prefix=f"{os.path.splitext(os.path.basename(rtl_path))[0]}_", dir=work_root)
+    if os.path.exists(log_path):
+        os.remove(log_path) # A stale log would hide a failure before the testbench ran
+    try:
+        if in_process:
+            verdict = run_testbench(rtl_path, testbench_script, dut_env_var, workdir, log_path)
+        else:
+            verdict = _run_evaluate_rtl_script(rtl_path, log_path, testbench_script, dut_env_var, workdir)
+    finally:
+        if not keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    verdict.update(workdir=workdir, worker_pid=os.getpid(), seconds=time.perf_counter() - start)
+    return verdict
+
+def _failed_verdict(job, error):
+    """Verdict of an evaluation whose worker could not run it or died (e.g. a BrokenProcessPool)."""
+    rtl_path, log_path, _, _ = job
+    verdict = make_verdict(rtl_path, log_path, "error", output=f"Evaluation did not complete: {error!r}")
+    verdict.update(workdir=None, worker_pid=None, seconds=0.0)
+    return verdict
+
+def _verdict_of(job, future):
+    try:
+        return future.result()
+    except Exception as e:
+        return _failed_verdict(job, e)
+
+class EvalPool:
+    """
+    Evaluates RTL files on `num_workers` processes (default: all cores). Use as a context manager,
+    or call close(). Evaluations never run in the calling process: in-process testbenches take
+    over the working directory and the stdout/stderr file descriptors of their process.
+    """
+    def __init__(self, num_workers=None, work_root=None, keep_workdirs=False, in_process=True):
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.work_root = work_root
+        self.keep_workdirs = keep_workdirs
+        self.in_process = in_process
+        if work_root:
+            os.makedirs(work_root, exist_ok=True)
+        # spawn: the parent may hold a CUDA context and a loaded model, neither of which should be forked
+        self._executor = ProcessPoolExecutor(self.num_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def submit(self, rtl_path, log_path, testbench_script, dut_env_var):
+        """Starts one evaluation. Returns a concurrent.futures.Future of its verdict."""
+        return self._executor.submit(run_evaluation, rtl_path, log_path, testbench_script, dut_env_var,
+                                     self.work_root, self.keep_workdirs, self.in_process)
+
+    def evaluate_all(self, jobs):
+        """Evaluates (rtl_path, log_path, testbench_script, dut_env_var) jobs. Returns the verdicts in job order."""
+        futures = [self.submit(*job) for job in jobs]
+        return [_verdict_of(job, future) for job, future in zip(jobs, futures)]
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class EvalPipeline:
+    """
+    Overlaps generation with simulation. The generation loop put()s saved candidates into a
+    bounded queue; a dispatcher thread hands them to an EvalPool as workers become free. When
+    `max_queued` candidates are waiting, put() blocks (backpressure), so generation never runs
+    further ahead of simulation than that. Time spent inside generating() blocks and the
+    workers' busy time give the per-stage utilization reported by stats().
+    """
+    def __init__(self, num_workers=None, max_queued=None, work_root=None, in_process=True):
+        self.eval_pool = EvalPool(num_workers, work_root=work_root, in_process=in_process)
+        self.num_workers = self.eval_pool.num_workers
+        self.max_queued = max_queued or 2 * self.num_workers
+        self._queue = queue.Queue(maxsize=self.max_queued)
+        self._free_workers = threading.Semaphore(self.num_workers)
+        self._futures = {} # key -> (job, Future), in put order
+        self._start = time.perf_counter()
+        self._generation_seconds = 0.0
+        self._blocked_seconds = 0.0
+        self._max_queue_depth = 0
+        self._drain_seconds = None
+        self._wall_seconds = None
+        self._dispatcher = threading.Thread(target=self._dispatch, name="eval-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def _dispatch(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            key, job = item
+            self._free_workers.acquire()
+            try:
+                future = self.eval_pool.submit(*job)
+            except Exception as e:
+                # Keep draining the queue, or put() would block forever; the candidate fails as an "error"
+                self._free_workers.release()
+                future = Future()
+                future.set_result(_failed_verdict(job, e))
+            else:
+                future.add_done_callback(lambda _: self._free_workers.release())
+            self._futures[key] = (job, future)
+
+    @contextmanager
+    def generating(self):
+        """Marks a block of generation work, for the generation stage's utilization."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._generation_seconds += time.perf_counter() - start
+
+    def put(self, key, rtl_path, log_path, testbench_script, dut_env_var):
+        """Queues one candidate for evaluation; blocks while the queue is full."""
+        start = time.perf_counter()
+        self._queue.put((key, (rtl_path, log_path, testbench_script, dut_env_var)))
+        self._blocked_seconds += time.perf_counter() - start
+        self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+
+    def finish(self):
+        """Waits until every queued candidate is evaluated. Returns {key: verdict} in put order."""
+        drain_start = time.perf_counter()
+        if self._dispatcher.is_alive():
+            self._queue.put(None)
+            self._dispatcher.join()
+        verdicts = {key: _verdict_of(job, future) for key, (job, future) in self._futures.items()}
+        if self._drain_seconds is None:
+            self._drain_seconds = time.perf_counter() - drain_start
+            self._wall_seconds = time.perf_counter() - self._start
+        return verdicts
+
+    def stats(self):
+        """Per-stage utilization, over the pipeline's lifetime up to finish()."""
+        verdicts = [_verdict_of(job, future) for job, future in self._futures.values() if future.done()]
+        eval_busy_seconds = sum(v["seconds"] for v in verdicts)
+        wall_seconds = self._wall_seconds or time.perf_counter() - self._start
+        return {
+            "num_candidates": len(verdicts),
+            "num_workers": self.num_workers,
+            "max_queued": self.max_queued,
+            "max_queue_depth": self._max_queue_depth,
+            "wall_seconds": wall_seconds,
+            "generation_seconds": self._generation_seconds,
+            "generation_utilization": self._generation_seconds / wall_seconds,
+            "producer_blocked_seconds": self._blocked_seconds, # Generation paused by backpressure
+            "eval_busy_seconds": eval_busy_seconds,
+            "eval_utilization": eval_busy_seconds / (self.num_workers * wall_seconds),
+            "drain_seconds": self._drain_seconds, # Simulation still running after generation ended
+        }
+
+    def close(self):
+        if self._dispatcher.is_alive():
+            self._queue.put(None)
+            self._dispatcher.join()
+        self.eval_pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def format_verdict(verdict):
+    """One-line report of a verdict, in the style of evaluate_candidate's output."""
+    name = os.path.basename(verdict["rtl"])
+    if verdict["passed"]:
+        return f"SUCCESS: Evaluation PASSED for {name} ({verdict['seconds']:.1f}s)"
+    report = f"FAILURE: Evaluation FAILED ({verdict['status']}) for {name} ({verdict['seconds']:.1f}s)"
+    if verdict["status"] == "error":
+        last_line = (verdict["output"].strip().splitlines() or [f"exit code {verdict['returncode']}"])[-1]
+        return f"{report}\n         {last_line}"
+    return f"{report}\n         MyHDL/Icarus logs should be in: {verdict['log']}"
+
+def summarize_verdicts(verdicts, wall_seconds=None):
+    """Aggregates verdicts: counts per status, pass rate and simulation time (busy vs wall clock)."""
+    counts = {status: sum(v["status"] == status for v in verdicts) for status in VERDICT_STATUSES}
+    summary = {
+        "num_candidates": len(verdicts),
+        "num_passed": counts["pass"],
+        "pass_rate": counts["pass"] / len(verdicts) if verdicts else 0.0,
+        "status_counts": counts,
+        "eval_seconds": sum(v["seconds"] for v in verdicts),
+        "num_workers": len({v["worker_pid"] for v in verdicts if v["worker_pid"] is not None}),
+    }
+    if wall_seconds is not None:
+        summary["wall_seconds"] = wall_seconds
+        summary["speedup"] = summary["eval_seconds"] / wall_seconds if wall_seconds > 0 else None
+    return summary
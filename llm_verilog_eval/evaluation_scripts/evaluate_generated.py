@@ -0,0 +1,84 @@
+# llm_verilog_eval/evaluation_scripts/evaluate_generated.py
+"""
+Eval-only entry point: re-evaluates existing generated RTL with the testbench flow of
+run_experiment.py without loading any ML library (no torch/transformers import).
+
+Usage:
+    python evaluate_generated.py --module i2c_init                  # every file in generated_rtl/i2c_init/
+    python evaluate_generated.py --module simple_and a.v b.v        # selected files
+    python evaluate_generated.py --module i2c_init --raw out.txt     # raw LLM output, cleaned first
+    python evaluate_generated.py --module i2c_init --workers 32      # 32 concurrent simulations
+    python evaluate_generated.py --module i2c_init --use-script      # through evaluate_rtl.sh
+
+Logs are written as <name>_reeval.log into results/<module>/ and a JSON summary of the
+verdicts (see eval_pool.py) as reeval_<timestamp>_summary.json next to them.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+_import_start = time.perf_counter()
+from run_experiment import MODULE_CONFIGS, PROJECT_ROOT, cleanup_generated_verilog
+from eval_pool import EvalPool, format_verdict, summarize_verdicts
+IMPORT_SECONDS = time.perf_counter() - _import_start
+
+def evaluate_files(module_name, rtl_paths, results_dir, raw=False, num_workers=None, in_process=True):
+    """
+    Evaluates every RTL file (or raw LLM output with `raw`) on `num_workers` processes (default:
+    one per core), in-process or with evaluate_rtl.sh. Returns one verdict dict per file.
+    """
+    module_config = MODULE_CONFIGS[module_name]
+    os.makedirs(results_dir, exist_ok=True)
+    jobs = []
+    for rtl_path in rtl_paths:
+        basename = os.path.splitext(os.path.basename(rtl_path))[0]
+        if raw:
+            with open(rtl_path, 'r') as f:
+                cleaned_code = cleanup_generated_verilog(f.read())
+            rtl_path = os.path.join(results_dir, f"{basename}_cleaned.v")
+            with open(rtl_path, 'w') as f:
+                f.write(cleaned_code)
+        log_filepath = os.path.join(results_dir, f"{basename}_reeval.log")
+        jobs.append((rtl_path, log_filepath, module_config["testbench_script"], module_config["dut_env_var"]))
+    with EvalPool(min(num_workers or os.cpu_count() or 1, len(jobs)), in_process=in_process) as eval_pool:
+        futures = [eval_pool.submit(*job) for job in jobs]
+        for future in futures:
+            print(format_verdict(future.result()))
+    return [future.result() for future in futures]
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-evaluate generated RTL without loading a model.")
+    parser.add_argument("--module", required=True, choices=sorted(MODULE_CONFIGS))
+    parser.add_argument("rtl_files", nargs="*", help="RTL files (default: all of generated_rtl/<module>/)")
+    parser.add_argument("--raw", action="store_true", help="Inputs are raw LLM outputs; extract the Verilog first")
+    parser.add_argument("--results-dir", default=None, help="Default: llm_verilog_eval/results/<module>/")
+    parser.add_argument("--workers", type=int, default=None, help="Concurrent simulations (default: one per core)")
+    parser.add_argument("--use-script", action="store_true", help="Run evaluate_rtl.sh per file instead of in-process")
+    args = parser.parse_args()
+    print(f"INFO [evaluate_generated]: Evaluation code imported in {IMPORT_SECONDS:.3f}s "
+          f"(torch loaded: {'torch' in sys.modules}, transformers loaded: {'transformers' in sys.modules}).")
+
+    rtl_files = args.rtl_files or sorted(glob.glob(
+        os.path.join(PROJECT_ROOT, "llm_verilog_eval", "generated_rtl", args.module, "*.v")))
+    if not rtl_files:
+        print(f"Error: No generated RTL found for module '{args.module}'.")
+        sys.exit(1)
+    results_dir = args.results_dir or os.path.join(PROJECT_ROOT, "llm_verilog_eval", "results", args.module)
+
+    start = time.perf_counter()
+    verdicts = evaluate_files(args.module, rtl_files, results_dir, raw=args.raw, num_workers=args.workers,
+                              in_process=not args.use_script)
+    summary = summarize_verdicts(verdicts, wall_seconds=time.perf_counter() - start)
+    summary_path = os.path.join(results_dir, f"reeval_{datetime.now().strftime('%Y%m%d_%H%M%S')}_summary.json")
+    with open(summary_path, 'w') as f:
+        json.dump({"module": args.module, **summary, "verdicts": verdicts}, f, indent=2)
+    print(f"SUMMARY: {summary['num_passed']}/{len(verdicts)} files PASSED for {args.module} "
+          f"({summary['status_counts']}, {summary['wall_seconds']:.1f}s on {summary['num_workers']} worker(s)). "
+          f"Verdicts written to {summary_path}")
+
+if __name__ == "__main__":
+    main()
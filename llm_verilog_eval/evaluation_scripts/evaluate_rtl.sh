@@ -42,6 +42,13 @@ if [ ! -d "$TB_DIR" ]; then
     echo "Error: Testbench directory not found at '$TB_DIR'"
     exit 1
 fi
+# Optional job-scoped build directory (eval_pool.py sets one per evaluation): every tb/test_*.py writes
+# its test_<module>.vvp and waveform there instead of into tb/, so concurrent evaluations, also of the
+# same module, do not overwrite each other's files. Made absolute because the testbench runs in tb/.
+if [ -n "$BUILD_DIR" ]; then
+    mkdir -p "$BUILD_DIR" || { echo "Error: Failed to create build directory $BUILD_DIR"; exit 1; }
+    export BUILD_DIR="$(realpath "$BUILD_DIR")"
+fi
 FULL_TESTBENCH_SCRIPT_PATH="${TB_DIR}/${TESTBENCH_SCRIPT_NAME_ARG}"
 if [ ! -f "$FULL_TESTBENCH_SCRIPT_PATH" ]; then
     echo "Error: Testbench script not found at '$FULL_TESTBENCH_SCRIPT_PATH'"
@@ -62,6 +69,7 @@ echo "----------------------------------------------------------------------"
 echo "Evaluating DUT: $(basename "$GENERATED_RTL_FILE") (Path: ${!DUT_ENV_VAR_NAME_ARG})"
 echo "Using Testbench: $TESTBENCH_SCRIPT_NAME_ARG (in $PWD)"
 echo "MyHDL VPI Path: $IVERILOG_VPI_MODULE_PATH"
+echo "Build directory: ${BUILD_DIR:-$TB_DIR}"
 [ -n "$LOG_FILE_ARG" ] && echo "Log file: $LOG_FILE_ARG"
 echo "----------------------------------------------------------------------"
 
@@ -0,0 +1,74 @@
+# llm_verilog_eval/evaluation_scripts/measure_startup.py
+"""
+Measures the import (startup) time of every entry point in a fresh interpreter and
+whether it pulls in torch/transformers.
+
+Usage:
+    python measure_startup.py [--repeats 5] [--json startup_times.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+UTILS_DIR = os.path.join(SCRIPTS_DIR, '..', 'utils')
+
+# (entry point, directory it is imported from)
+ENTRY_POINTS = [
+    ("evaluate_generated", SCRIPTS_DIR),   # Eval-only, must not load ML libraries
+    ("run_experiment", SCRIPTS_DIR),       # Backends import their ML libraries when they load a model
+    ("openai_stand_in", UTILS_DIR),
+    ("generation_server", UTILS_DIR),      # Serves local models, imports torch/transformers up front
+    ("llm_interface", UTILS_DIR),
+]
+
+_PROBE = """
+import json, sys, time
+sys.path[:0] = {paths!r}
+start = time.perf_counter()
+try:
+    import {module}
+    error = None
+except BaseException as e: # SystemExit included: some entry points exit when a dependency is missing
+    error = f"{{type(e).__name__}}: {{e}}"
+print(json.dumps({{"seconds": time.perf_counter() - start, "error": error,
+                  "torch_loaded": "torch" in sys.modules, "transformers_loaded": "transformers" in sys.modules}}))
+"""
+
+def measure_entry_point(module, directory, repeats=5):
+    """Imports `module` in `repeats` fresh interpreters. Returns the median import time and loaded libraries."""
+    runs = []
+    for _ in range(repeats):
+        probe = _PROBE.format(paths=[directory, UTILS_DIR], module=module)
+        result = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, cwd=directory)
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {
+        "entry_point": module,
+        "median_seconds": statistics.median(run["seconds"] for run in runs),
+        "min_seconds": min(run["seconds"] for run in runs),
+        "torch_loaded": runs[-1]["torch_loaded"],
+        "transformers_loaded": runs[-1]["transformers_loaded"],
+        "error": runs[-1]["error"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the startup time of the llm_verilog_eval entry points.")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--json", default=None, help="Also write the measurements to this JSON file")
+    args = parser.parse_args()
+
+    results = [measure_entry_point(module, directory, args.repeats) for module, directory in ENTRY_POINTS]
+    print(f"{'entry point':<20} {'median':>9} {'min':>9}  torch  transformers")
+    for r in results:
+        print(f"{r['entry_point']:<20} {r['median_seconds']:>8.3f}s {r['min_seconds']:>8.3f}s  "
+              f"{'yes' if r['torch_loaded'] else 'no':<5}  {'yes' if r['transformers_loaded'] else 'no'}"
+              f"{'  (' + r['error'] + ')' if r['error'] else ''}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
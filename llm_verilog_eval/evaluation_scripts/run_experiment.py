@@ -1,4 +1,5 @@
 # llm_verilog_eval/evaluation_scripts/run_experiment.py
+import copy
 import os
 import sys
 import subprocess
@@ -7,11 +8,20 @@ from datetime import datetime
 # Add utils directory to Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
 try:
-    from llm_interface import load_model_and_tokenizer, generate_verilog
+    import generation_client
+    from generation_backends import create_backend
+    from token_budget import compute_token_budget, count_tokens, is_truncated, log_truncation_event
+    from masking_utils import mask_verilog_lines, DEFAULT_MASK_TOKEN
+    from fim_utils import generate_masked_infills, DEFAULT_MAX_NEW_TOKENS_PER_MASK
+    from generation_metrics import write_metrics_record
+    from prompt_compaction import compact_prompt_with_stats
+    from prompt_renderer import get_prompt_renderer
+    from run_manifest import RunManifest, write_atomic
 except ImportError as e:
-    print(f"Error: Could not import from llm_interface.py: {e}")
-    print("Ensure it's in the ../utils/ directory and an __init__.py file exists in utils if needed.")
+    print(f"Error: Could not import the generation and prompt utilities from ../utils/: {e}")
+    print("Ensure the llm_verilog_eval/utils/ modules are in the ../utils/ directory.")
     sys.exit(1)
+from eval_pool import EvalPipeline, format_verdict, parse_compile_errors, summarize_verdicts
 
 # --- Configuration ---
 # For a very quick pipeline test, use a small, fast model if Qwen is too slow.
@@ -21,22 +31,157 @@ MODEL_NAME_OR_PATH = "/data/genai/models/Qwen2.5-Coder-32B-Instruct" #"Qwen/Qwen
 # MODEL_NAME_OR_PATH = "/data/genai/models/Qwen3-0.6B"
 MODEL_NAME_OR_PATH = "/data/genai/models/gemma-3-27b-it"
 QUANTIZATION = None # Or "8bit", "4bit" for larger models if VRAM is an issue
+# URL of a running utils/generation_server.py (e.g. "http://127.0.0.1:8765") that keeps models loaded
+# across experiments; None = load the model in this process
+GENERATION_SERVER_URL = None
+# Small draft model sharing the target's tokenizer for speculative decoding, e.g.
+# "/data/genai/models/Qwen2.5-Coder-7B" for Qwen2.5-Coder-32B-Instruct (requires NUM_SAMPLES = 1); None = plain decoding
+DRAFT_MODEL_NAME_OR_PATH = None
+# Generation backend used when GENERATION_SERVER_URL is None: "hf" (transformers in this process),
+# "replay" (serve earlier outputs from llm_verilog_eval/generated_rtl; benchmarks evaluation without a GPU)
+# or "openai" (OpenAI-compatible completions server such as vLLM at OPENAI_BASE_URL)
+GENERATION_BACKEND = "hf"
+# Overrides of utils/cpu_profile.DEFAULT_CPU_PROFILE, used by the "hf" backend on nodes without CUDA,
+# e.g. {"dynamic_int8": True, "torch_compile": True, "intra_op_threads": 32}
+CPU_PROFILE = None
+OPENAI_BASE_URL = "http://127.0.0.1:8000"
 
 PROJECT_ROOT = "/data/genai/kmcho/llm_generation_test/verilog-i2c" #"/data/genai/kmcho/verilog-i2c" # Your project root
 
 # === Simple Test Case Configuration ===
 MODULE_NAME = "simple_and"
-TESTBENCH_SCRIPT_NAME = "test_simple_and.py"    # To be passed to evaluate_rtl.sh
-DUT_ENV_VAR_NAME = "DUT_RTL_FILE_SIMPLE_AND" # To be passed to evaluate_rtl.sh and used by test_simple_and.py
-
 MODULE_NAME = "i2c_init"
-TESTBENCH_SCRIPT_NAME = "test_i2c_init.py"    # To be passed to evaluate_rtl.sh
-DUT_ENV_VAR_NAME = "DUT_RTL_FILE_I2C_INIT" # To be passed to evaluate_rtl.sh and used by test_simple_and.py
+
+# Module-specific settings (these will be used based on MODULE_NAME)
+MODULE_CONFIGS = {
+    "simple_and": {
+        "testbench_script": "test_simple_and.py", # To be passed to evaluate_rtl.sh
+        "dut_env_var": "DUT_RTL_FILE_SIMPLE_AND", # To be passed to evaluate_rtl.sh and used by test_simple_and.py
+        "reference_rtl_filename": "simple_and.v", # In PROJECT_ROOT/rtl/, used for the token budget
+        "token_budget": { # max_new_tokens = multiplier x reference RTL tokens, clamped to [min_tokens, max_tokens]
+            "multiplier": 4.0,
+            "min_tokens": 512,
+            "max_tokens": 8192,
+        },
+        "partial_completion_params": {
+            "num_lines_to_mask": 1, # Mask the single 'assign' line
+            "mask_after_line": 8, # 1-index mask only after this line number
+            "mask_start_line": None, # 1-index mask starting at this line number (inclusive)
+            "mask_end_line": None, # 1-index mask stop at this line number (inclusive)
+            "max_new_tokens_per_mask": 64, # Each mask is infilled on its own (fill-in-the-middle)
+        },
+        # Overrides of utils/prompt_compaction.DEFAULT_PROMPT_COMPACTION, applied to the Verilog placed
+        # into prompts (header or masked RTL); omit the section to use the Verilog unchanged
+        "prompt_compaction": {
+            "strip_license": True,
+            "collapse_whitespace": True,
+            "drop_comments": False, # True also drops comments that do not document a declaration
+        },
+    },
+    "i2c_init": {
+        "testbench_script": "test_i2c_init.py",
+        "dut_env_var": "DUT_RTL_FILE_I2C_INIT",
+        "reference_rtl_filename": "i2c_init.v",
+        "token_budget": {
+            "multiplier": 1.5,
+            "min_tokens": 512,
+            "max_tokens": 8192,
+        },
+        "partial_completion_params": {
+            "num_lines_to_mask": 2,
+            "mask_after_line": 140,
+            "mask_start_line": None,
+            "mask_end_line": None,
+            "max_new_tokens_per_mask": 64,
+        },
+        "prompt_compaction": {
+            "strip_license": True,
+            "collapse_whitespace": True,
+            "drop_comments": False,
+        },
+    },
+}
+
+if MODULE_NAME not in MODULE_CONFIGS:
+    print(f"Error: Module '{MODULE_NAME}' is not defined in MODULE_CONFIGS.")
+    sys.exit(1)
+
+def _set_module_settings():
+    """(Re)derives the MODULE_NAME-specific settings from MODULE_CONFIGS."""
+    global CURRENT_MODULE_CONFIG, TESTBENCH_SCRIPT_NAME, DUT_ENV_VAR_NAME, REFERENCE_RTL_FILENAME
+    global TOKEN_BUDGET_CONFIG, PARTIAL_COMPLETION_PARAMS, PROMPT_COMPACTION
+    CURRENT_MODULE_CONFIG = MODULE_CONFIGS[MODULE_NAME]
+    TESTBENCH_SCRIPT_NAME = CURRENT_MODULE_CONFIG["testbench_script"]
+    DUT_ENV_VAR_NAME = CURRENT_MODULE_CONFIG["dut_env_var"]
+    REFERENCE_RTL_FILENAME = CURRENT_MODULE_CONFIG.get("reference_rtl_filename")
+    TOKEN_BUDGET_CONFIG = CURRENT_MODULE_CONFIG.get("token_budget", {})
+    PARTIAL_COMPLETION_PARAMS = CURRENT_MODULE_CONFIG.get("partial_completion_params", {})
+    PROMPT_COMPACTION = CURRENT_MODULE_CONFIG.get("prompt_compaction", {"enabled": False})
+
+_set_module_settings()
 # ====================================
 
 EXPERIMENT_MODE = "full_completion"
+# In partial_completion mode only the masked lines are generated (fill-in-the-middle) and spliced back
+# into the masked reference. FIM special tokens are used when the tokenizer has them; set to False to
+# always use per-mask chat prompts instead.
+USE_FIM_TOKENS = True
+
+# Number of samples drawn from a single prefill of the prompt (for pass@k); 1 = single generation
+NUM_SAMPLES = 1
+SAMPLING_SEED = None # Fixed seed for reproducible sampling; None = random seed (recorded in the filenames)
+TEMPERATURE = 0.7
+# Name of an interrupted run to resume (its run basename, e.g. "i2c_init_<model>_full_completion_20250508_101610"):
+# samples its <run>_manifest.json records as generated or evaluated are skipped. None = start a new run
+RESUME_RUN = None
+# Appended to the run basename to tell apart runs that differ in other settings (set by run_matrix.py)
+RUN_TAG = None
+
+# Ban SystemVerilog-only keywords (logic, always_ff, int, ...) and prose after the code fence while decoding
+CONSTRAIN_VERILOG2001 = False
+# > 0: additionally generate this many seeded samples with and without the constraint (full_completion only)
+# and report the iverilog compile pass uplift in <run>_verilog2001_uplift.json
+COMPILE_UPLIFT_SAMPLES = 0
+
+# > 0: when iverilog rejects a full_completion output, send its errors back as a follow-up chat turn and
+# regenerate, up to this many rounds. With the "hf" backend each round resumes from the previous turn's
+# KV cache (the first round only with NUM_SAMPLES = 1), so only the new turn is prefilled. Per-round
+# latency and token metrics are written to <sample>_repair.json
+REPAIR_ROUNDS = 0
+# At most this many iverilog error lines are quoted in a repair turn
+REPAIR_MAX_ERROR_LINES = 20
+
+# Concurrent evaluations (each in its own scratch directory); None = one per core, 1 = serial
+EVAL_WORKERS = None
+# Run the testbenches in the evaluation workers through testbench_api.py; False = launch evaluate_rtl.sh
+# for every sample (repairs always use evaluate_rtl.sh)
+EVAL_IN_PROCESS = True
+# Where the per-evaluation scratch directories are created; None = the system temp directory
+EVAL_WORK_ROOT = None
+# Generated samples waiting for a free evaluation worker; generation pauses while this many are queued.
+# None = twice the number of workers
+EVAL_QUEUE_SIZE = None
 # --- End Configuration ---
 
+# Configuration as defined above; configure() starts from it, so no job's overrides leak into the next
+_DEFAULT_SETTINGS = copy.deepcopy({name: value for name, value in globals().items() if name.isupper()})
+
+def configure(**settings):
+    """
+    Resets the configuration constants of this script to their defaults and applies `settings` on
+    top, for the following main() calls, e.g.
+    configure(MODEL_NAME_OR_PATH="/data/genai/models/Qwen3-0.6B", MODULE_NAME="simple_and", NUM_SAMPLES=4).
+    Used by run_matrix.py to run many configurations in one process.
+    """
+    for name in settings:
+        if name not in _DEFAULT_SETTINGS:
+            raise KeyError(f"Unknown run_experiment setting '{name}'")
+    if settings.get("MODULE_NAME", _DEFAULT_SETTINGS["MODULE_NAME"]) not in _DEFAULT_SETTINGS["MODULE_CONFIGS"]:
+        raise KeyError(f"Module '{settings['MODULE_NAME']}' is not defined in MODULE_CONFIGS")
+    globals().update(copy.deepcopy(_DEFAULT_SETTINGS))
+    globals().update(settings)
+    _set_module_settings()
+
 def cleanup_generated_verilog(raw_output):
     # (Use the same cleanup_generated_verilog function as provided in the previous response)
     # Common markdown code block
@@ -68,10 +213,28 @@ def cleanup_generated_verilog(raw_output):
 
 
 def main():
+    """Runs one experiment with the current configuration. Returns its summary (run name, samples passed)."""
     print(f"Starting experiment for module: {MODULE_NAME}, mode: {EXPERIMENT_MODE}")
     
     try:
-        model, tokenizer = load_model_and_tokenizer(MODEL_NAME_OR_PATH, use_quantization=QUANTIZATION)
+        if GENERATION_SERVER_URL:
+            model, tokenizer = generation_client.load_model_and_tokenizer(
+                MODEL_NAME_OR_PATH, use_quantization=QUANTIZATION, server_url=GENERATION_SERVER_URL)
+            generate_fn = generation_client.generate_verilog
+            generate_samples_fn = generation_client.generate_verilog_samples
+        else:
+            backend_options = {
+                "hf": {"draft_model_name_or_path": DRAFT_MODEL_NAME_OR_PATH, "cpu_profile": CPU_PROFILE},
+                "replay": {"generated_rtl_dir": os.path.join(PROJECT_ROOT, "llm_verilog_eval", "generated_rtl"),
+                           "module_name": MODULE_NAME, "mode": EXPERIMENT_MODE},
+                "openai": {"base_url": OPENAI_BASE_URL},
+            }.get(GENERATION_BACKEND, {})
+            backend = create_backend(GENERATION_BACKEND, **backend_options)
+            model, tokenizer = backend.load(MODEL_NAME_OR_PATH, use_quantization=QUANTIZATION)
+            generate_fn = backend.generate_verilog
+            generate_samples_fn = backend.generate_verilog_samples
+        # Validates the chat template once and caches its fixed parts
+        prompt_renderer = get_prompt_renderer(tokenizer, MODEL_NAME_OR_PATH)
     except Exception as e:
         print(f"FATAL: Failed to load model or tokenizer: {e}")
         sys.exit(1)
@@ -81,17 +244,32 @@ def main():
     prompts_module_dir = os.path.join(PROJECT_ROOT, "llm_verilog_eval", "prompts", MODULE_NAME)
     generated_rtl_module_dir = os.path.join(PROJECT_ROOT, "llm_verilog_eval", "generated_rtl", MODULE_NAME)
     results_module_dir = os.path.join(PROJECT_ROOT, "llm_verilog_eval", "results", MODULE_NAME)
+    reference_rtl_dir = os.path.join(PROJECT_ROOT, "rtl")
 
     os.makedirs(generated_rtl_module_dir, exist_ok=True)
     os.makedirs(results_module_dir, exist_ok=True)
 
     safe_model_name = MODEL_NAME_OR_PATH.replace('/', '_').replace('-', '_')
-    output_v_filename = f"{MODULE_NAME}_{safe_model_name}_{EXPERIMENT_MODE}_{timestamp}.v"
-    output_v_filepath = os.path.join(generated_rtl_module_dir, output_v_filename)
-    log_filename = f"{MODULE_NAME}_{safe_model_name}_{EXPERIMENT_MODE}_{timestamp}_eval.log"
-    log_filepath = os.path.join(results_module_dir, log_filename)
+    run_basename = RESUME_RUN or f"{MODULE_NAME}_{safe_model_name}_{EXPERIMENT_MODE}_{timestamp}"
+    if RUN_TAG and not RESUME_RUN:
+        run_basename += f"_{RUN_TAG}"
+
+    # Records the status of every sample so an interrupted sweep can be resumed with RESUME_RUN
+    manifest = RunManifest(os.path.join(results_module_dir, f"{run_basename}_manifest.json"), {
+        "run": run_basename, "model": MODEL_NAME_OR_PATH, "module": MODULE_NAME, "mode": EXPERIMENT_MODE,
+        "num_samples": NUM_SAMPLES, "temperature": TEMPERATURE,
+    })
+    if RESUME_RUN and not manifest.resumed:
+        print(f"Error: No manifest found for run '{RESUME_RUN}' in {results_module_dir}")
+        sys.exit(1)
+    timestamp = manifest.data.setdefault("timestamp", timestamp) # Keeps the masked template name of the run
+    for sample_index in range(NUM_SAMPLES):
+        manifest.add_item(sample_index, SAMPLING_SEED + sample_index if SAMPLING_SEED is not None else None)
+    manifest.save()
 
     prompt_text_for_llm = ""
+    shared_prefix = None
+    compaction_stats = None
     if EXPERIMENT_MODE == "full_completion":
         header_file_path = os.path.join(prompts_module_dir, "full_completion_header.v")
         if not os.path.exists(header_file_path):
@@ -99,6 +277,8 @@ def main():
             sys.exit(1)
         with open(header_file_path, 'r') as f:
             prompt_header_and_comment = f.read()
+        prompt_header_and_comment, compaction_stats = compact_prompt_with_stats(
+            tokenizer, prompt_header_and_comment, PROMPT_COMPACTION, label=f"{MODULE_NAME} prompt header")
         
         # --- CRITICAL: Adapt this prompt format to your specific Qwen model! ---
         # This is a general example. Consult the Qwen model card on Hugging Face.
@@ -115,37 +295,289 @@ def main():
         # Construct the input for the LLM:
         full_prompt_content = f"{prompt_header_and_comment}"
 
-        messages = [
-            {"role": "system", "content": user_instruction},
-            # Pass the Verilog header and initial comments as the start of the user's request for completion
-            {"role": "user", "content": f"Complete this Verilog module:\n```verilog\n{full_prompt_content}\n```"}
-        ]
-        try:
-            prompt_text_for_llm = tokenizer.apply_chat_template(
-                messages,
-                tokenize=False,
-                add_generation_prompt=True # Important!
-            )
-            print(f"DEBUG: Applied chat template. Resulting prompt starts with: {prompt_text_for_llm[:200]}")
-        except Exception as e:
-            print(f"Error applying chat template: {e}. Using raw header as fallback.")
-            prompt_text_for_llm = full_prompt_content # Fallback
+        # Pass the Verilog header and initial comments as the start of the user's request for completion
+        user_content = f"Complete this Verilog module:\n```verilog\n{full_prompt_content}\n```"
+        messages = prompt_renderer.messages(user_content, system=user_instruction) # Also the history of repair turns
+        prompt_text_for_llm = prompt_renderer.render(user_content, system=user_instruction)
+        print(f"DEBUG: Applied chat template. Resulting prompt starts with: {prompt_text_for_llm[:200]}")
+        # The rendered prompt up to the module header is the same for every sample and chunk, so the HF
+        # backend prefills its KV cache once
+        header_idx = prompt_text_for_llm.find(full_prompt_content)
+        shared_prefix = prompt_text_for_llm[:header_idx] if header_idx > 0 else None
         # --- END CRITICAL SECTION ---
     elif EXPERIMENT_MODE == "partial_completion":
-        print("Partial completion mode setup not fully implemented in this script yet.")
-        # Here you would load the reference RTL, call a masking function from masking_utils.py,
-        # and then construct a prompt asking the LLM to fill in the masked parts.
-        sys.exit(1)
+        if not REFERENCE_RTL_FILENAME:
+            print(f"Error: 'reference_rtl_filename' not configured for module '{MODULE_NAME}' in partial_completion mode.")
+            sys.exit(1)
+        reference_rtl_path = os.path.join(reference_rtl_dir, REFERENCE_RTL_FILENAME)
+        if not os.path.exists(reference_rtl_path):
+            print(f"Error: Reference RTL file '{REFERENCE_RTL_FILENAME}' not found at {reference_rtl_path} for partial completion.")
+            sys.exit(1)
+
+        # Store masked files in the module's prompt directory for inspection
+        os.makedirs(prompts_module_dir, exist_ok=True)
+        masked_rtl_filepath = os.path.join(prompts_module_dir, f"{MODULE_NAME}_masked_for_{timestamp}.v")
+        seed_for_masking = 42 # Use a fixed seed for reproducibility
+        if not mask_verilog_lines(
+            reference_rtl_path,
+            masked_rtl_filepath,
+            num_lines_to_mask=PARTIAL_COMPLETION_PARAMS.get("num_lines_to_mask", 1),
+            mask_token=DEFAULT_MASK_TOKEN,
+            seed=seed_for_masking,
+            module_name_for_ref=MODULE_NAME,
+            mask_after_line=PARTIAL_COMPLETION_PARAMS.get("mask_after_line"),
+            mask_start_line=PARTIAL_COMPLETION_PARAMS.get("mask_start_line"),
+            mask_end_line=PARTIAL_COMPLETION_PARAMS.get("mask_end_line")
+        ):
+            print(f"Error: Failed to create masked Verilog file at {masked_rtl_filepath}")
+            sys.exit(1)
+
+        with open(masked_rtl_filepath, 'r') as f:
+            masked_code_content = f.read()
+        # Mask tokens are always kept, so the infills still splice into the compacted template
+        masked_code_content, compaction_stats = compact_prompt_with_stats(
+            tokenizer, masked_code_content, PROMPT_COMPACTION, label=f"{MODULE_NAME} masked RTL")
     else: # Placeholder for other modes
         print(f"Error: Experiment mode '{EXPERIMENT_MODE}' not fully set up for this script.")
         sys.exit(1)
 
-    print(f"Generating Verilog using {MODEL_NAME_OR_PATH}...")
-    raw_llm_output = generate_verilog(model, tokenizer, prompt_text_for_llm)
-    
+    if EXPERIMENT_MODE == "partial_completion":
+        max_new_tokens = PARTIAL_COMPLETION_PARAMS.get("max_new_tokens_per_mask", DEFAULT_MAX_NEW_TOKENS_PER_MASK)
+    else:
+        # Size max_new_tokens from the reference RTL (or the prompt header if there is none)
+        budget_reference_path = os.path.join(reference_rtl_dir, REFERENCE_RTL_FILENAME) if REFERENCE_RTL_FILENAME else None
+        if not budget_reference_path or not os.path.exists(budget_reference_path):
+            budget_reference_path = os.path.join(prompts_module_dir, "full_completion_header.v")
+        max_new_tokens, _ = compute_token_budget(tokenizer, budget_reference_path, TOKEN_BUDGET_CONFIG, module_name_for_ref=MODULE_NAME)
+
+    evaluated = manifest.indices("evaluated")
+    num_passed = sum(manifest.item(i)["passed"] for i in evaluated)
+    if evaluated:
+        print(f"INFO: Skipping {len(evaluated)} sample(s) already evaluated in run {run_basename} ({num_passed} PASSED).")
+
+    candidates = {} # sample_index -> (sample, sample_basename), in evaluation order
+    def queue_for_evaluation(sample_index):
+        """Saves the RTL of a generated sample and queues it for simulation."""
+        item = manifest.item(sample_index)
+        with open(item["raw_output_path"], 'r') as f:
+            sample = {"output": f.read(), "seed": item["seed"], "sample_index": sample_index,
+                      "generation_calls": item["generation_calls"]}
+        if EXPERIMENT_MODE == "full_completion":
+            output_token_count = count_tokens(tokenizer, sample["output"])
+            if is_truncated(output_token_count, max_new_tokens):
+                log_truncation_event(
+                    os.path.join(results_module_dir, "truncation_events.jsonl"), MODULE_NAME, MODEL_NAME_OR_PATH,
+                    max_new_tokens, output_token_count,
+                    mode=EXPERIMENT_MODE, run=run_basename, sample_index=sample["sample_index"], seed=sample["seed"]
+                )
+        sample_basename = item["sample_basename"]
+        output_v_filepath = os.path.join(generated_rtl_module_dir, f"{sample_basename}.v")
+        log_filepath = os.path.join(results_module_dir, f"{sample_basename}_eval.log")
+        write_metrics_record(os.path.join(results_module_dir, f"{sample_basename}_gen_metrics.json"), {
+            "module": MODULE_NAME, "model": MODEL_NAME_OR_PATH, "mode": EXPERIMENT_MODE, "run": run_basename,
+            "sample_index": sample["sample_index"], "seed": sample["seed"],
+            "prompt_compaction": compaction_stats, "generation_calls": sample["generation_calls"],
+        })
+        print(f"\n=== Sample {sample['sample_index'] + 1}/{NUM_SAMPLES} (seed: {sample['seed']}) ===")
+        # Infilled partial completions are already plain RTL and must not go through code-block extraction
+        save_candidate(sample["output"], output_v_filepath, cleanup=EXPERIMENT_MODE != "partial_completion")
+        eval_pipeline.put(sample_index, output_v_filepath, log_filepath, TESTBENCH_SCRIPT_NAME, DUT_ENV_VAR_NAME)
+        candidates[sample_index] = (sample, sample_basename)
+
+    # Samples are simulated on the CPU workers while the next ones are generated; repairs (which need
+    # the model again) follow once generation is done
+    with EvalPipeline(EVAL_WORKERS, max_queued=EVAL_QUEUE_SIZE, work_root=EVAL_WORK_ROOT,
+                      in_process=EVAL_IN_PROCESS) as eval_pipeline:
+        for sample_index in manifest.indices("generated"): # Generated before an interruption
+            queue_for_evaluation(sample_index)
+
+        print(f"Generating Verilog using {MODEL_NAME_OR_PATH}...")
+        uninstrumented_generate_fn = generate_fn
+        generate_fn, generation_calls = collect_generation_metrics(generate_fn)
+        generate_samples_fn, _ = collect_generation_metrics(generate_samples_fn, generation_calls)
+        if EXPERIMENT_MODE == "partial_completion":
+            # Only the masked lines are generated; each sample gets its own seed
+            for sample_index in manifest.indices("pending"):
+                sample_seed = SAMPLING_SEED + sample_index if SAMPLING_SEED is not None else None
+                calls_before = len(generation_calls)
+                with eval_pipeline.generating():
+                    if GENERATION_BACKEND == "replay" and not GENERATION_SERVER_URL:
+                        # Replayed partial-completion outputs are already complete modules
+                        completed_code = generate_fn(model, tokenizer, masked_code_content, seed=sample_seed,
+                                                     temperature=TEMPERATURE, constrain_verilog2001=CONSTRAIN_VERILOG2001)
+                    else:
+                        completed_code, _ = generate_masked_infills(
+                            model, tokenizer, masked_code_content, generate_fn, mask_token=DEFAULT_MASK_TOKEN,
+                            max_new_tokens_per_mask=max_new_tokens, use_fim=USE_FIM_TOKENS, seed=sample_seed,
+                            temperature=TEMPERATURE, constrain_verilog2001=CONSTRAIN_VERILOG2001
+                        )
+                persist_generated_sample(manifest, run_basename, results_module_dir, sample_index, completed_code,
+                                         sample_seed, generation_calls[calls_before:])
+                queue_for_evaluation(sample_index)
+        else:
+            pending = manifest.indices("pending")
+            if NUM_SAMPLES > 1:
+                # Chunks of about one sample per worker: the workers simulate a chunk while the next one
+                # is generated. Sample i is drawn with SAMPLING_SEED + i whatever chunk it is in, so chunking
+                # and resuming do not change the samples.
+                for chunk in consecutive_chunks(pending, eval_pipeline.num_workers):
+                    calls_before = len(generation_calls)
+                    with eval_pipeline.generating():
+                        samples = generate_samples_fn(
+                            model, tokenizer, prompt_text_for_llm, len(chunk), max_new_tokens=max_new_tokens,
+                            seed=SAMPLING_SEED + chunk[0] if SAMPLING_SEED is not None else None,
+                            shared_prefix=shared_prefix, temperature=TEMPERATURE,
+                            constrain_verilog2001=CONSTRAIN_VERILOG2001
+                        )
+                    for sample_index, sample in zip(chunk, samples):
+                        persist_generated_sample(manifest, run_basename, results_module_dir, sample_index,
+                                                 sample["output"], sample["seed"], generation_calls[calls_before:])
+                        queue_for_evaluation(sample_index)
+            elif pending: # A single generation
+                with eval_pipeline.generating():
+                    raw_llm_output = generate_fn(model, tokenizer, prompt_text_for_llm, max_new_tokens=max_new_tokens,
+                                                 seed=SAMPLING_SEED, shared_prefix=shared_prefix,
+                                                 temperature=TEMPERATURE, constrain_verilog2001=CONSTRAIN_VERILOG2001,
+                                                 keep_kv_cache=REPAIR_ROUNDS > 0)
+                persist_generated_sample(manifest, run_basename, results_module_dir, pending[0], raw_llm_output,
+                                         SAMPLING_SEED, list(generation_calls))
+                queue_for_evaluation(pending[0])
+
+        verdicts = eval_pipeline.finish()
+        pipeline_stats = eval_pipeline.stats()
+
+    if verdicts:
+        print(f"\nEvaluated {len(verdicts)} sample(s) with {pipeline_stats['num_workers']} worker(s) "
+              f"(generation busy {pipeline_stats['generation_utilization']:.0%}, "
+              f"simulation busy {pipeline_stats['eval_utilization']:.0%} of {pipeline_stats['wall_seconds']:.1f}s).")
+        write_metrics_record(os.path.join(results_module_dir, f"{run_basename}_eval_summary.json"), {
+            "module": MODULE_NAME, "model": MODEL_NAME_OR_PATH, "mode": EXPERIMENT_MODE, "run": run_basename,
+            **summarize_verdicts(list(verdicts.values()), wall_seconds=pipeline_stats["wall_seconds"]),
+            "pipeline": pipeline_stats, "verdicts": list(verdicts.values()),
+        })
+    for sample_index, (sample, sample_basename) in candidates.items():
+        verdict = verdicts[sample_index]
+        print(format_verdict(verdict))
+        passed = verdict["passed"]
+        # Compiler feedback can only fix candidates that did not compile, not functional failures
+        if (not passed and REPAIR_ROUNDS > 0 and EXPERIMENT_MODE == "full_completion"
+                and verdict["status"] == "compile_error"):
+            compile_errors = verdict["compile_errors"][:REPAIR_MAX_ERROR_LINES]
+            if compile_errors:
+                passed, repair_rounds = repair_candidate(
+                    generate_fn, generation_calls, model, tokenizer, messages, sample, compile_errors,
+                    max_new_tokens, sample_basename, generated_rtl_module_dir, results_module_dir
+                )
+                write_metrics_record(os.path.join(results_module_dir, f"{sample_basename}_repair.json"), {
+                    "module": MODULE_NAME, "model": MODEL_NAME_OR_PATH, "run": run_basename,
+                    "sample_index": sample["sample_index"], "seed": sample["seed"], "passed": passed,
+                    "rounds": repair_rounds,
+                })
+        manifest.mark(sample_index, "evaluated", passed=passed, eval_status=verdict["status"])
+        if passed:
+            num_passed += 1
+
+    if NUM_SAMPLES > 1:
+        print(f"SUMMARY: {num_passed}/{NUM_SAMPLES} samples PASSED for {MODULE_NAME} ({EXPERIMENT_MODE})")
+
+    if COMPILE_UPLIFT_SAMPLES > 0 and EXPERIMENT_MODE == "full_completion":
+        # Imported here: the logits processor needs transformers, which the replay/openai backends do not
+        from verilog_constraints import compile_pass_uplift
+        uplift_report = compile_pass_uplift(
+            uninstrumented_generate_fn, model, tokenizer, prompt_text_for_llm, cleanup_generated_verilog,
+            num_samples=COMPILE_UPLIFT_SAMPLES, seed=SAMPLING_SEED or 0, max_new_tokens=max_new_tokens,
+            temperature=TEMPERATURE
+        )
+        write_metrics_record(os.path.join(results_module_dir, f"{run_basename}_verilog2001_uplift.json"),
+                             {"module": MODULE_NAME, "model": MODEL_NAME_OR_PATH, "run": run_basename, **uplift_report})
+    return {"run": run_basename, "num_passed": num_passed, "num_samples": NUM_SAMPLES}
+
+def extract_compile_errors(log_filepath, max_lines=None):
+    """
+    Returns at most `max_lines` (default REPAIR_MAX_ERROR_LINES) iverilog error lines of an eval log.
+    Warnings are not included, so a non-empty list means the candidate did not compile.
+    """
+    return parse_compile_errors(log_filepath)[:max_lines or REPAIR_MAX_ERROR_LINES]
+
+def repair_candidate(generate_fn, generation_calls, model, tokenizer, messages, sample, compile_errors,
+                     max_new_tokens, sample_basename, generated_rtl_module_dir, results_module_dir):
+    """
+    Feeds the iverilog errors of a failed sample back to the model as a follow-up chat turn and
+    evaluates the new answer, for up to REPAIR_ROUNDS rounds or until one passes. Each round keeps
+    its KV cache (keep_kv_cache=True) for the next one. Returns (passed, per-round records).
+    """
+    conversation = list(messages)
+    raw_llm_output = sample["output"]
+    passed = False
+    rounds = []
+    for round_index in range(1, REPAIR_ROUNDS + 1):
+        conversation += [
+            {"role": "assistant", "content": raw_llm_output},
+            {"role": "user", "content": (
+                "The Verilog code above does not compile with Icarus Verilog (iverilog -g2001):\n"
+                + "\n".join(compile_errors)
+                + "\nFix these errors and provide the complete corrected Verilog module in a single code block."
+            )},
+        ]
+        prompt_text = tokenizer.apply_chat_template(conversation, tokenize=False, add_generation_prompt=True)
+        print(f"\n=== Repair round {round_index}/{REPAIR_ROUNDS} ({len(compile_errors)} compile error line(s)) ===")
+        raw_llm_output = generate_fn(model, tokenizer, prompt_text, max_new_tokens=max_new_tokens, seed=sample["seed"],
+                                     temperature=TEMPERATURE, constrain_verilog2001=CONSTRAIN_VERILOG2001,
+                                     keep_kv_cache=True)
+        round_basename = f"{sample_basename}_repair{round_index}"
+        log_filepath = os.path.join(results_module_dir, f"{round_basename}_eval.log")
+        passed = save_and_evaluate_candidate(raw_llm_output, os.path.join(generated_rtl_module_dir, f"{round_basename}.v"),
+                                             log_filepath)
+        rounds.append({"round": round_index, "passed": passed, "compile_errors": compile_errors,
+                       "generation": generation_calls[-1]})
+        compile_errors = [] if passed else extract_compile_errors(log_filepath)
+        if passed or not compile_errors:
+            break # Passed, or compiles but fails simulation, which compiler feedback cannot fix
+    print(f"INFO [repair]: {'PASSED' if passed else 'FAILED'} after {len(rounds)} repair round(s).")
+    return passed, rounds
+
+def consecutive_chunks(indices, chunk_size):
+    """Splits sorted sample indices into runs of consecutive indices of at most `chunk_size`."""
+    chunks = []
+    for index in indices:
+        if chunks and len(chunks[-1]) < chunk_size and index == chunks[-1][-1] + 1:
+            chunks[-1].append(index)
+        else:
+            chunks.append([index])
+    return chunks
+
+def persist_generated_sample(manifest, run_basename, results_module_dir, sample_index, raw_llm_output, seed,
+                             generation_calls):
+    """Atomically saves one raw output as soon as it is generated and marks the sample generated in the manifest."""
+    sample_basename = f"{run_basename}_sample{sample_index}_seed{seed}" if NUM_SAMPLES > 1 else run_basename
+    raw_output_path = os.path.join(results_module_dir, f"{sample_basename}_raw_output.txt")
+    write_atomic(raw_output_path, raw_llm_output)
+    manifest.mark(sample_index, "generated", seed=seed, sample_basename=sample_basename,
+                  raw_output_path=raw_output_path, generation_calls=generation_calls)
+
+def collect_generation_metrics(generate_fn, records=None):
+    """
+    Wraps a generate_verilog-style function so every call also records its throughput
+    metrics. Returns (wrapped function, list the metrics records are appended to), which is
+    `records` when given, so several functions can share one list.
+    """
+    records = [] if records is None else records
+    def generate_and_record(*args, **kwargs):
+        output, metrics = generate_fn(*args, return_metrics=True, **kwargs)
+        records.append(metrics)
+        return output
+    return generate_and_record, records
+
+def save_and_evaluate_candidate(raw_llm_output, output_v_filepath, log_filepath, cleanup=True):
+    """Cleans one raw LLM output, saves it as RTL and runs evaluate_rtl.sh on it. Returns True on PASS."""
+    save_candidate(raw_llm_output, output_v_filepath, cleanup=cleanup)
+    return evaluate_candidate(output_v_filepath, log_filepath)
+
+def save_candidate(raw_llm_output, output_v_filepath, cleanup=True):
+    """Cleans one raw LLM output (unless `cleanup` is False) and saves it as RTL."""
     print(f"\n--- Raw LLM Output (first 1000 chars) ---\n{raw_llm_output[:1000]}\n--------------------------------------\n")
 
-    generated_verilog_code = cleanup_generated_verilog(raw_llm_output)
+    generated_verilog_code = cleanup_generated_verilog(raw_llm_output) if cleanup else raw_llm_output
 
     # Ensure the generated code at least starts with "module" if it's not empty
     if generated_verilog_code and not generated_verilog_code.strip().lower().startswith("module"):
@@ -175,6 +607,13 @@ def main():
         f.write(generated_verilog_code)
     print(f"Cleaned and saved generated RTL to: {output_v_filepath}")
 
+def evaluate_candidate(output_v_filepath, log_filepath, testbench_script=None, dut_env_var=None):
+    """
+    Runs evaluate_rtl.sh on a saved RTL file. Returns True on PASS. The testbench defaults
+    to the one of MODULE_NAME.
+    """
+    testbench_script = testbench_script or TESTBENCH_SCRIPT_NAME
+    dut_env_var = dut_env_var or DUT_ENV_VAR_NAME
     print(f"Starting evaluation for {output_v_filepath}...")
     eval_script_path = os.path.join(os.path.dirname(__file__), "evaluate_rtl.sh")
     
@@ -184,9 +623,9 @@ def main():
     abs_output_v_filepath = os.path.abspath(output_v_filepath)
     abs_log_filepath = os.path.abspath(log_filepath)
 
-    print(f"Calling: {eval_script_path} {abs_output_v_filepath} {TESTBENCH_SCRIPT_NAME} {DUT_ENV_VAR_NAME} {abs_log_filepath}")
+    print(f"Calling: {eval_script_path} {abs_output_v_filepath} {testbench_script} {dut_env_var} {abs_log_filepath}")
     eval_process = subprocess.run(
-        [eval_script_path, abs_output_v_filepath, TESTBENCH_SCRIPT_NAME, DUT_ENV_VAR_NAME, abs_log_filepath],
+        [eval_script_path, abs_output_v_filepath, testbench_script, dut_env_var, abs_log_filepath],
         capture_output=True, text=True
     )
 
@@ -197,10 +636,11 @@ def main():
     print("------------------------------\n")
 
     if eval_process.returncode == 0:
-        print(f"SUCCESS: Evaluation PASSED for {output_v_filename}")
+        print(f"SUCCESS: Evaluation PASSED for {os.path.basename(output_v_filepath)}")
     else:
-        print(f"FAILURE: Evaluation FAILED for {output_v_filename}")
+        print(f"FAILURE: Evaluation FAILED for {os.path.basename(output_v_filepath)}")
         print(f"         MyHDL/Icarus logs should be in: {abs_log_filepath}")
+    return eval_process.returncode == 0
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
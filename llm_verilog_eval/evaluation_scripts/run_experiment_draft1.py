@@ -235,8 +235,17 @@ def main():
         prompt_text_for_llm = system_instruction + "\n\n" + user_prompt_content # Basic fallback
 
 
+    # The rendered prompt up to the first mask (partial) or up to the module header (full) is
+    # shared by every prompt of this mode, so its KV cache can be reused by generate_verilog
+    if EXPERIMENT_MODE == "partial_completion":
+        prefix_marker = DEFAULT_MASK_TOKEN
+    else:
+        prefix_marker = prompt_header_and_comment
+    marker_idx = prompt_text_for_llm.find(prefix_marker)
+    shared_prefix = prompt_text_for_llm[:marker_idx] if marker_idx > 0 else None
+
     print(f"Generating Verilog using {MODEL_NAME_OR_PATH}...")
-    raw_llm_output = generate_verilog(model, tokenizer, prompt_text_for_llm)
+    raw_llm_output = generate_verilog(model, tokenizer, prompt_text_for_llm, shared_prefix=shared_prefix)
     
     print(f"\n--- Raw LLM Output (first 1000 chars) ---\n{raw_llm_output[:1000]}\n--------------------------------------\n")
 
@@ -0,0 +1,137 @@
+# llm_verilog_eval/evaluation_scripts/run_matrix.py
+"""
+Runs a declarative experiment matrix (models x modules x modes x samples x temperatures)
+with run_experiment.py, all in one process.
+
+Usage:
+    python run_matrix.py example_matrix.yaml [--dry-run] [--summary matrix_summary.json]
+
+Matrix file (YAML or JSON); every axis is optional and defaults to run_experiment's constant:
+    models:                       # MODEL_NAME_OR_PATH; an entry may also be {name: ..., settings: {...}}
+      - /data/genai/models/Qwen2.5-Coder-32B-Instruct
+      - {name: /data/genai/models/gemma-3-27b-it, settings: {QUANTIZATION: 8bit}}
+    modules: [simple_and, i2c_init]                  # MODULE_NAME
+    modes: [full_completion, partial_completion]     # EXPERIMENT_MODE
+    samples: [1, 8]                                  # NUM_SAMPLES
+    temperatures: [0.2, 0.7]                         # TEMPERATURE
+    settings: {GENERATION_BACKEND: hf, SAMPLING_SEED: 0}   # Other run_experiment constants, for every job
+
+Jobs run model-major: all jobs of a model run back to back, so each checkpoint is loaded once
+(later jobs are served from llm_interface's model cache) and freed before the next model loads.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+import traceback
+from datetime import datetime
+
+import yaml
+
+import run_experiment
+
+# Matrix axis -> run_experiment setting
+MATRIX_AXES = {
+    "models": "MODEL_NAME_OR_PATH",
+    "modules": "MODULE_NAME",
+    "modes": "EXPERIMENT_MODE",
+    "samples": "NUM_SAMPLES",
+    "temperatures": "TEMPERATURE",
+}
+
+def load_matrix(path):
+    with open(path, 'r') as f:
+        return json.load(f) if path.endswith(".json") else yaml.safe_load(f)
+
+def expand_matrix(matrix):
+    """Expands a matrix into jobs, model-major. Each job is {"settings": {...}, "tag": run tag}."""
+    unknown_keys = set(matrix) - set(MATRIX_AXES) - {"settings"}
+    if unknown_keys:
+        raise ValueError(f"Unknown matrix keys {sorted(unknown_keys)}, expected {sorted(MATRIX_AXES)} and 'settings'")
+    models = [m if isinstance(m, dict) else {"name": m} for m in matrix.get("models") or [run_experiment.MODEL_NAME_OR_PATH]]
+    axes = [matrix.get(axis) or [getattr(run_experiment, setting)]
+            for axis, setting in MATRIX_AXES.items() if axis != "models"]
+
+    jobs = []
+    for model in models:
+        for module, mode, num_samples, temperature in itertools.product(*axes):
+            settings = {**(matrix.get("settings") or {}), **model.get("settings", {}),
+                        "MODEL_NAME_OR_PATH": model["name"], "MODULE_NAME": module, "EXPERIMENT_MODE": mode,
+                        "NUM_SAMPLES": num_samples, "TEMPERATURE": temperature}
+            jobs.append({"settings": settings, "tag": f"t{temperature}_n{num_samples}"})
+    return jobs
+
+def validate_jobs(jobs):
+    for job in jobs:
+        settings = job["settings"]
+        unknown = [name for name in settings if not name.isupper() or not hasattr(run_experiment, name)]
+        if unknown:
+            raise ValueError(f"Unknown run_experiment settings {unknown}")
+        if settings["MODULE_NAME"] not in run_experiment.MODULE_CONFIGS:
+            raise ValueError(f"Module '{settings['MODULE_NAME']}' is not defined in MODULE_CONFIGS")
+
+def _free_loaded_models():
+    # Only the HF backend imports llm_interface; importing it here would load torch for nothing
+    llm_interface = sys.modules.get("llm_interface")
+    if llm_interface is not None:
+        llm_interface.clear_model_cache()
+
+def run_jobs(jobs):
+    """
+    Runs the jobs in order and returns one result dict per job. Every job starts from run_experiment's
+    default settings. A failing job does not stop the matrix.
+    """
+    results = []
+    previous_model = None
+    for job_index, job in enumerate(jobs):
+        settings = job["settings"]
+        if previous_model is not None and settings["MODEL_NAME_OR_PATH"] != previous_model:
+            _free_loaded_models()
+        previous_model = settings["MODEL_NAME_OR_PATH"]
+        print(f"\n########## Job {job_index + 1}/{len(jobs)}: {settings['MODEL_NAME_OR_PATH']} | {settings['MODULE_NAME']} | "
+              f"{settings['EXPERIMENT_MODE']} | samples={settings['NUM_SAMPLES']} | temperature={settings['TEMPERATURE']}")
+        result = {"job_index": job_index, "settings": settings, "status": "done"}
+        start = time.perf_counter()
+        try:
+            run_experiment.configure(RUN_TAG=job["tag"], **settings)
+            result.update(run_experiment.main() or {})
+        except SystemExit as e: # run_experiment exits on configuration and loading errors
+            result.update(status="failed", error=f"run_experiment exited with code {e.code}")
+        except Exception as e:
+            traceback.print_exc()
+            result.update(status="failed", error=f"{type(e).__name__}: {e}")
+        result["seconds"] = time.perf_counter() - start
+        results.append(result)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an experiment matrix (models x modules x modes x samples x temperatures).")
+    parser.add_argument("matrix", help="YAML or JSON matrix file")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the expanded jobs")
+    parser.add_argument("--summary", default=None, help="Default: matrix_summary_<timestamp>.json in the current directory")
+    args = parser.parse_args()
+
+    jobs = expand_matrix(load_matrix(args.matrix))
+    validate_jobs(jobs)
+    num_models = len({job["settings"]["MODEL_NAME_OR_PATH"] for job in jobs})
+    print(f"INFO [run_matrix]: {len(jobs)} job(s) over {num_models} model(s), run model-major.")
+    if args.dry_run:
+        for job_index, job in enumerate(jobs):
+            print(f"  {job_index + 1:>3}. {json.dumps(job['settings'])}")
+        return
+
+    results = run_jobs(jobs)
+    summary_path = args.summary or f"matrix_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(summary_path, 'w') as f:
+        json.dump({"matrix": os.path.abspath(args.matrix), "jobs": results}, f, indent=2)
+    num_failed = sum(r["status"] == "failed" for r in results)
+    print(f"SUMMARY: {len(results) - num_failed}/{len(results)} jobs completed"
+          f"{f', {num_failed} failed' if num_failed else ''}. Results written to {summary_path}")
+    for r in results:
+        if r["status"] == "done":
+            print(f"  {r['run']}: {r['num_passed']}/{r['num_samples']} samples PASSED")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# llm_verilog_eval/evaluation_scripts/testbench_api.py
+"""
+In-process evaluation API, replacing evaluate_rtl.sh.
+
+    verdict = evaluate("generated_rtl/i2c_init/sample.v", "i2c_init", "/tmp/eval_work")
+
+imports the module's MyHDL testbench (tb/test_<module>.py) directly, runs its iverilog build
+through subprocess with captured output and simulates its bench() in the calling process. This
+saves the bash and python3 launches of evaluate_rtl.sh, and MyHDL is imported once per process
+instead of once per candidate. The verdict is the dict eval_pool.py reports:
+    {"rtl", "log", "status": "pass" | "fail" | "compile_error" | "error", "passed",
+     "returncode" (of the build), "compile_errors", "output"}
+
+The testbenches read the DUT path and BUILD_DIR from the environment and their sources relative
+to tb/ when they are imported, and MyHDL runs one co-simulation per process; the output of the
+simulator goes to the log file descriptor-wide. Call this from a single-threaded worker process
+(as eval_pool.py's workers do), not from a process that is generating at the same time.
+"""
+import contextlib
+import importlib.util
+import os
+import re
+import subprocess
+import sys
+import time
+import traceback
+
+TB_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "tb"))
+# Same default as evaluate_rtl.sh, used when IVERILOG_VPI_MODULE_PATH is not set
+DEFAULT_MYHDL_VPI_PATH = "/data/genai/kmcho/custom_env/myhdl_customEnv_install/myhdl/cosimulation/icarus/"
+
+# iverilog errors look like "<path>.v:<line>: syntax error" / "<path>.v:<line>: error: ..." (or "sorry: ..."
+# for unsupported constructs); "<path>.v:<line>: warning: ..." lines and notes are not errors
+COMPILE_ERROR_RE = re.compile(r"^(\S+\.v):(\d+): ((?:syntax error|error:|sorry:).*)$")
+
+def parse_compile_error_lines(lines):
+    """Returns the iverilog error lines among `lines`, with paths shortened to file names."""
+    errors = []
+    for line in lines:
+        match = COMPILE_ERROR_RE.match(line.strip())
+        if match:
+            errors.append(f"{os.path.basename(match.group(1))}:{match.group(2)}: {match.group(3)}")
+    return errors
+
+def parse_compile_errors(log_filepath):
+    """Returns the iverilog error lines of an eval log (paths shortened to file names), [] if it compiled."""
+    if not os.path.exists(log_filepath):
+        return []
+    with open(log_filepath, 'r', errors='replace') as f:
+        return parse_compile_error_lines(f)
+
+def make_verdict(rtl_path, log_path, status, returncode=None, compile_errors=None, output=""):
+    return {"rtl": os.path.abspath(rtl_path), "log": os.path.abspath(log_path), "status": status,
+            "passed": status == "pass", "returncode": returncode, "compile_errors": compile_errors or [],
+            "output": output}
+
+@contextlib.contextmanager
+def _testbench_environment(env, log_file):
+    """Runs the block in tb/ with `env` set and stdout/stderr (also of child processes) in `log_file`."""
+    saved_env = {name: os.environ.get(name) for name in env}
+    saved_cwd = os.getcwd()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_fds = (os.dup(1), os.dup(2))
+    os.environ.update(env)
+    os.chdir(TB_DIR)
+    sys.path.insert(0, TB_DIR) # Testbench helpers (axis_ep, i2c, wb, axil)
+    os.dup2(log_file.fileno(), 1)
+    os.dup2(log_file.fileno(), 2)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd, saved_fd in zip((1, 2), saved_fds):
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)
+        sys.path.remove(TB_DIR)
+        os.chdir(saved_cwd)
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def _load_testbench(testbench_script):
+    # Executed anew for every candidate: the module computes its sources and build_cmd on import
+    name = os.path.splitext(testbench_script)[0]
+    spec = importlib.util.spec_from_file_location(f"_testbench_{name}", os.path.join(TB_DIR, testbench_script))
+    testbench = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(testbench)
+    return testbench
+
+def run_testbench(dut_path, testbench_script, dut_env_var, workdir, log_path):
+    """
+    Builds and simulates `dut_path` with tb/`testbench_script`, which reads the DUT path from
+    `dut_env_var`. Build outputs go to `workdir`, all output to `log_path`. Returns the verdict.
+    """
+    dut_path = os.path.abspath(dut_path)
+    env = {dut_env_var: dut_path, "BUILD_DIR": os.path.abspath(workdir)}
+    if not os.environ.get("IVERILOG_VPI_MODULE_PATH"):
+        if not os.path.isdir(DEFAULT_MYHDL_VPI_PATH):
+            return make_verdict(dut_path, log_path, "error", output=(
+                f"IVERILOG_VPI_MODULE_PATH is not set and the default VPI path '{DEFAULT_MYHDL_VPI_PATH}' does not exist"))
+        env["IVERILOG_VPI_MODULE_PATH"] = DEFAULT_MYHDL_VPI_PATH
+    if not os.path.exists(dut_path):
+        return make_verdict(dut_path, log_path, "error", output=f"Generated RTL file not found at '{dut_path}'")
+    os.makedirs(workdir, exist_ok=True)
+    os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+
+    with open(log_path, 'w') as log_file, _testbench_environment(env, log_file):
+        try:
+            testbench = _load_testbench(testbench_script)
+            from myhdl import Simulation
+        except BaseException as e: # SystemExit included: the testbenches exit when the DUT file is missing
+            traceback.print_exc()
+            return make_verdict(dut_path, log_path, "error", output=f"Loading {testbench_script} failed: {e!r}")
+
+        build = subprocess.run(testbench.build_cmd, shell=True, capture_output=True, text=True)
+        print(f"Build command: {testbench.build_cmd}\n{build.stdout}{build.stderr}", flush=True)
+        if build.returncode != 0:
+            compile_errors = parse_compile_error_lines((build.stdout + build.stderr).splitlines())
+            return make_verdict(dut_path, log_path, "compile_error", build.returncode, compile_errors)
+
+        # bench() runs build_cmd itself; the simulation binary is already built
+        testbench.build_cmd = "true"
+        try:
+            Simulation(testbench.bench()).run()
+            status = "pass"
+        except Exception:
+            traceback.print_exc()
+            status = "fail"
+        print(f"--- Testbench {testbench_script}: {'PASSED' if status == 'pass' else 'FAILED'} ---", flush=True)
+    return make_verdict(dut_path, log_path, status, build.returncode)
+
+def evaluate(dut_path, module, workdir, log_path=None):
+    """
+    Evaluates `dut_path` against the testbench of `module` (a MODULE_CONFIGS name of
+    run_experiment.py), building in `workdir`. The log defaults to <workdir>/<dut name>_eval.log.
+    Returns the verdict dict, including its "seconds".
+    """
+    # Imported here: run_experiment imports eval_pool, which imports this module
+    from run_experiment import MODULE_CONFIGS
+    start = time.perf_counter()
+    module_config = MODULE_CONFIGS[module]
+    log_path = log_path or os.path.join(workdir, f"{os.path.splitext(os.path.basename(dut_path))[0]}_eval.log")
+    verdict = run_testbench(dut_path, module_config["testbench_script"], module_config["dut_env_var"], workdir, log_path)
+    verdict["seconds"] = time.perf_counter() - start
+    return verdict
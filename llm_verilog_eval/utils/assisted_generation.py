@@ -0,0 +1,61 @@
+# llm_verilog_eval/utils/assisted_generation.py
+"""
+Helpers for speculative (assisted) decoding, where a small draft model such as
+Qwen3-0.6B or Qwen2.5-Coder-7B proposes tokens that the large target model verifies.
+"""
+
+def check_tokenizers_compatible(target_tokenizer, draft_tokenizer):
+    """
+    Assisted generation passes draft token ids straight to the target model, so both
+    tokenizers must map every token to the same id. Raises ValueError otherwise.
+    """
+    target_vocab = target_tokenizer.get_vocab()
+    draft_vocab = draft_tokenizer.get_vocab()
+    if target_vocab == draft_vocab:
+        return
+    mismatched = [tok for tok, idx in draft_vocab.items() if target_vocab.get(tok) != idx]
+    raise ValueError(
+        f"Draft tokenizer is not compatible with the target tokenizer: {len(mismatched)} of "
+        f"{len(draft_vocab)} draft tokens map to different ids (vocab sizes {len(target_vocab)} "
+        f"vs {len(draft_vocab)}). Use a draft model from the same tokenizer family."
+    )
+
+class ForwardCallCounter:
+    """
+    Context manager counting forward passes of a model while it is active, used to measure
+    how many target verification steps and draft proposal steps an assisted generation took.
+    """
+    def __init__(self, model):
+        self.model = model
+        self.calls = 0
+        self._handle = None
+
+    def _hook(self, module, inputs, output):
+        self.calls += 1
+
+    def __enter__(self):
+        self._handle = self.model.register_forward_hook(self._hook)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._handle.remove()
+        return False
+
+def assisted_generation_stats(new_tokens, target_calls, draft_calls):
+    """
+    Estimates speculative decoding efficiency from forward-pass counts.
+
+    Every target forward pass verifies the drafted tokens and contributes one token of its
+    own (the correction or bonus token); the rest of the output consists of accepted draft
+    tokens. Returns a dict with the acceptance rate (accepted / drafted) and the average
+    number of tokens produced per target forward pass.
+    """
+    accepted = max(new_tokens - target_calls, 0)
+    return {
+        "new_tokens": new_tokens,
+        "target_forward_passes": target_calls,
+        "draft_forward_passes": draft_calls,
+        "accepted_draft_tokens": accepted,
+        "acceptance_rate": accepted / draft_calls if draft_calls else 0.0,
+        "tokens_per_target_pass": new_tokens / target_calls if target_calls else 0.0,
+    }
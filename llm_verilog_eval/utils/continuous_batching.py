@@ -0,0 +1,373 @@
+# llm_verilog_eval/utils/continuous_batching.py
+"""
+Continuous-batching scheduler for one loaded model.
+
+Requests from many concurrent experiment workers are queued and decoded together in one
+batch. Unlike a static `model.generate` batch, which runs until its longest sequence ends,
+the scheduler decodes one token per step for every active sequence, retires sequences as
+soon as they finish (EOS, `max_new_tokens`, or a completed module) and admits queued
+requests into the freed slots at the next step. Text is streamed back per request.
+
+The batched KV cache is a left-padded DynamicCache: a newly admitted prompt is prefilled
+on its own and its cache rows are padded and concatenated to the running batch; finished
+rows are dropped. This assumes full-attention decoder layers (no sliding-window caches).
+"""
+import queue
+import random
+import threading
+import time
+import torch
+from transformers import DynamicCache
+from verilog_stopping import VerilogCompletionTracker
+from generation_metrics import GenerationMetrics
+
+DEFAULT_MAX_BATCH_SIZE = 16
+
+# Options of llm_interface.generate_verilog the scheduler does not implement, with their "off" values.
+# Other values are ignored with a warning and listed under "ignored_options" in the metrics record.
+UNSUPPORTED_OPTION_DEFAULTS = {
+    "shared_prefix": None,
+    "use_generation_cache": True,
+    "assistant_model": None,
+    "constrain_verilog2001": False,
+    "keep_kv_cache": False,
+}
+
+def _ignored_options(options):
+    """Returns the names of the `options` that are set but not implemented; raises TypeError for unknown ones."""
+    unknown = sorted(set(options) - set(UNSUPPORTED_OPTION_DEFAULTS))
+    if unknown:
+        raise TypeError(f"Unexpected generation option(s) {unknown}")
+    ignored = sorted(name for name, value in options.items() if value != UNSUPPORTED_OPTION_DEFAULTS[name])
+    if ignored:
+        print(f"Warning [continuous_batching]: Ignoring generation option(s) {ignored}, "
+              "which the continuous-batching scheduler does not implement.")
+    return ignored
+
+class GenerationRequest:
+    """One queued generation. Iterate `stream()` for text chunks or block on `result()`."""
+    def __init__(self, prompt_text, max_new_tokens=8192, temperature=0.7, top_p=0.95, seed=None,
+                 stop_on_module_complete=True):
+        self.prompt_text = prompt_text
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.seed = seed
+        self.tracker = VerilogCompletionTracker() if stop_on_module_complete else None
+        self.metrics = GenerationMetrics(None, reset_peak_memory=False) # start_time = submission time
+        self.ignored_options = []
+        self.generator = None
+        self.num_generated = 0
+        self.stopped_early = False
+        self.output = ""
+        self.error = None
+        self._token_cache = [] # Tokens of the current, not yet newline-terminated text
+        self._emitted_len = 0
+        self._line_buffer = ""
+        self._chunks = queue.Queue()
+        self._done = threading.Event()
+
+    def stream(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                break
+            yield chunk
+        if self.error is not None:
+            raise self.error
+
+    def result(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError("Generation request did not finish in time")
+        if self.error is not None:
+            raise self.error
+        return self.output
+
+    def _emit_text(self, tokenizer, final=False):
+        text = tokenizer.decode(self._token_cache, skip_special_tokens=True)
+        if text.endswith("\ufffd") and not final:
+            return # Incomplete multi-byte character, wait for the next token
+        chunk = text[self._emitted_len:]
+        if text.endswith("\n"):
+            self._token_cache = []
+            self._emitted_len = 0
+        else:
+            self._emitted_len = len(text)
+        if not chunk:
+            return
+        self.output += chunk
+        self._chunks.put(chunk)
+        if self.tracker is not None:
+            *lines, self._line_buffer = (self._line_buffer + chunk).split("\n")
+            for line in lines:
+                self.tracker.feed_line(line)
+            if self.tracker.pending_line_closes_fence(self._line_buffer):
+                self.tracker.complete = True
+
+    def _finish(self, tokenizer):
+        self._emit_text(tokenizer, final=True)
+        self.metrics.end_time = time.perf_counter()
+        self.metrics.output_tokens = self.num_generated
+        self._chunks.put(None)
+        self._done.set()
+
+    def _fail(self, error):
+        self.error = error
+        self._chunks.put(None)
+        self._done.set()
+
+def _cache_to_tensors(cache):
+    if hasattr(cache, "layers"): # transformers >= 4.56
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    return list(zip(cache.key_cache, cache.value_cache))
+
+def _cache_from_tensors(layers):
+    cache = DynamicCache()
+    for layer_idx, (keys, values) in enumerate(layers):
+        cache.update(keys, values, layer_idx)
+    return cache
+
+def _left_pad(tensor, length, dim):
+    missing = length - tensor.shape[dim]
+    if missing <= 0:
+        return tensor
+    pad_shape = list(tensor.shape)
+    pad_shape[dim] = missing
+    return torch.cat([tensor.new_zeros(pad_shape), tensor], dim=dim)
+
+class ContinuousBatchingScheduler:
+    """
+    Serves generation requests for `model` from a background thread with continuous batching.
+    Use `submit` for streaming, or `generate_verilog` / `generate_verilog_samples` as drop-in
+    `generate_fn` / `generate_samples_fn`.
+    """
+    def __init__(self, model, tokenizer, max_batch_size=DEFAULT_MAX_BATCH_SIZE):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        eos_token_ids = getattr(getattr(model, "generation_config", None), "eos_token_id", None)
+        eos_token_ids = eos_token_ids if isinstance(eos_token_ids, list) else [eos_token_ids]
+        self.eos_token_ids = {t for t in eos_token_ids + [tokenizer.eos_token_id] if t is not None}
+        self._pending = queue.Queue()
+        self._active = [] # Requests in the order of the batch rows
+        self._cache = None
+        self._attention_mask = None
+        self._next_tokens = None
+        self._closing = threading.Event()
+        # Requests overlap, so their peak memory is the scheduler's: reset once, not per request
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt_text, max_new_tokens=8192, temperature=0.7, top_p=0.95, seed=None,
+               stop_on_module_complete=True):
+        if self._closing.is_set():
+            raise RuntimeError("Scheduler is closed")
+        request = GenerationRequest(prompt_text, max_new_tokens, temperature, top_p, seed, stop_on_module_complete)
+        self._pending.put(request)
+        return request
+
+    def close(self, wait=True):
+        """Stops accepting requests; queued and active requests still finish when `wait` is set."""
+        self._closing.set()
+        if wait:
+            self._thread.join()
+
+    def submit_samples(self, prompt_text, max_new_tokens=8192, temperature=0.7, top_p=0.95, num_samples=1,
+                       seed=None, stop_on_module_complete=True, **unsupported_options):
+        """
+        Queues `num_samples` sequences of one prompt and returns their requests without
+        waiting; `collect_samples` turns them into sample dicts. Options of the static path
+        (UNSUPPORTED_OPTION_DEFAULTS) are ignored with a warning.
+        """
+        ignored_options = _ignored_options(unsupported_options)
+        if num_samples > 1 and seed is None:
+            seed = random.randint(0, 2**31 - 1)
+        requests = [
+            self.submit(prompt_text, max_new_tokens, temperature, top_p,
+                        seed + i if seed is not None else None, stop_on_module_complete)
+            for i in range(num_samples)
+        ]
+        for request in requests:
+            request.ignored_options = ignored_options
+        return requests
+
+    def collect_samples(self, requests, return_metrics=False):
+        """Waits for the requests of `submit_samples`. Returns what generate_verilog_samples returns."""
+        outputs = [request.result() for request in requests]
+        first = requests[0]
+        num_samples = len(requests)
+
+        metrics = GenerationMetrics(None, reset_peak_memory=False)
+        metrics.start_time = min(r.metrics.start_time for r in requests)
+        metrics.end_time = max(r.metrics.end_time for r in requests)
+        first_token_times = [r.metrics.first_token_time for r in requests if r.metrics.first_token_time]
+        metrics.first_token_time = min(first_token_times) if first_token_times else None
+        metrics.prefill_seconds = max(r.metrics.prefill_seconds or 0.0 for r in requests)
+        metrics.input_tokens = first.metrics.input_tokens
+        metrics.output_tokens = sum(r.metrics.output_tokens for r in requests)
+        record = metrics.as_record(model=getattr(self.model, 'name_or_path', None), scheduler="continuous_batching",
+                                   max_new_tokens=first.max_new_tokens, temperature=first.temperature,
+                                   top_p=first.top_p, num_samples=num_samples, seed=first.seed)
+        if first.ignored_options:
+            record["ignored_options"] = first.ignored_options
+        samples = [{
+            "output": text,
+            "output_tokens": r.num_generated,
+            "tokens_saved": r.max_new_tokens - r.num_generated if r.stopped_early else 0,
+            "seed": r.seed,
+            "sample_index": i,
+        } for i, (text, r) in enumerate(zip(outputs, requests))]
+        return (samples, record) if return_metrics else samples
+
+    def generate_verilog(self, model, tokenizer, prompt_text, max_new_tokens=8192, temperature=0.7, top_p=0.95,
+                         seed=None, stop_on_module_complete=True, return_metrics=False, **unsupported_options):
+        """
+        Same contract as llm_interface.generate_verilog, but the sequence joins the shared
+        running batch. `model`/`tokenizer` must be the scheduler's own; options of the static
+        path (shared_prefix, constrain_verilog2001, ...) are ignored with a warning.
+        """
+        requests = self.submit_samples(prompt_text, max_new_tokens, temperature, top_p, 1, seed,
+                                       stop_on_module_complete, **unsupported_options)
+        samples, record = self.collect_samples(requests, return_metrics=True)
+        return (samples[0]["output"], record) if return_metrics else samples[0]["output"]
+
+    def generate_verilog_samples(self, model, tokenizer, prompt_text, num_samples, max_new_tokens=8192,
+                                 temperature=0.7, top_p=0.95, seed=None, stop_on_module_complete=True,
+                                 return_metrics=False, **unsupported_options):
+        """Same contract as llm_interface.generate_verilog_samples; sample i is sampled with seed + i."""
+        requests = self.submit_samples(prompt_text, max_new_tokens, temperature, top_p, num_samples, seed,
+                                       stop_on_module_complete, **unsupported_options)
+        return self.collect_samples(requests, return_metrics=return_metrics)
+
+    def _run(self):
+        with torch.inference_mode():
+            while True:
+                if not self._active:
+                    try:
+                        request = self._pending.get(timeout=0.1)
+                    except queue.Empty:
+                        if self._closing.is_set():
+                            return
+                        continue
+                    self._admit(request)
+                # Fill the slots freed by finished sequences before the next decode step
+                while len(self._active) < self.max_batch_size:
+                    try:
+                        self._admit(self._pending.get_nowait())
+                    except queue.Empty:
+                        break
+                if self._active:
+                    try:
+                        self._decode_step()
+                    except Exception as e:
+                        for request in self._active:
+                            request._fail(e)
+                        self._reset_batch()
+
+    def _reset_batch(self):
+        self._active = []
+        self._cache = self._attention_mask = self._next_tokens = None
+
+    def _admit(self, request):
+        try:
+            input_ids = self.tokenizer(request.prompt_text, return_tensors="pt").input_ids.to(self.model.device)
+            request.metrics.input_tokens = input_ids.shape[1]
+            prefill_start = time.perf_counter()
+            outputs = self.model(input_ids=input_ids, attention_mask=torch.ones_like(input_ids),
+                                 past_key_values=DynamicCache(), use_cache=True)
+            next_token = self._sample(request, outputs.logits[:, -1, :])
+            request.metrics.prefill_seconds = time.perf_counter() - prefill_start
+            if self._emit_token(request, next_token.item()):
+                return # Finished with its first token; never joins the batch
+            self._merge(request, outputs.past_key_values, torch.ones_like(input_ids), next_token)
+        except Exception as e:
+            request._fail(e)
+
+    def _merge(self, request, cache, attention_mask, next_token):
+        """Adds the prefilled rows of a new request to the running batch, left-padding the shorter side."""
+        if self._cache is None:
+            self._cache, self._attention_mask = cache, attention_mask
+            self._next_tokens = next_token.view(1, 1)
+        else:
+            length = max(self._attention_mask.shape[1], attention_mask.shape[1])
+            self._cache = _cache_from_tensors([
+                (torch.cat([_left_pad(k, length, 2), _left_pad(new_k, length, 2)], dim=0),
+                 torch.cat([_left_pad(v, length, 2), _left_pad(new_v, length, 2)], dim=0))
+                for (k, v), (new_k, new_v) in zip(_cache_to_tensors(self._cache), _cache_to_tensors(cache))
+            ])
+            self._attention_mask = torch.cat([_left_pad(self._attention_mask, length, 1),
+                                              _left_pad(attention_mask, length, 1)], dim=0)
+            self._next_tokens = torch.cat([self._next_tokens, next_token.view(1, 1)], dim=0)
+        self._active.append(request)
+
+    def _decode_step(self):
+        self._attention_mask = torch.cat([self._attention_mask, self._attention_mask.new_ones(len(self._active), 1)], dim=1)
+        position_ids = self._attention_mask.sum(dim=1, keepdim=True) - 1
+        outputs = self.model(input_ids=self._next_tokens, attention_mask=self._attention_mask,
+                             position_ids=position_ids, past_key_values=self._cache, use_cache=True)
+        self._cache = outputs.past_key_values
+        logits = outputs.logits[:, -1, :]
+
+        keep_rows = []
+        next_tokens = []
+        for row, request in enumerate(self._active):
+            token = self._sample(request, logits[row:row + 1])
+            if not self._emit_token(request, token.item()):
+                keep_rows.append(row)
+                next_tokens.append(token)
+
+        if len(keep_rows) == len(self._active):
+            self._next_tokens = torch.stack(next_tokens).view(-1, 1)
+            return
+        if not keep_rows:
+            self._reset_batch()
+            return
+        # Retire finished rows and drop padding columns no remaining row needs
+        self._active = [self._active[row] for row in keep_rows]
+        index = torch.tensor(keep_rows, device=self._attention_mask.device)
+        attention_mask = self._attention_mask.index_select(0, index)
+        first_col = int((attention_mask.sum(dim=0) > 0).nonzero()[0])
+        self._attention_mask = attention_mask[:, first_col:]
+        self._cache = _cache_from_tensors([
+            (k.index_select(0, index.to(k.device))[:, :, first_col:], v.index_select(0, index.to(v.device))[:, :, first_col:])
+            for k, v in _cache_to_tensors(self._cache)
+        ])
+        self._next_tokens = torch.stack(next_tokens).view(-1, 1)
+
+    def _sample(self, request, logits):
+        """Samples one token (shape [1]) for `request` with its own temperature/top_p and RNG."""
+        if request.temperature <= 0:
+            return logits.argmax(dim=-1)
+        if request.generator is None:
+            # Per-request RNG on the device of the logits (the last device with device_map="auto")
+            request.generator = torch.Generator(device=logits.device)
+            if request.seed is not None:
+                request.generator.manual_seed(request.seed)
+            else:
+                request.generator.seed()
+        probs = torch.softmax(logits.float() / request.temperature, dim=-1)
+        if request.top_p < 1.0:
+            sorted_probs, sorted_idx = probs.sort(dim=-1, descending=True)
+            # Keep the smallest prefix whose mass reaches top_p (always at least one token)
+            sorted_probs[(sorted_probs.cumsum(dim=-1) - sorted_probs) > request.top_p] = 0.0
+            probs = torch.zeros_like(probs).scatter(-1, sorted_idx, sorted_probs)
+        return torch.multinomial(probs, 1, generator=request.generator).view(1)
+
+    def _emit_token(self, request, token_id):
+        """Streams one generated token to its request. Returns True once the request is finished."""
+        request.num_generated += 1
+        if request.metrics.first_token_time is None:
+            request.metrics.first_token_time = time.perf_counter()
+        finished = token_id in self.eos_token_ids
+        if not finished:
+            request._token_cache.append(token_id)
+            request._emit_text(self.tokenizer)
+            if request.tracker is not None and request.tracker.complete:
+                finished = True
+                request.stopped_early = request.num_generated < request.max_new_tokens
+        if finished or request.num_generated >= request.max_new_tokens:
+            request._finish(self.tokenizer)
+            return True
+        return False
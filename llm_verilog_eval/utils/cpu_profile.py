@@ -0,0 +1,76 @@
+# llm_verilog_eval/utils/cpu_profile.py
+"""
+CPU execution profile for load_model_and_tokenizer on nodes without CUDA.
+
+float16 matmuls are emulated on most CPUs, so the dtype is float32 unless the CPU has
+native bfloat16 support (AVX512-BF16 / AMX). Thread pools are sized explicitly, Linear
+layers can be dynamically quantized to int8 and `torch.compile` is available as opt-in.
+"""
+import os
+import torch
+
+DEFAULT_CPU_PROFILE = {
+    "dtype": "auto",             # "auto" (bfloat16 with native CPU support, else float32), "float32" or "bfloat16"
+    "intra_op_threads": None,    # None = all CPUs this process may run on
+    "inter_op_threads": 1,       # generate() is one sequential op stream, extra inter-op threads only add contention
+    "dynamic_int8": False,       # torch dynamic int8 quantization of nn.Linear layers (forces float32 elsewhere)
+    "torch_compile": False,      # torch.compile the forward pass; first generations pay the compile time
+}
+
+# /proc/cpuinfo flags of instruction sets with native bfloat16 arithmetic
+BF16_CPU_FLAGS = ("avx512_bf16", "amx_bf16")
+
+def detect_cpu_flags():
+    """Returns the CPU feature flags from /proc/cpuinfo (empty set where unavailable, e.g. macOS)."""
+    try:
+        with open("/proc/cpuinfo", 'r') as f:
+            for line in f:
+                if line.startswith("flags"):
+                    return set(line.split(":", 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+def choose_cpu_dtype(profile, cpu_flags=None):
+    if profile["dynamic_int8"]:
+        return torch.float32 # quantize_dynamic expects float32 Linear weights
+    if profile["dtype"] != "auto":
+        return getattr(torch, profile["dtype"])
+    cpu_flags = detect_cpu_flags() if cpu_flags is None else cpu_flags
+    return torch.bfloat16 if any(flag in cpu_flags for flag in BF16_CPU_FLAGS) else torch.float32
+
+# (intra_op_threads, inter_op_threads) of the last configure_cpu_threads call
+_configured_threads = None
+
+def configure_cpu_threads(intra_op_threads=None, inter_op_threads=1):
+    global _configured_threads
+    if _configured_threads == (intra_op_threads, inter_op_threads):
+        return
+    _configured_threads = (intra_op_threads, inter_op_threads)
+    if not intra_op_threads:
+        intra_op_threads = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    torch.set_num_threads(intra_op_threads)
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError:
+            # Can only be set once, before any inter-op parallel work has started
+            print(f"Warning [cpu_profile]: Inter-op threads already fixed at {torch.get_num_interop_threads()}.")
+    print(f"INFO [cpu_profile]: Using {torch.get_num_threads()} intra-op and "
+          f"{torch.get_num_interop_threads()} inter-op threads.")
+
+def resolve_cpu_profile(cpu_profile=None):
+    profile = dict(DEFAULT_CPU_PROFILE)
+    profile.update(cpu_profile or {})
+    return profile
+
+def apply_cpu_profile(model, profile):
+    """Applies the post-load parts of the profile (int8 quantization, torch.compile) and returns the model."""
+    if profile["dynamic_int8"]:
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        print("INFO [cpu_profile]: Applied dynamic int8 quantization to Linear layers.")
+    if profile["torch_compile"]:
+        # Decode steps change the sequence length every call, so compile for dynamic shapes
+        model.forward = torch.compile(model.forward, dynamic=True)
+        print("INFO [cpu_profile]: Compiled the forward pass with torch.compile.")
+    return model
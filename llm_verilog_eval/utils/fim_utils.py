@@ -0,0 +1,115 @@
+# llm_verilog_eval/utils/fim_utils.py
+"""
+Fill-in-the-middle (FIM) generation for partial completion.
+
+Instead of asking the model to regenerate a whole module around a few lines masked by
+`mask_verilog_lines`, every mask is infilled separately and the results are spliced back
+into the masked template. Models with FIM special tokens get a raw prefix/suffix/middle
+prompt; other models get a short chat prompt per mask.
+"""
+from masking_utils import DEFAULT_MASK_TOKEN
+from prompt_renderer import get_prompt_renderer
+
+# (prefix, suffix, middle) special tokens of known code model families, PSM order
+FIM_TOKEN_FORMATS = {
+    "qwen": ("<|fim_prefix|>", "<|fim_suffix|>", "<|fim_middle|>"),          # Qwen2.5-Coder, CodeGemma
+    "starcoder": ("<fim_prefix>", "<fim_suffix>", "<fim_middle>"),           # StarCoder, SantaCoder
+    "deepseek": ("<｜fim▁begin｜>", "<｜fim▁hole｜>", "<｜fim▁end｜>"),          # DeepSeek-Coder
+    "codellama": ("▁<PRE>", "▁<SUF>", "▁<MID>"),                             # CodeLlama
+}
+
+DEFAULT_MAX_NEW_TOKENS_PER_MASK = 64
+
+FALLBACK_INFILL_MARKER = "// >>> FILL THIS LINE <<<"
+
+def detect_fim_format(tokenizer):
+    """Returns the FIM_TOKEN_FORMATS key whose special tokens all exist in the tokenizer's vocab, or None."""
+    get_vocab = getattr(tokenizer, "get_vocab", None)
+    if get_vocab is None: # e.g. remote tokenizers
+        return None
+    vocab = get_vocab()
+    for name, tokens in FIM_TOKEN_FORMATS.items():
+        if all(tok in vocab for tok in tokens):
+            return name
+    return None
+
+def split_masked_template(masked_code, mask_token=DEFAULT_MASK_TOKEN):
+    """Splits masked code at every mask token; N masks give N+1 text segments."""
+    return masked_code.split(mask_token)
+
+def splice_infills(segments, fills):
+    """Rebuilds the full source from the template segments and one fill per mask."""
+    if len(fills) != len(segments) - 1:
+        raise ValueError(f"Expected {len(segments) - 1} infills, got {len(fills)}")
+    parts = [segments[0]]
+    for fill, segment in zip(fills, segments[1:]):
+        parts.append(fill)
+        parts.append(segment)
+    return "".join(parts)
+
+def build_fim_prompt(fim_format, prefix, suffix):
+    fim_prefix, fim_suffix, fim_middle = FIM_TOKEN_FORMATS[fim_format]
+    if fim_format == "codellama":
+        # The sentencepiece "▁" of the special tokens is rendered as a space
+        return f" <PRE> {prefix} <SUF>{suffix} <MID>"
+    return f"{fim_prefix}{prefix}{fim_suffix}{suffix}{fim_middle}"
+
+CHAT_INFILL_SYSTEM_PROMPT = (
+    "You are an expert Verilog HDL code generation assistant. "
+    f"Reply with only the single line of Verilog-2001 code that replaces the line marked '{FALLBACK_INFILL_MARKER}'. "
+    "Do not repeat any other code and do not add explanations or code fences."
+)
+
+def build_chat_infill_prompt(tokenizer, prefix, suffix):
+    """Chat prompt for models without FIM tokens: show the code with one marked line, ask for that line only."""
+    return get_prompt_renderer(tokenizer).render(f"{prefix}{FALLBACK_INFILL_MARKER}{suffix}",
+                                                 system=CHAT_INFILL_SYSTEM_PROMPT)
+
+def extract_infill_line(raw_output):
+    """
+    Keeps the first line of code from an infill. Each mask replaces exactly one line, so
+    anything after the first non-empty line (or inside code fences) is discarded.
+    """
+    for line in raw_output.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("```"):
+            continue
+        return stripped
+    return ""
+
+def generate_masked_infills(model, tokenizer, masked_code, generate_fn, mask_token=DEFAULT_MASK_TOKEN,
+                            max_new_tokens_per_mask=DEFAULT_MAX_NEW_TOKENS_PER_MASK, use_fim=True,
+                            **generate_kwargs):
+    """
+    Fills every mask of `masked_code` in order and returns (completed_code, details).
+
+    Each mask is generated from its own prompt: the prefix contains the already filled
+    earlier masks, the suffix the rest of the template. All prompts start with the same text
+    up to the first mask, which is passed as `shared_prefix` so the HF backend prefills it once.
+    `generate_fn` has the signature of `generate_verilog`. `details` lists per mask the prompt
+    style and the raw/used infill.
+    """
+    segments = split_masked_template(masked_code, mask_token)
+    fim_format = detect_fim_format(tokenizer) if use_fim else None
+    print(f"INFO [fim]: Infilling {len(segments) - 1} mask(s) using "
+          f"{'FIM tokens (' + fim_format + ')' if fim_format else 'per-mask chat prompts'}.")
+
+    fills = []
+    details = []
+    for mask_idx in range(len(segments) - 1):
+        prefix = splice_infills(segments[:mask_idx + 1], fills)
+        suffix = mask_token.join(segments[mask_idx + 1:])
+        if fim_format:
+            prompt = build_fim_prompt(fim_format, prefix, suffix)
+        else:
+            prompt = build_chat_infill_prompt(tokenizer, prefix, suffix)
+        template_idx = prompt.find(segments[0]) if segments[0] else -1
+        shared_prefix = prompt[:template_idx + len(segments[0])] if template_idx >= 0 else None
+        raw_output = generate_fn(model, tokenizer, prompt, max_new_tokens=max_new_tokens_per_mask,
+                                 stop_on_module_complete=False, **{"shared_prefix": shared_prefix, **generate_kwargs})
+        fill = extract_infill_line(raw_output)
+        print(f"  Mask {mask_idx + 1}: '{fill}'")
+        fills.append(fill)
+        details.append({"mask_index": mask_idx, "prompt_style": fim_format or "chat", "raw_output": raw_output, "fill": fill})
+
+    return splice_infills(segments, fills), details
@@ -0,0 +1,382 @@
+# llm_verilog_eval/utils/generation_backends.py
+"""
+Pluggable generation backends for run_experiment.py.
+
+A backend loads a model and exposes `count_tokens`, `generate_batch` and `stream`, plus
+`generate_verilog` and `generate_verilog_samples` methods with the contracts of their
+llm_interface namesakes, so they can be used directly as run_experiment's `generate_fn`
+and `generate_samples_fn`. Implementations:
+
+    hf      transformers in this process (llm_interface)
+    replay  serves earlier outputs from llm_verilog_eval/generated_rtl, no model or GPU needed
+    openai  client for an OpenAI-compatible completions server (vLLM, llama.cpp, TGI, ...)
+
+Run this file to self-test the replay and OpenAI backends against openai_stand_in.py.
+"""
+import glob
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from generation_client import GenerationServerError, _request
+from generation_metrics import GenerationMetrics
+
+DEFAULT_GENERATED_RTL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'generated_rtl')
+DEFAULT_OPENAI_BASE_URL = "http://127.0.0.1:8000"
+
+# Rough token approximation (identifiers, numbers, single punctuation characters) for backends without a tokenizer
+_APPROX_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def render_chatml(messages, add_generation_prompt=True):
+    """ChatML rendering of chat messages, used when no model-specific chat template is available."""
+    text = "".join(f"<|im_start|>{m['role']}\n{m['content']}<|im_end|>\n" for m in messages)
+    return text + ("<|im_start|>assistant\n" if add_generation_prompt else "")
+
+class GenerationBackend:
+    """
+    Interface of a generation backend. `load` returns the (model, tokenizer) handles that are
+    passed back into `generate_verilog`; the tokenizer handle must at least provide
+    `apply_chat_template(messages, tokenize=False, add_generation_prompt=True)`.
+    """
+    name = None
+
+    def __init__(self):
+        self.model_name_or_path = None
+
+    def load(self, model_name_or_path, use_quantization=None):
+        raise NotImplementedError
+
+    def count_tokens(self, text):
+        raise NotImplementedError
+
+    def generate_batch(self, prompts, max_new_tokens=8192, temperature=0.7, top_p=0.95, seed=None):
+        """Returns one output string per prompt; prompt i is sampled with seed + i when a seed is given."""
+        raise NotImplementedError
+
+    def stream(self, prompt, max_new_tokens=8192, temperature=0.7, top_p=0.95, seed=None):
+        """Yields the text of one generation in chunks as it is produced."""
+        raise NotImplementedError
+
+    def generate_verilog(self, model, tokenizer, prompt_text, max_new_tokens=8192, temperature=0.7, top_p=0.95,
+                         seed=None, return_metrics=False, **hf_only_kwargs):
+        """
+        Same contract as llm_interface.generate_verilog. The sample is streamed so the time to
+        first token can be measured. Options only the HF path implements (shared_prefix,
+        stop_on_module_complete, use_generation_cache, ...) are ignored.
+        """
+        def generate(metrics):
+            chunks = []
+            for chunk in self.stream(prompt_text, max_new_tokens=max_new_tokens, temperature=temperature,
+                                     top_p=top_p, seed=seed):
+                if metrics.first_token_time is None:
+                    metrics.first_token_time = time.perf_counter()
+                chunks.append(chunk)
+            return ["".join(chunks)]
+        outputs, _, record = self._measure(generate, prompt_text, max_new_tokens=max_new_tokens,
+                                           temperature=temperature, top_p=top_p, num_samples=1, seed=seed)
+        return (outputs[0], record) if return_metrics else outputs[0]
+
+    def generate_verilog_samples(self, model, tokenizer, prompt_text, num_samples, max_new_tokens=8192,
+                                 temperature=0.7, top_p=0.95, seed=None, return_metrics=False, **hf_only_kwargs):
+        """
+        Same contract as llm_interface.generate_verilog_samples, through generate_batch; sample i
+        is sampled with seed + i. Options only the HF path implements are ignored.
+        """
+        if seed is None:
+            seed = random.randint(0, 2**31 - 1)
+        def generate(metrics):
+            return self.generate_batch([prompt_text] * num_samples, max_new_tokens=max_new_tokens,
+                                       temperature=temperature, top_p=top_p, seed=seed)
+        outputs, output_token_counts, record = self._measure(
+            generate, prompt_text, max_new_tokens=max_new_tokens, temperature=temperature, top_p=top_p,
+            num_samples=num_samples, seed=seed)
+        samples = [{"output": text, "output_tokens": count, "tokens_saved": 0, "seed": seed + i, "sample_index": i}
+                   for i, (text, count) in enumerate(zip(outputs, output_token_counts))]
+        return (samples, record) if return_metrics else samples
+
+    def _measure(self, generate, prompt_text, **record_fields):
+        """Runs generate(metrics) -> output strings. Returns (outputs, their token counts, metrics record)."""
+        input_tokens = self.count_tokens(prompt_text)
+        metrics = GenerationMetrics(None)
+        with metrics:
+            outputs = generate(metrics)
+        output_token_counts = [self.count_tokens(output) for output in outputs]
+        metrics.input_tokens = input_tokens
+        metrics.output_tokens = sum(output_token_counts)
+        record = metrics.as_record(model=self.model_name_or_path, backend=self.name, **record_fields)
+        return outputs, output_token_counts, record
+
+class HFBackend(GenerationBackend):
+    """transformers in this process; the generate methods are llm_interface's own."""
+    name = "hf"
+
+    def __init__(self, draft_model_name_or_path=None, batch_size=8, cpu_profile=None):
+        super().__init__()
+        self.draft_model_name_or_path = draft_model_name_or_path
+        self.cpu_profile = cpu_profile
+        self.batch_size = batch_size
+        self.model = self.tokenizer = self.assistant_model = None
+
+    def load(self, model_name_or_path, use_quantization=None):
+        # Imported here so the other backends work without torch/transformers
+        from llm_interface import load_model_and_tokenizer, load_draft_model
+        self.model_name_or_path = model_name_or_path
+        self.model, self.tokenizer = load_model_and_tokenizer(model_name_or_path, use_quantization=use_quantization,
+                                                              cpu_profile=self.cpu_profile)
+        if self.draft_model_name_or_path:
+            self.assistant_model = load_draft_model(self.draft_model_name_or_path, self.tokenizer,
+                                                    use_quantization=use_quantization)
+        return self.model, self.tokenizer
+
+    def count_tokens(self, text):
+        from token_budget import count_tokens
+        return count_tokens(self.tokenizer, text)
+
+    def generate_batch(self, prompts, max_new_tokens=8192, temperature=0.7, top_p=0.95, seed=None):
+        from transformers import set_seed
+        from llm_interface import generate_verilog_batch
+        if seed is not None:
+            set_seed(seed)
+        results = generate_verilog_batch(self.model, self.tokenizer, prompts, max_new_tokens=max_new_tokens,
+                                         temperature=temperature, top_p=top_p, batch_size=self.batch_size)
+        return [result["output"] for result in results]
+
+    def stream(self, prompt, max_new_tokens=8192, temperature=0.7, top_p=0.95, seed=None):
+        from transformers import TextIteratorStreamer, set_seed
+        if seed is not None:
+            set_seed(seed)
+        model_inputs = self.tokenizer([prompt], return_tensors="pt").to(self.model.device)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        errors = []
+        def generate():
+            try:
+                self.model.generate(
+                    **model_inputs,
+                    streamer=streamer,
+                    max_new_tokens=max_new_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                    pad_token_id=self.tokenizer.pad_token_id,
+                    do_sample=True if temperature > 0 else False,
+                )
+            except BaseException as e:
+                # Unblock the consumer; the error is raised again in the calling thread
+                errors.append(e)
+                streamer.end()
+        thread = threading.Thread(target=generate)
+        thread.start()
+        try:
+            yield from streamer
+        finally:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def generate_verilog(self, model, tokenizer, prompt_text, **kwargs):
+        from llm_interface import generate_verilog
+        if self.assistant_model is not None:
+            kwargs.setdefault("assistant_model", self.assistant_model)
+        return generate_verilog(model, tokenizer, prompt_text, **kwargs)
+
+    def generate_verilog_samples(self, model, tokenizer, prompt_text, num_samples, **kwargs):
+        # Assisted decoding runs at batch size 1, so the draft model is not used for sample batches
+        from llm_interface import generate_verilog_samples
+        return generate_verilog_samples(model, tokenizer, prompt_text, num_samples, **kwargs)
+
+class ReplayBackend(GenerationBackend):
+    """
+    Replays RTL saved by earlier runs instead of running a model, e.g. to benchmark the
+    evaluation side of the pipeline without a GPU. Files of llm_verilog_eval/generated_rtl
+    (optionally restricted to one module and experiment mode) are served in sorted order,
+    preferring those generated by the loaded model name, and cycled when exhausted.
+    """
+    name = "replay"
+
+    def __init__(self, generated_rtl_dir=DEFAULT_GENERATED_RTL_DIR, module_name=None, mode=None):
+        super().__init__()
+        self.generated_rtl_dir = generated_rtl_dir
+        self.module_name = module_name
+        self.mode = mode
+        self.replay_files = []
+        self._next_index = 0
+        self._lock = threading.Lock()
+
+    def load(self, model_name_or_path, use_quantization=None):
+        self.model_name_or_path = model_name_or_path
+        files = sorted(glob.glob(os.path.join(self.generated_rtl_dir, self.module_name or "*", "*.v")))
+        if self.mode:
+            files = [f for f in files if f"_{self.mode}_" in os.path.basename(f)]
+        # Same naming as run_experiment's output files
+        safe_model_name = model_name_or_path.replace('/', '_').replace('-', '_')
+        matching = [f for f in files if safe_model_name in os.path.basename(f)]
+        self.replay_files = matching or files
+        if not self.replay_files:
+            raise FileNotFoundError(f"No generated RTL to replay in {self.generated_rtl_dir} "
+                                    f"(module={self.module_name}, mode={self.mode})")
+        print(f"INFO [replay backend]: Replaying {len(self.replay_files)} file(s) "
+              f"{'generated by ' + model_name_or_path if matching else 'of any model'}.")
+        return self, self
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=True):
+        if tokenize:
+            raise ValueError("ReplayBackend only supports tokenize=False")
+        return render_chatml(messages, add_generation_prompt)
+
+    def count_tokens(self, text):
+        return len(_APPROX_TOKEN_PATTERN.findall(text))
+
+    def _next_output(self):
+        with self._lock:
+            path = self.replay_files[self._next_index % len(self.replay_files)]
+            self._next_index += 1
+        with open(path, 'r') as f:
+            return f.read()
+
+    def generate_batch(self, prompts, max_new_tokens=8192, temperature=0.7, top_p=0.95, seed=None):
+        return [self._next_output() for _ in prompts]
+
+    def stream(self, prompt, max_new_tokens=8192, temperature=0.7, top_p=0.95, seed=None):
+        yield from self._next_output().splitlines(keepends=True)
+
+class OpenAICompatibleBackend(GenerationBackend):
+    """
+    Client for an OpenAI-compatible server's /v1/completions endpoint. Prompts are rendered
+    locally, with the checkpoint's own tokenizer when transformers and the checkpoint are
+    available (so the chat template matches the HF path), otherwise with ChatML and the
+    server's /tokenize endpoint (vLLM extension) for token counts.
+    """
+    name = "openai"
+
+    def __init__(self, base_url=DEFAULT_OPENAI_BASE_URL, api_key=None, served_model_name=None,
+                 use_local_tokenizer=True, max_concurrency=8, timeout=600):
+        super().__init__()
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key if api_key is not None else os.environ.get("OPENAI_API_KEY")
+        self.served_model_name = served_model_name
+        self.use_local_tokenizer = use_local_tokenizer
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.tokenizer = None
+
+    def _headers(self):
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def _post(self, endpoint, payload):
+        return _request(self.base_url, endpoint, payload, timeout=self.timeout, headers=self._headers())
+
+    def load(self, model_name_or_path, use_quantization=None):
+        self.model_name_or_path = model_name_or_path
+        self.served_model_name = self.served_model_name or model_name_or_path
+        if use_quantization:
+            print(f"Warning [openai backend]: use_quantization={use_quantization} is ignored; "
+                  "quantization is configured on the server.")
+        served = [m["id"] for m in _request(self.base_url, "/v1/models", timeout=self.timeout, headers=self._headers())["data"]]
+        if self.served_model_name not in served:
+            raise ValueError(f"Model {self.served_model_name} is not served by {self.base_url} (serving: {served})")
+        if self.use_local_tokenizer:
+            try:
+                from transformers import AutoTokenizer
+                self.tokenizer = AutoTokenizer.from_pretrained(model_name_or_path, trust_remote_code=True)
+            except Exception as e: # transformers not installed, or the checkpoint is not available locally
+                print(f"INFO [openai backend]: No local tokenizer for {model_name_or_path} ({e}); "
+                      "using ChatML prompts and the server's /tokenize endpoint.")
+        return self, self
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=True):
+        if tokenize:
+            raise ValueError("OpenAICompatibleBackend only supports tokenize=False")
+        if self.tokenizer is not None:
+            return self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=add_generation_prompt)
+        return render_chatml(messages, add_generation_prompt)
+
+    def count_tokens(self, text):
+        if self.tokenizer is not None:
+            return len(self.tokenizer(text, add_special_tokens=False).input_ids)
+        return self._post("/tokenize", {"model": self.served_model_name, "prompt": text, "add_special_tokens": False})["count"]
+
+    def _completion_payload(self, prompt, max_new_tokens, temperature, top_p, seed, stream=False):
+        payload = {"model": self.served_model_name, "prompt": prompt, "max_tokens": max_new_tokens,
+                   "temperature": temperature, "top_p": top_p, "stream": stream}
+        if seed is not None:
+            payload["seed"] = seed
+        return payload
+
+    def generate_batch(self, prompts, max_new_tokens=8192, temperature=0.7, top_p=0.95, seed=None):
+        # One request per prompt (each with its own seed); the server batches concurrent requests itself
+        def complete(i):
+            payload = self._completion_payload(prompts[i], max_new_tokens, temperature, top_p,
+                                               seed + i if seed is not None else None)
+            return self._post("/v1/completions", payload)["choices"][0]["text"]
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            return list(pool.map(complete, range(len(prompts))))
+
+    def stream(self, prompt, max_new_tokens=8192, temperature=0.7, top_p=0.95, seed=None):
+        payload = self._completion_payload(prompt, max_new_tokens, temperature, top_p, seed, stream=True)
+        req = urllib.request.Request(self.base_url + "/v1/completions", data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json", **self._headers()})
+        try:
+            resp = urllib.request.urlopen(req, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            raise GenerationServerError(f"/v1/completions failed ({e.code}): {e.read().decode('utf-8', 'replace')}") from e
+        except urllib.error.URLError as e:
+            raise GenerationServerError(f"OpenAI-compatible server at {self.base_url} is not reachable: {e.reason}") from e
+        with resp:
+            # Server-sent events: "data: {...}" lines, terminated by "data: [DONE]"
+            for line in resp:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                text = json.loads(data)["choices"][0]["text"]
+                if text:
+                    yield text
+
+BACKENDS = {
+    "hf": HFBackend,
+    "replay": ReplayBackend,
+    "openai": OpenAICompatibleBackend,
+}
+
+def create_backend(name, **options):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown generation backend '{name}' (available: {', '.join(BACKENDS)})")
+    return BACKENDS[name](**options)
+
+if __name__ == '__main__':
+    from openai_stand_in import start_stand_in_server
+
+    model_name = "/data/genai/models/Qwen3-0.6B"
+    messages = [{"role": "system", "content": "You are a Verilog assistant."}, {"role": "user", "content": "Write simple_and."}]
+
+    replay = create_backend("replay", module_name="simple_and", mode="full_completion")
+    model, tokenizer = replay.load(model_name)
+    prompt = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    expected = [open(path).read() for path in replay.replay_files]
+    output, metrics = replay.generate_verilog(model, tokenizer, prompt, return_metrics=True)
+    assert output == expected[0], "replay backend returned the wrong file"
+    print(f"Replay backend OK: {metrics['output_tokens']} tokens, TTFT {metrics['time_to_first_token_seconds']:.4f}s")
+
+    server, base_url = start_stand_in_server(create_backend("replay", module_name="simple_and", mode="full_completion"), model_name)
+    try:
+        client = create_backend("openai", base_url=base_url, use_local_tokenizer=False)
+        model, tokenizer = client.load(model_name)
+        assert tokenizer.apply_chat_template(messages) == prompt
+        assert client.count_tokens(expected[0]) == replay.count_tokens(expected[0])
+        streamed, metrics = client.generate_verilog(model, tokenizer, prompt, seed=1, return_metrics=True)
+        assert streamed == expected[0], "streamed completion differs from the replayed file"
+        samples = client.generate_verilog_samples(model, tokenizer, prompt, 2, seed=7)
+        # Concurrent requests may take the replayed files in either order
+        assert sorted(s["output"] for s in samples) == sorted(expected[i % len(expected)] for i in (1, 2))
+        assert [s["seed"] for s in samples] == [7, 8]
+        print(f"OpenAI-compatible backend OK against {base_url}: {metrics['output_tokens']} tokens streamed")
+    finally:
+        server.shutdown()
+    print("Generation backend self-test passed.")
@@ -0,0 +1,133 @@
+# llm_verilog_eval/utils/generation_cache.py
+"""
+Content-addressed on-disk cache of raw generation outputs.
+
+A generation is keyed by everything that determines its output: model and checkpoint
+revision, prompt text and sampling options. Repeated sweeps with the same settings read
+the stored output instead of running the model again. The cache directory may be shared
+by several processes, so every file operation tolerates entries that another process
+evicted in the meantime.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "LLM_VERILOG_GENERATION_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "llm_verilog_eval", "generations")
+)
+DEFAULT_MAX_CACHE_BYTES = 2 * 1024**3 # 2 GiB
+
+def generation_cache_key(model_name_or_path, model_revision, prompt_text, max_new_tokens,
+                         temperature, top_p, seed, **extra_params):
+    """
+    Returns the content address (sha256 hex digest) of one generation request.
+    `extra_params` covers any other option that changes the output (e.g. num_samples).
+    """
+    key_material = {
+        "model_name_or_path": model_name_or_path,
+        "model_revision": model_revision,
+        "prompt_text": prompt_text,
+        "max_new_tokens": max_new_tokens,
+        "temperature": temperature,
+        "top_p": top_p,
+        "seed": seed,
+        **extra_params,
+    }
+    return hashlib.sha256(json.dumps(key_material, sort_keys=True).encode("utf-8")).hexdigest()
+
+def model_revision(model):
+    """
+    Identifies the exact checkpoint behind a loaded model: the Hub commit hash when known,
+    otherwise a fingerprint of the file names, sizes and mtimes of the local model directory.
+    """
+    config = getattr(model, "config", None)
+    commit_hash = getattr(config, "_commit_hash", None)
+    if commit_hash:
+        return commit_hash
+    model_dir = getattr(config, "_name_or_path", None) or getattr(model, "name_or_path", None)
+    if model_dir and os.path.isdir(model_dir):
+        stats = []
+        for name in sorted(os.listdir(model_dir)):
+            st = os.stat(os.path.join(model_dir, name))
+            stats.append((name, st.st_size, int(st.st_mtime)))
+        return hashlib.sha256(json.dumps(stats).encode("utf-8")).hexdigest()[:16]
+    return None
+
+class GenerationCache:
+    """
+    On-disk, content-addressed store of raw generation outputs and token counts.
+
+    Each entry is one JSON file named after its key. Reads refresh the file's mtime, and
+    after every write the least recently used entries are deleted until the total size
+    is at most `max_bytes`.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                record = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        try:
+            os.utime(path) # Mark as recently used
+        except FileNotFoundError: # Evicted by another process after the read
+            pass
+        return record
+
+    def put(self, key, record):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, 'w') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError: # Evicted by another process during the walk
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self):
+        """Deletes least recently used entries until the cache fits in `max_bytes`."""
+        entries = sorted(self._entries())
+        total_bytes = sum(size for _, size, _ in entries)
+        num_evicted = 0
+        for _, size, path in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            num_evicted += 1
+        if num_evicted:
+            print(f"INFO [generation_cache]: Evicted {num_evicted} entries, cache size now {total_bytes} bytes.")
+
+_default_cache = None
+
+def get_default_generation_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = GenerationCache()
+    return _default_cache
@@ -0,0 +1,83 @@
+# llm_verilog_eval/utils/generation_client.py
+"""
+Thin client for generation_server.py. Mirrors the `load_model_and_tokenizer` /
+`generate_verilog` / `generate_verilog_samples` interface of llm_interface, but only needs the standard library,
+so experiment scripts using it start instantly and never load a model themselves.
+"""
+import json
+import urllib.error
+import urllib.request
+
+DEFAULT_SERVER_URL = "http://127.0.0.1:8765"
+
+class GenerationServerError(RuntimeError):
+    pass
+
+def _request(server_url, endpoint, payload=None, timeout=None, headers=None):
+    url = server_url.rstrip("/") + endpoint
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json", **(headers or {})})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.loads(e.read()).get("error", str(e))
+        except ValueError:
+            message = str(e)
+        raise GenerationServerError(f"{endpoint} failed ({e.code}): {message}") from e
+    except urllib.error.URLError as e:
+        raise GenerationServerError(f"Generation server at {server_url} is not reachable: {e.reason}") from e
+
+class RemoteModel:
+    """Handle for a model that lives in the generation server."""
+    def __init__(self, server_url, model_name_or_path, use_quantization=None):
+        self.server_url = server_url
+        self.name_or_path = model_name_or_path
+        self.use_quantization = use_quantization
+
+    def _payload(self, **extra):
+        payload = {"model_name_or_path": self.name_or_path, "use_quantization": self.use_quantization}
+        payload.update(extra)
+        return payload
+
+class RemoteTokenizer:
+    """Tokenizer stand-in that renders chat templates and counts tokens on the server."""
+    def __init__(self, remote_model):
+        self.remote_model = remote_model
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=True):
+        if tokenize:
+            raise ValueError("RemoteTokenizer only supports tokenize=False")
+        response = _request(self.remote_model.server_url, "/apply_chat_template",
+                            self.remote_model._payload(messages=messages, add_generation_prompt=add_generation_prompt))
+        return response["prompt_text"]
+
+    def count_tokens(self, text):
+        response = _request(self.remote_model.server_url, "/count_tokens", self.remote_model._payload(text=text))
+        return response["num_tokens"]
+
+def server_is_up(server_url=DEFAULT_SERVER_URL):
+    try:
+        _request(server_url, "/health", timeout=5)
+        return True
+    except GenerationServerError:
+        return False
+
+def load_model_and_tokenizer(model_name_or_path, use_quantization=None, server_url=DEFAULT_SERVER_URL):
+    """Asks the server to load (or reuse) the model and returns remote model/tokenizer handles."""
+    print(f"Requesting {model_name_or_path} from generation server {server_url}...")
+    _request(server_url, "/load", {"model_name_or_path": model_name_or_path, "use_quantization": use_quantization})
+    remote_model = RemoteModel(server_url, model_name_or_path, use_quantization)
+    return remote_model, RemoteTokenizer(remote_model)
+
+def generate_verilog(model, tokenizer, prompt_text, return_metrics=False, **kwargs):
+    """Same contract as llm_interface.generate_verilog, executed by the generation server."""
+    response = _request(model.server_url, "/generate", model._payload(prompt_text=prompt_text, **kwargs))
+    return (response["output"], response["metrics"]) if return_metrics else response["output"]
+
+def generate_verilog_samples(model, tokenizer, prompt_text, num_samples, return_metrics=False, **kwargs):
+    """Same contract as llm_interface.generate_verilog_samples, executed by the generation server."""
+    response = _request(model.server_url, "/generate_samples",
+                        model._payload(prompt_text=prompt_text, num_samples=num_samples, **kwargs))
+    return (response["output"], response["metrics"]) if return_metrics else response["output"]
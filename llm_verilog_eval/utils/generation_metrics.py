@@ -0,0 +1,174 @@
+# llm_verilog_eval/utils/generation_metrics.py
+"""
+Throughput metrics of single generations: prefill time, time to first token, decode
+tokens/sec, token counts and peak memory. Records are printed as a one-line summary and
+written as JSON next to the evaluation logs.
+"""
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+# The streamers below implement transformers' BaseStreamer interface (put/end) without importing it:
+# this module is also used by the replay/remote backends and eval-only tools, which must not pay
+# the torch/transformers import time.
+
+class StreamerGroup:
+    """Fans the tokens of one `model.generate` call out to several streamers."""
+    def __init__(self, *streamers):
+        self.streamers = [s for s in streamers if s is not None]
+
+    def put(self, value):
+        for streamer in self.streamers:
+            streamer.put(value)
+
+    def end(self):
+        for streamer in self.streamers:
+            streamer.end()
+
+class _FirstTokenStreamer:
+    """Records when the first generated token arrives (the first put() carries the prompt)."""
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.seen_prompt = False
+
+    def put(self, value):
+        if not self.seen_prompt:
+            self.seen_prompt = True
+            return
+        if self.metrics.first_token_time is None:
+            self.metrics.first_token_time = time.perf_counter()
+
+    def end(self):
+        self.seen_prompt = False
+
+def _loaded_torch():
+    # Only a process that has imported torch itself (i.e. runs a local model) can have CUDA memory to track
+    return sys.modules.get("torch")
+
+def _cuda_available():
+    torch = _loaded_torch()
+    return torch is not None and torch.cuda.is_available()
+
+def _synchronize():
+    if _cuda_available():
+        _loaded_torch().cuda.synchronize()
+
+class GenerationMetrics:
+    """
+    Collects throughput metrics of one generate_verilog call:
+    prefill time (duration of the first model forward pass, i.e. the prompt, plus any forward
+    passes run inside `prompt_prefill()` before it), time to first token, decode tokens/sec, input/output token counts and peak memory. `cached_input_tokens`
+    counts the input tokens whose KV cache was reused from an earlier turn instead of prefilled.
+    The CUDA peak memory statistics are process-wide and reset on creation; pass
+    `reset_peak_memory=False` for records of generations that overlap others (continuous batching).
+    """
+    def __init__(self, model, reset_peak_memory=True):
+        self.model = model
+        self.start_time = time.perf_counter()
+        self.first_token_time = None
+        self.end_time = None
+        self.prefill_seconds = None
+        self.input_tokens = 0
+        self.cached_input_tokens = 0
+        self.output_tokens = 0
+        self.cache_hit = False
+        self._prefill_start = None
+        self._prompt_prefill_seconds = 0.0
+        self._in_prompt_prefill = False
+        self._hook_handles = []
+        if reset_peak_memory and _cuda_available():
+            _loaded_torch().cuda.reset_peak_memory_stats()
+
+    def streamer(self):
+        return _FirstTokenStreamer(self)
+
+    @contextmanager
+    def prompt_prefill(self):
+        """
+        Times prompt forward passes run before `model.generate` (e.g. the prefix and suffix
+        prefill of a shared-prefix KV cache). Their duration is added to the first forward
+        pass of generate, which processes the remaining prompt tokens.
+        """
+        _synchronize()
+        start = time.perf_counter()
+        self._in_prompt_prefill = True
+        try:
+            yield
+        finally:
+            self._in_prompt_prefill = False
+            _synchronize()
+            self._prompt_prefill_seconds += time.perf_counter() - start
+
+    def _pre_forward(self, module, args):
+        if self._in_prompt_prefill:
+            return
+        if self.prefill_seconds is None and self._prefill_start is None:
+            _synchronize()
+            self._prefill_start = time.perf_counter()
+
+    def _post_forward(self, module, args, output):
+        if self._in_prompt_prefill:
+            return
+        if self.prefill_seconds is None and self._prefill_start is not None:
+            _synchronize()
+            self.prefill_seconds = time.perf_counter() - self._prefill_start + self._prompt_prefill_seconds
+
+    def __enter__(self):
+        if hasattr(self.model, "register_forward_hook"):
+            self._hook_handles = [
+                self.model.register_forward_pre_hook(self._pre_forward),
+                self.model.register_forward_hook(self._post_forward),
+            ]
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        for handle in self._hook_handles:
+            handle.remove()
+        self._hook_handles = []
+        self.end_time = time.perf_counter()
+        return False
+
+    def as_record(self, **extra):
+        end_time = self.end_time or time.perf_counter()
+        record = {
+            "cache_hit": self.cache_hit,
+            "total_seconds": end_time - self.start_time,
+            "prefill_seconds": self.prefill_seconds,
+            "time_to_first_token_seconds": (self.first_token_time - self.start_time) if self.first_token_time else None,
+            "decode_tokens_per_second": None,
+            "input_tokens": self.input_tokens,
+            "cached_input_tokens": self.cached_input_tokens,
+            "output_tokens": self.output_tokens,
+        }
+        if self.first_token_time and self.output_tokens > 1 and end_time > self.first_token_time:
+            record["decode_tokens_per_second"] = (self.output_tokens - 1) / (end_time - self.first_token_time)
+        if _cuda_available():
+            torch = _loaded_torch()
+            record["peak_memory_bytes"] = sum(torch.cuda.max_memory_allocated(d) for d in range(torch.cuda.device_count()))
+            record["peak_memory_kind"] = "cuda_allocated"
+        else:
+            # ru_maxrss is in KiB on Linux and covers the whole process lifetime
+            record["peak_memory_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            record["peak_memory_kind"] = "process_max_rss"
+        record.update(extra)
+        return record
+
+def format_metrics_summary(record):
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else "n/a"
+    cached = f" ({record['cached_input_tokens']} cached)" if record.get('cached_input_tokens') else ""
+    return (f"in={record['input_tokens']}{cached} out={record['output_tokens']} tok, "
+            f"prefill={fmt(record['prefill_seconds'], '.2f')}s, "
+            f"TTFT={fmt(record['time_to_first_token_seconds'], '.2f')}s, "
+            f"decode={fmt(record['decode_tokens_per_second'], '.1f')} tok/s, "
+            f"peak mem={record['peak_memory_bytes'] / 1024**3:.2f} GiB"
+            f"{' (cache hit)' if record['cache_hit'] else ''}")
+
+def write_metrics_record(path, record):
+    """Writes one generation metrics record as JSON (e.g. next to the eval log)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(record, f, indent=2)
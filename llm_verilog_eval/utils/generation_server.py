@@ -0,0 +1,180 @@
+# llm_verilog_eval/utils/generation_server.py
+"""
+Long-lived local generation daemon.
+
+Loads models once through `load_model_and_tokenizer` and keeps them warm across
+experiments; `run_experiment.py` talks to it through `generation_client.py`.
+
+Usage:
+    python generation_server.py --port 8765 --preload /data/genai/models/Qwen2.5-Coder-32B-Instruct
+
+With --continuous-batching, /generate requests of many concurrent clients (e.g. parallel
+experiment workers covering the module x sample matrix) share one continuously refilled
+decode batch (continuous_batching.py) instead of being served one after another.
+
+Endpoints (JSON over HTTP, localhost only by default):
+    GET  /health                -> {"status": "ok", "loaded_models": [...]}
+    POST /load                  {"model_name_or_path", "use_quantization"}
+    POST /apply_chat_template   {"model_name_or_path", "use_quantization", "messages", "add_generation_prompt"}
+    POST /count_tokens          {"model_name_or_path", "use_quantization", "text"} -> {"num_tokens"}
+    POST /generate              {"model_name_or_path", "use_quantization", "prompt_text", **generate_verilog kwargs}
+    POST /generate_samples      {"model_name_or_path", "use_quantization", "prompt_text", "num_samples",
+                                 **generate_verilog_samples kwargs}
+"""
+import argparse
+import json
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_interface import load_model_and_tokenizer, generate_verilog, generate_verilog_samples, loaded_models
+from continuous_batching import ContinuousBatchingScheduler, DEFAULT_MAX_BATCH_SIZE
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# generate_verilog keyword arguments a client may forward
+GENERATE_KWARGS = ("max_new_tokens", "temperature", "top_p", "seed", "shared_prefix",
+                   "stop_on_module_complete", "use_generation_cache", "constrain_verilog2001",
+                   "keep_kv_cache")
+# ... and those of generate_verilog_samples (besides the required num_samples)
+GENERATE_SAMPLES_KWARGS = ("max_new_tokens", "temperature", "top_p", "seed", "shared_prefix",
+                           "stop_on_module_complete", "use_generation_cache", "constrain_verilog2001")
+
+# One accelerator, one generation at a time; HTTP requests are still accepted concurrently
+_model_lock = threading.Lock()
+
+# With continuous batching (serve(..., continuous_batching=True)) concurrent /generate requests
+# are decoded together by one scheduler for the model in use instead of one at a time
+_continuous_batching = {"enabled": False, "max_batch_size": DEFAULT_MAX_BATCH_SIZE}
+_scheduler = None
+
+def _load(payload):
+    return load_model_and_tokenizer(payload["model_name_or_path"], use_quantization=payload.get("use_quantization"))
+
+def handle_load(payload):
+    with _model_lock:
+        _load(payload)
+    return {"loaded": payload["model_name_or_path"]}
+
+def handle_apply_chat_template(payload):
+    with _model_lock:
+        _, tokenizer = _load(payload)
+    prompt_text = tokenizer.apply_chat_template(
+        payload["messages"],
+        tokenize=False,
+        add_generation_prompt=payload.get("add_generation_prompt", True)
+    )
+    return {"prompt_text": prompt_text}
+
+def handle_count_tokens(payload):
+    with _model_lock:
+        _, tokenizer = _load(payload)
+    return {"num_tokens": len(tokenizer(payload["text"], add_special_tokens=False).input_ids)}
+
+def _get_scheduler(model, tokenizer):
+    """Returns the scheduler of `model`; switching models lets the previous scheduler drain first."""
+    global _scheduler
+    if _scheduler is None or _scheduler.model is not model:
+        if _scheduler is not None:
+            _scheduler.close(wait=True)
+        _scheduler = ContinuousBatchingScheduler(model, tokenizer, max_batch_size=_continuous_batching["max_batch_size"])
+    return _scheduler
+
+def _generate(payload, num_samples=None):
+    if num_samples is None:
+        kwargs = {k: payload[k] for k in GENERATE_KWARGS if k in payload}
+    else:
+        kwargs = {k: payload[k] for k in GENERATE_SAMPLES_KWARGS if k in payload}
+    if _continuous_batching["enabled"]:
+        with _model_lock:
+            model, tokenizer = _load(payload)
+            scheduler = _get_scheduler(model, tokenizer)
+            # Submitted under the lock: a model switch closes this scheduler only after it has accepted
+            # the requests, and a closing scheduler still finishes the requests it accepted
+            requests = scheduler.submit_samples(payload["prompt_text"], num_samples=num_samples or 1, **kwargs)
+        samples, metrics = scheduler.collect_samples(requests, return_metrics=True)
+        return {"output": samples[0]["output"] if num_samples is None else samples, "metrics": metrics}
+    with _model_lock:
+        model, tokenizer = _load(payload)
+        if num_samples is None:
+            output, metrics = generate_verilog(model, tokenizer, payload["prompt_text"], return_metrics=True, **kwargs)
+        else:
+            output, metrics = generate_verilog_samples(model, tokenizer, payload["prompt_text"], num_samples,
+                                                       return_metrics=True, **kwargs)
+    return {"output": output, "metrics": metrics}
+
+def handle_generate(payload):
+    return _generate(payload)
+
+def handle_generate_samples(payload):
+    return _generate(payload, num_samples=payload["num_samples"])
+
+ROUTES = {
+    "/load": handle_load,
+    "/apply_chat_template": handle_apply_chat_template,
+    "/count_tokens": handle_count_tokens,
+    "/generate": handle_generate,
+    "/generate_samples": handle_generate_samples,
+}
+
+class GenerationRequestHandler(BaseHTTPRequestHandler):
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": f"Unknown endpoint {self.path}"})
+            return
+        self._send_json(200, {"status": "ok", "loaded_models": loaded_models()})
+
+    def do_POST(self):
+        handler = ROUTES.get(self.path)
+        if handler is None:
+            self._send_json(404, {"error": f"Unknown endpoint {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except (ValueError, json.JSONDecodeError) as e:
+            self._send_json(400, {"error": f"Invalid JSON request: {e}"})
+            return
+        try:
+            self._send_json(200, handler(payload))
+        except KeyError as e:
+            self._send_json(400, {"error": f"Missing field {e}"})
+        except Exception as e:
+            traceback.print_exc()
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, preload=(), use_quantization=None, continuous_batching=False,
+          max_batch_size=DEFAULT_MAX_BATCH_SIZE):
+    _continuous_batching.update(enabled=continuous_batching, max_batch_size=max_batch_size)
+    for model_name_or_path in preload:
+        load_model_and_tokenizer(model_name_or_path, use_quantization=use_quantization)
+    server = ThreadingHTTPServer((host, port), GenerationRequestHandler)
+    print(f"INFO [generation_server]: Serving on http://{host}:{port} (models loaded: {[m['model'] for m in loaded_models()]})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("INFO [generation_server]: Shutting down.")
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Persistent local LLM generation server for run_experiment.py")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--preload", nargs="*", default=[], help="Model paths to load at startup")
+    parser.add_argument("--quantization", default=None, choices=["8bit", "4bit"], help="Quantization for preloaded models")
+    parser.add_argument("--continuous-batching", action="store_true",
+                        help="Decode concurrent /generate requests together, admitting new ones as others finish")
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE,
+                        help="Maximum number of sequences decoded together with --continuous-batching")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.preload, args.quantization, args.continuous_batching, args.max_batch_size)
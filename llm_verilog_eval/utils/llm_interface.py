@@ -1,14 +1,91 @@
 # llm_verilog_eval/utils/llm_interface.py
-from transformers import AutoModelForCausalLM, AutoTokenizer
+"""
+Local Hugging Face transformers generation: model loading and caching, generate_verilog and
+generate_verilog_samples, prefix/turn KV caches and the batch path.
+
+This is the implementation of the "hf" backend and of generation_server.py, and imports torch
+and transformers at module level. Code that must also run without them (run_experiment.py, the
+replay/openai backends, the generation client, evaluation tools) must not import it at module
+level; generation_backends.HFBackend imports it when a model is loaded.
+"""
+import copy
+import gc
+import glob
+import os
+import random
+import time
+from contextlib import nullcontext
+from collections import OrderedDict
+from transformers import (AutoModelForCausalLM, AutoTokenizer, BatchEncoding, DynamicCache, LogitsProcessor,
+                          LogitsProcessorList, StoppingCriteriaList, set_seed)
 import torch
+from verilog_stopping import VerilogCompletionStreamer, ModuleCompleteStoppingCriteria
+from generation_cache import generation_cache_key, get_default_generation_cache, model_revision
+from assisted_generation import check_tokenizers_compatible, ForwardCallCounter, assisted_generation_stats
+from generation_metrics import GenerationMetrics, StreamerGroup, format_metrics_summary
+from cpu_profile import resolve_cpu_profile, choose_cpu_dtype, configure_cpu_threads, apply_cpu_profile
+from verilog_constraints import Verilog2001LogitsProcessor
+from prompt_renderer import forget_prompt_renderers
+
+# LRU cache of loaded models and tokenizers, keyed by (path, quantization, dtype, CPU profile). Once the
+# parameter memory of all cached models exceeds MODEL_CACHE_MAX_BYTES, the least recently
+# used models are evicted and freed (e.g. when sweeping several models in one process).
+MODEL_CACHE_MAX_BYTES = int(os.environ.get("LLM_VERILOG_MODEL_CACHE_MAX_BYTES", 80 * 1024**3))
+_model_cache = OrderedDict() # key -> {"model", "tokenizer", "param_bytes"}
+
+# LRU cache of prefilled KV caches for shared prompt prefixes (system instruction,
+# chat-template preamble, RTL prefix up to the first mask), keyed by (id(model), prefix token ids)
+PREFIX_CACHE_MAX_ENTRIES = 8
+_prefix_kv_cache = OrderedDict()
+
+# LRU cache of the KV caches of finished generate_verilog(..., keep_kv_cache=True) turns (prompt +
+# output), keyed by (id(model), token ids). A follow-up turn of the same conversation resumes from the
+# entry sharing the most leading tokens with its prompt; earlier turns it extends are dropped.
+TURN_CACHE_MAX_ENTRIES = 4
+_turn_kv_cache = OrderedDict()
+
+# Speculative decoding statistics of the most recent assisted generate_verilog call
+last_assisted_generation_stats = {}
+
+# Throughput metrics (prefill, TTFT, decode tok/s, tokens, peak memory) of the most recent generate_verilog call
+last_generation_metrics = {}
+
+def load_model_and_tokenizer(model_name_or_path, use_quantization=None, torch_dtype=None, cpu_profile=None, keep=()):
+    """
+    Loads (or returns the cached) model and tokenizer. `torch_dtype` defaults to bfloat16 on
+    GPUs that support it and float16 otherwise. Loading a new model first evicts least
+    recently used models until its estimated size fits into MODEL_CACHE_MAX_BYTES; models
+    still in use (the `keep` model cache keys) are never evicted.
 
-# Global cache to avoid reloading models and tokenizers unnecessarily
-_model_cache = {}
-_tokenizer_cache = {}
+    Without CUDA the model is loaded with the CPU execution profile instead (see
+    cpu_profile.DEFAULT_CPU_PROFILE, overridden by the `cpu_profile` dict): float32 or
+    bfloat16 depending on the CPU, explicit thread counts, optional dynamic int8
+    quantization and torch.compile.
+    """
+    on_cpu = not torch.cuda.is_available()
+    if on_cpu:
+        profile = resolve_cpu_profile(cpu_profile)
+        if use_quantization in ("8bit", "4bit"):
+            print(f"Warning: {use_quantization} quantization needs CUDA (bitsandbytes); loading without it on CPU.")
+            use_quantization = None
+        if profile["dynamic_int8"]:
+            use_quantization = "dynamic_int8"
+        configure_cpu_threads(profile["intra_op_threads"], profile["inter_op_threads"])
+    if torch_dtype is None:
+        if on_cpu:
+            torch_dtype = choose_cpu_dtype(profile)
+        else:
+            torch_dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+    # The parts of the CPU profile applied to the model object itself
+    applied_profile = {name: profile[name] for name in ("dynamic_int8", "torch_compile")} if on_cpu else None
+    cache_key = (model_name_or_path, use_quantization, str(torch_dtype),
+                 tuple(sorted(applied_profile.items())) if applied_profile else None)
+    if cache_key in _model_cache:
+        _model_cache.move_to_end(cache_key)
+        entry = _model_cache[cache_key]
+        return entry["model"], entry["tokenizer"]
 
-def load_model_and_tokenizer(model_name_or_path, use_quantization=None):
-    if model_name_or_path in _model_cache:
-        return _model_cache[model_name_or_path], _tokenizer_cache[model_name_or_path]
+    _evict_models(MODEL_CACHE_MAX_BYTES - (_estimate_model_bytes(model_name_or_path, use_quantization) or 0), keep=keep)
 
     print(f"Loading tokenizer for {model_name_or_path}...")
     # Qwen models often require trust_remote_code=True
@@ -25,8 +102,8 @@ def load_model_and_tokenizer(model_name_or_path, use_quantization=None):
 
     model = AutoModelForCausalLM.from_pretrained(
         model_name_or_path,
-        device_map="auto",  # Uses accelerate to distribute model across GPUs/CPU if needed
-        torch_dtype=torch.bfloat16 if torch.cuda.is_available() and torch.cuda.is_bf16_supported() else torch.float16, # Or "auto"
+        device_map="cpu" if on_cpu else "auto",  # Uses accelerate to distribute model across GPUs/CPU if needed
+        torch_dtype=torch_dtype,
         trust_remote_code=True,
         **quant_config
     )
@@ -45,74 +122,662 @@ def load_model_and_tokenizer(model_name_or_path, use_quantization=None):
 
     print(f"Model {model_name_or_path} loaded on device(s): {model.hf_device_map if hasattr(model, 'hf_device_map') else model.device}")
 
-    _model_cache[model_name_or_path] = model
-    _tokenizer_cache[model_name_or_path] = tokenizer
+    # Measured before int8 quantization, whose packed weights are not parameters (an upper bound)
+    param_bytes = _model_param_bytes(model)
+    if on_cpu:
+        model = apply_cpu_profile(model, profile)
+    # Everything besides the checkpoint that changes the outputs, part of the generation cache key
+    model.llm_verilog_variant = {
+        "quantization": use_quantization,
+        "torch_dtype": str(torch_dtype),
+        "cpu_profile": applied_profile,
+    }
+    _model_cache[cache_key] = {"model": model, "tokenizer": tokenizer, "param_bytes": param_bytes}
+    print(f"INFO [model_cache]: {model_name_or_path} uses {param_bytes / 1024**3:.1f} GiB of parameter memory.")
+    _evict_models(MODEL_CACHE_MAX_BYTES, keep=(cache_key, *keep))
     return model, tokenizer
 
-def generate_verilog(model, tokenizer, prompt_text, max_new_tokens=8192, temperature=0.7):
+def _model_param_bytes(model):
+    """Memory held by the model's parameters and buffers (quantized weights included)."""
+    if hasattr(model, "get_memory_footprint"):
+        return model.get_memory_footprint()
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+def _estimate_model_bytes(model_name_or_path, use_quantization=None):
+    """Estimates the parameter memory of a local checkpoint from its weight files (None if unknown)."""
+    if not os.path.isdir(model_name_or_path):
+        return None
+    weight_files = glob.glob(os.path.join(model_name_or_path, "*.safetensors")) or glob.glob(os.path.join(model_name_or_path, "*.bin"))
+    if not weight_files:
+        return None
+    checkpoint_bytes = sum(os.path.getsize(f) for f in weight_files)
+    # Checkpoints are usually stored in 16 bit
+    return checkpoint_bytes // {"8bit": 2, "4bit": 4}.get(use_quantization, 1)
+
+def _evict_models(max_bytes, keep=()):
+    """Evicts least recently used models (except the `keep` keys) until the cached parameter memory fits into `max_bytes`."""
+    evicted = False
+    while sum(entry["param_bytes"] for entry in _model_cache.values()) > max_bytes:
+        candidates = [key for key in _model_cache if key not in keep]
+        if not candidates:
+            break
+        key = candidates[0]
+        entry = _model_cache.pop(key)
+        print(f"INFO [model_cache]: Evicting {key[0]} (quantization={key[1]}, dtype={key[2]}, "
+              f"{entry['param_bytes'] / 1024**3:.1f} GiB) to stay within {max(max_bytes, 0) / 1024**3:.1f} GiB.")
+        # Prefilled prompt caches of the evicted model would keep its device memory alive
+        for kv_cache in (_prefix_kv_cache, _turn_kv_cache):
+            for prefix_key in [k for k in kv_cache if k[0] == id(entry["model"])]:
+                del kv_cache[prefix_key]
+        forget_prompt_renderers(entry["tokenizer"])
+        del entry
+        evicted = True
+    if evicted:
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+def clear_model_cache():
+    """Drops every cached model and tokenizer and frees their memory."""
+    _evict_models(-1)
+
+def loaded_models():
+    """Describes the cached models, least recently used first."""
+    return [{"model": key[0], "quantization": key[1], "dtype": key[2], "cpu_profile": dict(key[3]) if key[3] else None,
+             "param_bytes": entry["param_bytes"]}
+            for key, entry in _model_cache.items()]
+
+
+def generate_verilog(model, tokenizer, prompt_text, max_new_tokens=8192, temperature=0.7, top_p=0.95,
+                     seed=None, shared_prefix=None, stop_on_module_complete=True,
+                     use_generation_cache=True, assistant_model=None, return_metrics=False,
+                     constrain_verilog2001=False, keep_kv_cache=False):
     """
     Generates Verilog code using the provided model, tokenizer, and prompt.
 
+    Returns the decoded output string; `generate_verilog_samples` samples several outputs
+    of one prompt for pass@k. Passing `seed` makes runs reproducible.
+
+    `shared_prefix` is an optional leading part of `prompt_text` that many prompts have
+    in common (e.g. the rendered system instruction). Its KV cache is computed once,
+    kept in a bounded LRU and reused, so only the unique suffix of the prompt is prefilled.
+
+    With `stop_on_module_complete` (default) the decoded text is tracked while it is
+    generated and decoding stops once the module is balanced and its code fence closed,
+    instead of letting chatty models run on to `max_new_tokens`.
+
+    Reproducible requests (a fixed `seed`, or greedy decoding) are looked up in the
+    on-disk generation cache first and only reach the model on a miss.
+
+    `assistant_model` enables speculative (assisted) decoding with a small draft model
+    that shares the tokenizer (see `load_draft_model`). The target model verifies every
+    drafted token, so the output distribution is unchanged; acceptance statistics are
+    printed and kept in `last_assisted_generation_stats`.
+
+    `constrain_verilog2001` adds a Verilog2001LogitsProcessor that bans SystemVerilog-only
+    keywords (`logic`, `always_ff`, `int`, ...) in the code and any prose after the code
+    fence closes, so iverilog does not reject the output for syntax it cannot parse.
+    Cannot be combined with `assistant_model`.
+
+    `keep_kv_cache` is meant for multi-turn conversations such as compiler-feedback repair:
+    the KV cache of the finished sequence (prompt + output) is kept, and the next call whose
+    prompt continues that conversation only prefills its new tokens. Not supported with
+    `assistant_model`.
+
+    Every call measures prefill time, time to first token, decode tokens/sec, input and
+    output token counts (plus the input tokens served from a kept KV cache) and peak
+    memory. The record is printed, kept
+    in `last_generation_metrics` and, with `return_metrics=True`, returned as
+    (output, metrics) so callers can log it next to their results.
+
     IMPORTANT: The prompt_text formatting is CRITICAL for instruct-tuned models
-    like Qwen-Coder-Instruct. You MUST consult the model's documentation/card
-    on Hugging Face for the correct chat/instruction template.
-    """
-
-    # --- THIS IS A CRITICAL SECTION ---
-    # The input to the model needs to be formatted according to its specific requirements.
-    # For Qwen-Instruct models, this usually involves a chat template.
-    # Example (you MUST verify and adapt this for Qwen2.5-Coder-32B-Instruct):
-    # messages = [
-    #     {"role": "system", "content": "You are an expert Verilog HDL code generation assistant."},
-    #     {"role": "user", "content": f"Generate the Verilog code for the following task:\n{prompt_text}"}
-    # ]
-    # For some code completion models, you might directly feed the `prompt_text` if it's a code prefix.
-    # For Qwen2 Instruct series, it's likely a chat template:
-    # input_text_for_model = tokenizer.apply_chat_template(
-    #     messages,
-    #     tokenize=False,
-    #     add_generation_prompt=True # Important for instructing the model to generate
-    # )
-    # For now, let's assume prompt_text IS the fully formatted input the model expects:
-    #input_text_for_model = prompt_text # <<< REPLACE THIS WITH CORRECT QWEN TEMPLATING
-
-    # Qwen2.5 formatting start
-    prompt = "You are an expert Verilog HDL code generation assistant."
-    messages = [
-        {"role": "system", "content": "You are Qwen, created by Alibaba Cloud. You are a helpful assistant."},
-        {"role": "user", "content": prompt}
-    ]
-    text = tokenizer.apply_chat_template(
-        messages,
-        tokenize=False,
-        add_generation_prompt=True
+    like Qwen-Coder-Instruct. Render it with the model's chat template, preferably via
+    prompt_renderer.get_prompt_renderer(tokenizer).render(...), whose prompts carry
+    their token ids so they are not tokenized again here.
+    """
+    return _measured_generation(
+        model, tokenizer, prompt_text, return_metrics, max_new_tokens=max_new_tokens, temperature=temperature,
+        top_p=top_p, num_samples=None, seed=seed, shared_prefix=shared_prefix,
+        stop_on_module_complete=stop_on_module_complete, use_generation_cache=use_generation_cache,
+        assistant_model=assistant_model, constrain_verilog2001=constrain_verilog2001, keep_kv_cache=keep_kv_cache
+    )
+
+def generate_verilog_samples(model, tokenizer, prompt_text, num_samples, max_new_tokens=8192, temperature=0.7,
+                             top_p=0.95, seed=None, shared_prefix=None, stop_on_module_complete=True,
+                             use_generation_cache=True, return_metrics=False, constrain_verilog2001=False):
+    """
+    Samples `num_samples` outputs of one prompt (for pass@k). The prompt is prefilled once
+    and the continuations are sampled in parallel, sample i with its own seed `seed + i`
+    (`seed` is drawn at random when None), as in every backend. Always returns a list of
+    per-sample dicts {"output", "output_tokens", "tokens_saved", "seed", "sample_index"} where
+    "seed" is that sample's seed. The other options, the generation cache and the metrics
+    (summed over samples) are those of `generate_verilog`.
+    """
+    return _measured_generation(
+        model, tokenizer, prompt_text, return_metrics, max_new_tokens=max_new_tokens, temperature=temperature,
+        top_p=top_p, num_samples=num_samples, seed=seed, shared_prefix=shared_prefix,
+        stop_on_module_complete=stop_on_module_complete, use_generation_cache=use_generation_cache,
+        assistant_model=None, constrain_verilog2001=constrain_verilog2001, keep_kv_cache=False
+    )
+
+def _measured_generation(model, tokenizer, prompt_text, return_metrics, **generate_kwargs):
+    """Runs _generate_verilog and records its metrics (see generate_verilog)."""
+    metrics = GenerationMetrics(model)
+    with metrics:
+        output = _generate_verilog(model, tokenizer, prompt_text, metrics, **generate_kwargs)
+    assistant_model = generate_kwargs["assistant_model"]
+    record = metrics.as_record(
+        model=getattr(model, 'name_or_path', None), max_new_tokens=generate_kwargs["max_new_tokens"],
+        temperature=generate_kwargs["temperature"], top_p=generate_kwargs["top_p"],
+        num_samples=generate_kwargs["num_samples"] or 1, seed=generate_kwargs["seed"],
+        assistant_model=getattr(assistant_model, 'name_or_path', None),
+        constrain_verilog2001=generate_kwargs["constrain_verilog2001"]
     )
-    # Qwen2.5 formatting end
-    # Currently formatting seems to be done correctly at the run_experiment.py stage
+    last_generation_metrics.clear()
+    last_generation_metrics.update(record)
+    print(f"INFO [generate_verilog]: {format_metrics_summary(record)}")
+    return (output, record) if return_metrics else output
+
+def _generate_verilog(model, tokenizer, prompt_text, metrics, max_new_tokens=8192, temperature=0.7, top_p=0.95,
+                      num_samples=None, seed=None, shared_prefix=None, stop_on_module_complete=True,
+                      use_generation_cache=True, assistant_model=None, constrain_verilog2001=False,
+                      keep_kv_cache=False):
+    """
+    Body of generate_verilog (num_samples=None, returns the output string) and of
+    generate_verilog_samples (returns the sample dicts). Token counts and the cache-hit
+    flag are recorded on `metrics`.
+    """
+
+    # prompt_text is already formatted with the model's chat template (see prompt_renderer)
     input_text_for_model = prompt_text
 
     print("\n--- Input to LLM (first 500 chars) ---")
     print(input_text_for_model[:500])
     print("-------------------------------------\n")
     
-    model_inputs = tokenizer([input_text_for_model], return_tensors="pt", padding=True).to(model.device if hasattr(model, 'device') else "cuda")
+    if assistant_model is not None and constrain_verilog2001:
+        raise ValueError("constrain_verilog2001 cannot be combined with assistant_model")
+    if keep_kv_cache and assistant_model is not None:
+        raise ValueError("keep_kv_cache cannot be combined with assistant_model")
 
+    # Only reproducible generations can be served from the cache
+    cache_key = None
+    if use_generation_cache and (seed is not None or temperature <= 0):
+        generation_cache = get_default_generation_cache()
+        cache_key = generation_cache_key(
+            getattr(model, 'name_or_path', None), model_revision(model), input_text_for_model,
+            max_new_tokens, temperature, top_p, seed,
+            num_samples=num_samples, stop_on_module_complete=stop_on_module_complete,
+            assistant_model=getattr(assistant_model, 'name_or_path', None), constrain_verilog2001=constrain_verilog2001,
+            **({"sample_seeds": "per_sample"} if num_samples is not None else {}), **_model_variant(model)
+        )
+        cached = generation_cache.get(cache_key)
+        if cached is not None:
+            print(f"INFO [generate_verilog]: Generation cache hit ({cache_key[:12]}), skipping the model.")
+            metrics.cache_hit = True
+            metrics.input_tokens = cached.get("input_tokens", 0)
+            metrics.output_tokens = cached.get("output_tokens", 0)
+            return cached["output"]
 
-    generated_ids = model.generate(
-        model_inputs.input_ids,
-        attention_mask=model_inputs.attention_mask, # Include attention mask if padding
-        max_new_tokens=max_new_tokens,
-        temperature=temperature,
-        top_p=0.95, # Common value for top_p
-        pad_token_id=tokenizer.pad_token_id,
-        eos_token_id=tokenizer.eos_token_id,
-        do_sample=True if temperature > 0 else False # do_sample must be true for temperature to have effect
-    )
+    model_inputs = _tokenize_prompt(model, tokenizer, input_text_for_model)
+    metrics.input_tokens = model_inputs.input_ids.shape[1]
+
+    shared_prefix_len = 0
+    if shared_prefix:
+        shared_prefix_len = _shared_prefix_token_len(tokenizer, shared_prefix, model_inputs.input_ids)
+
+    if num_samples is not None:
+        samples = _generate_samples_from_single_prefill(
+            model, tokenizer, model_inputs, num_samples, seed,
+            max_new_tokens=max_new_tokens, temperature=temperature, top_p=top_p,
+            shared_prefix_len=shared_prefix_len, stop_on_module_complete=stop_on_module_complete,
+            metrics=metrics, constrain_verilog2001=constrain_verilog2001
+        )
+        metrics.output_tokens = sum(sample["output_tokens"] for sample in samples)
+        if cache_key is not None:
+            generation_cache.put(cache_key, {
+                "output": samples,
+                "input_tokens": model_inputs.input_ids.shape[1],
+                "output_tokens": metrics.output_tokens,
+            })
+        return samples
+
+    if seed is not None:
+        set_seed(seed)
+
+    prompt_cache = None
+    if keep_kv_cache:
+        prompt_cache, metrics.cached_input_tokens = _get_turn_kv_cache(model, model_inputs.input_ids)
+    # Assisted decoding manages the KV caches of both models itself
+    if prompt_cache is None and shared_prefix_len > 0 and assistant_model is None:
+        with metrics.prompt_prefill():
+            prompt_cache = _prefill_prompt_cache(model, model_inputs.input_ids, model_inputs.attention_mask, shared_prefix_len)
+
+    assist_kwargs = {}
+    target_counter = draft_counter = None
+    if assistant_model is not None:
+        assist_kwargs = {"assistant_model": assistant_model}
+        target_counter = ForwardCallCounter(model)
+        draft_counter = ForwardCallCounter(assistant_model)
+
+    stop_criteria, stop_kwargs = _module_stopping(tokenizer, stop_on_module_complete, metrics)
+    constraint, constraint_kwargs = _verilog2001_constraint(model, tokenizer, constrain_verilog2001)
+    with (target_counter or nullcontext()), (draft_counter or nullcontext()):
+        generated_ids = model.generate(
+            model_inputs.input_ids,
+            attention_mask=model_inputs.attention_mask, # Include attention mask if padding
+            past_key_values=prompt_cache, # None = regular full prefill
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            pad_token_id=tokenizer.pad_token_id,
+            eos_token_id=tokenizer.eos_token_id,
+            do_sample=True if temperature > 0 else False, # do_sample must be true for temperature to have effect
+            return_dict_in_generate=keep_kv_cache, # Also returns the final KV cache
+            **assist_kwargs,
+            **stop_kwargs,
+            **constraint_kwargs
+        )
+    if keep_kv_cache:
+        _put_turn_kv_cache(model, generated_ids.sequences, generated_ids.past_key_values)
+        generated_ids = generated_ids.sequences
+    _report_early_stop(stop_criteria, max_new_tokens)
+    _report_constraint(constraint)
 
     # Decode only the newly generated tokens (excluding the prompt)
     input_token_len = model_inputs.input_ids.shape[1]
     output_tokens = generated_ids[0][input_token_len:]
+    metrics.output_tokens = _count_generated_tokens(output_tokens, tokenizer)
+
+    if assistant_model is not None:
+        last_assisted_generation_stats.clear()
+        last_assisted_generation_stats.update(assisted_generation_stats(
+            metrics.output_tokens, target_counter.calls, draft_counter.calls))
+        print(f"INFO [generate_verilog]: Assisted decoding accepted "
+              f"{last_assisted_generation_stats['acceptance_rate']:.1%} of drafted tokens, "
+              f"{last_assisted_generation_stats['tokens_per_target_pass']:.2f} tokens per target forward pass.")
     
     decoded_output = tokenizer.decode(output_tokens, skip_special_tokens=True)
+
+    if cache_key is not None:
+        generation_cache.put(cache_key, {
+            "output": decoded_output,
+            "input_tokens": input_token_len,
+            "output_tokens": metrics.output_tokens,
+        })
     
-    return decoded_output
\ No newline at end of file
+    return decoded_output
+
+def _tokenize_prompt(model, tokenizer, prompt_text):
+    """Tokenizes one prompt, reusing the token ids of a prompt_renderer.RenderedPrompt when it has them."""
+    device = model.device if hasattr(model, 'device') else "cuda"
+    token_ids = getattr(prompt_text, "token_ids", None)
+    if token_ids is None:
+        return tokenizer([prompt_text], return_tensors="pt", padding=True).to(device)
+    input_ids = torch.tensor([token_ids], device=device)
+    return BatchEncoding({"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)})
+
+def load_draft_model(draft_model_name_or_path, target_tokenizer, use_quantization=None):
+    """
+    Loads a small draft model for assisted generation (e.g. Qwen2.5-Coder-7B for the 32B
+    checkpoint) and checks that it shares the target model's tokenizer.
+    """
+    # Making room for the draft model must not evict the target model it will assist
+    target_keys = tuple(key for key, entry in _model_cache.items() if entry["tokenizer"] is target_tokenizer)
+    draft_model, draft_tokenizer = load_model_and_tokenizer(draft_model_name_or_path, use_quantization=use_quantization,
+                                                            keep=target_keys)
+    check_tokenizers_compatible(target_tokenizer, draft_tokenizer)
+    return draft_model
+
+def benchmark_assisted_generation(model, tokenizer, assistant_model, prompt_text, seed=0, **generate_kwargs):
+    """
+    Generates the same prompt with and without the draft model (generation cache disabled)
+    and returns the wall-clock speedup together with the assisted decoding statistics.
+    """
+    start = time.perf_counter()
+    generate_verilog(model, tokenizer, prompt_text, seed=seed, use_generation_cache=False, **generate_kwargs)
+    baseline_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    generate_verilog(model, tokenizer, prompt_text, seed=seed, use_generation_cache=False,
+                     assistant_model=assistant_model, **generate_kwargs)
+    assisted_seconds = time.perf_counter() - start
+
+    result = dict(last_assisted_generation_stats)
+    result.update({
+        "baseline_seconds": baseline_seconds,
+        "assisted_seconds": assisted_seconds,
+        "speedup": baseline_seconds / assisted_seconds if assisted_seconds > 0 else 0.0,
+    })
+    print(f"INFO [benchmark_assisted_generation]: {baseline_seconds:.1f}s -> {assisted_seconds:.1f}s "
+          f"(speedup {result['speedup']:.2f}x, acceptance rate {result['acceptance_rate']:.1%}).")
+    return result
+
+def _module_stopping(tokenizer, enabled, metrics=None):
+    """
+    Builds the streamer + stopping criteria pair that ends generation once the Verilog
+    module is complete. Returns (criteria or None, extra kwargs for model.generate).
+    With `metrics`, its first-token timing streamer is attached as well.
+    """
+    timing_streamer = metrics.streamer() if metrics is not None else None
+    if not enabled:
+        return None, ({"streamer": timing_streamer} if timing_streamer is not None else {})
+    streamer = VerilogCompletionStreamer(tokenizer)
+    stop_criteria = ModuleCompleteStoppingCriteria(streamer)
+    return stop_criteria, {"streamer": StreamerGroup(streamer, timing_streamer),
+                           "stopping_criteria": StoppingCriteriaList([stop_criteria])}
+
+def _report_early_stop(stop_criteria, max_new_tokens):
+    """Prints and returns the per-sequence early-stop statistics of one generate call."""
+    if stop_criteria is None:
+        return []
+    stats = stop_criteria.report(max_new_tokens)
+    for row, row_stats in enumerate(stats):
+        if row_stats["stopped_early"]:
+            print(f"INFO [generate_verilog]: Sequence {row} stopped on completed module after "
+                  f"{row_stats['generated_tokens']} tokens, saving up to {row_stats['tokens_saved']} "
+                  f"of max_new_tokens={max_new_tokens}.")
+    return stats
+
+def _verilog2001_constraint(model, tokenizer, enabled):
+    """Builds the Verilog-2001 logits processor. Returns (processor or None, extra kwargs for model.generate)."""
+    if not enabled:
+        return None, {}
+    eos_token_ids = getattr(getattr(model, "generation_config", None), "eos_token_id", None) or tokenizer.eos_token_id
+    processor = Verilog2001LogitsProcessor(tokenizer, eos_token_ids=eos_token_ids)
+    return processor, {"logits_processor": LogitsProcessorList([processor])}
+
+def _report_constraint(processor):
+    if processor is None or not any(processor.interventions):
+        return
+    print(f"INFO [generate_verilog]: Verilog-2001 constraint overrode the model's top token "
+          f"{sum(processor.interventions)} time(s) (per sequence: {processor.interventions}).")
+
+def _shared_prefix_token_len(tokenizer, shared_prefix, input_ids):
+    """
+    Returns how many leading tokens of `input_ids` belong to `shared_prefix`. Tokens are
+    compared one by one because a merge across the prefix boundary can change the last
+    prefix token. At least one prompt token is always left for `model.generate`.
+    """
+    prefix_ids = tokenizer(shared_prefix, return_tensors="pt").input_ids[0].tolist()
+    prompt_ids = input_ids[0].tolist()
+    common_len = _common_prefix_len(prefix_ids, prompt_ids)
+    if common_len < len(prefix_ids):
+        print(f"Warning [generate_verilog]: Only {common_len}/{len(prefix_ids)} shared prefix tokens match the prompt.")
+    return min(common_len, len(prompt_ids) - 1)
+
+def _common_prefix_len(ids_a, ids_b):
+    common_len = 0
+    for token_a, token_b in zip(ids_a, ids_b):
+        if token_a != token_b:
+            break
+        common_len += 1
+    return common_len
+
+def _model_variant(model):
+    """Quantization, dtype and CPU profile of a loaded model (see load_model_and_tokenizer)."""
+    variant = dict(getattr(model, "llm_verilog_variant", None) or {"quantization": None, "cpu_profile": None})
+    variant["torch_dtype"] = str(getattr(model, "dtype", variant.get("torch_dtype")))
+    return variant
+
+def _get_prefix_kv_cache(model, prefix_ids):
+    """
+    Returns a private copy of the KV cache for `prefix_ids` (shape [1, n]), computing it
+    on a miss. Entries are evicted least-recently-used beyond PREFIX_CACHE_MAX_ENTRIES.
+    """
+    # Keyed by the model object: variants of one checkpoint (quantization, dtype) have different KV tensors
+    cache_key = (id(model), tuple(prefix_ids[0].tolist()))
+    if cache_key in _prefix_kv_cache:
+        _prefix_kv_cache.move_to_end(cache_key)
+        print(f"INFO [prefix_cache]: Hit for {prefix_ids.shape[1]}-token prefix.")
+    else:
+        print(f"INFO [prefix_cache]: Miss, prefilling {prefix_ids.shape[1]}-token prefix.")
+        with torch.no_grad():
+            _prefix_kv_cache[cache_key] = model(prefix_ids, past_key_values=DynamicCache(), use_cache=True).past_key_values
+        while len(_prefix_kv_cache) > PREFIX_CACHE_MAX_ENTRIES:
+            _prefix_kv_cache.popitem(last=False)
+    # generate() appends to the cache in place, so callers always get their own copy
+    return copy.deepcopy(_prefix_kv_cache[cache_key])
+
+def _get_turn_kv_cache(model, input_ids):
+    """
+    Returns (private copy of the kept turn KV cache sharing the most leading tokens with
+    `input_ids`, cropped to those tokens, their count), or (None, 0) if no turn matches.
+    At least one prompt token is always left for `model.generate`.
+    """
+    model_key = id(model)
+    prompt_ids = input_ids[0].tolist()
+    best_key, best_len = None, 0
+    for cache_key in _turn_kv_cache:
+        if cache_key[0] == model_key:
+            common_len = _common_prefix_len(cache_key[1], prompt_ids)
+            if common_len > best_len:
+                best_key, best_len = cache_key, common_len
+    best_len = min(best_len, len(prompt_ids) - 1)
+    if best_key is None or best_len <= 0:
+        print(f"INFO [turn_cache]: Miss, prefilling all {len(prompt_ids)} prompt tokens.")
+        return None, 0
+    _turn_kv_cache.move_to_end(best_key)
+    prompt_cache = copy.deepcopy(_turn_kv_cache[best_key])
+    prompt_cache.crop(best_len)
+    print(f"INFO [turn_cache]: Hit, reusing {best_len} tokens of a previous turn and prefilling "
+          f"{len(prompt_ids) - best_len} new tokens.")
+    return prompt_cache, best_len
+
+def _put_turn_kv_cache(model, sequences, kv_cache):
+    """Keeps the KV cache returned by `model.generate` for the tokens of `sequences` (shape [1, n]) it covers."""
+    model_key = id(model)
+    token_ids = tuple(sequences[0, :kv_cache.get_seq_length()].tolist())
+    # Earlier turns of the same conversation are prefixes of this one and no longer needed
+    for cache_key in [k for k in _turn_kv_cache if k[0] == model_key and token_ids[:len(k[1])] == k[1]]:
+        del _turn_kv_cache[cache_key]
+    _turn_kv_cache[(model_key, token_ids)] = kv_cache
+    while len(_turn_kv_cache) > TURN_CACHE_MAX_ENTRIES:
+        _turn_kv_cache.popitem(last=False)
+
+def clear_prefix_cache():
+    """Drops all cached prefix and turn KV caches (e.g. before switching models)."""
+    _prefix_kv_cache.clear()
+    _turn_kv_cache.clear()
+
+def _prefill_prompt_cache(model, input_ids, attention_mask, shared_prefix_len=0):
+    """
+    Builds a KV cache covering all prompt tokens except the last one, starting from the
+    cached shared prefix when `shared_prefix_len` > 0 so only the unique suffix is prefilled.
+    """
+    if shared_prefix_len > 0:
+        prompt_cache = _get_prefix_kv_cache(model, input_ids[:, :shared_prefix_len])
+    else:
+        prompt_cache = DynamicCache()
+    if shared_prefix_len < input_ids.shape[1] - 1:
+        with torch.no_grad():
+            prompt_cache = model(
+                input_ids[:, shared_prefix_len:-1],
+                attention_mask=attention_mask[:, :-1],
+                past_key_values=prompt_cache,
+                use_cache=True
+            ).past_key_values
+    return prompt_cache
+
+class PerSampleSeedSampler(LogitsProcessor):
+    """
+    Samples the next token of every batch row from its own torch.Generator, seeded with
+    `seeds[row]`, and masks all other tokens so the greedy step of `model.generate`
+    (do_sample=False) takes it. Sample i of a shared-prefill batch thus only depends on its
+    own seed, not on the batch it ran in. Applies temperature, top_k and top_p itself.
+    """
+    def __init__(self, seeds, temperature, top_p=1.0, top_k=None):
+        self.seeds = list(seeds)
+        self.temperature = temperature
+        self.top_p = top_p
+        self.top_k = top_k
+        self.generators = None
+
+    def __call__(self, input_ids, scores):
+        if self.generators is None:
+            # On the device of the logits (the last device with device_map="auto")
+            self.generators = [torch.Generator(device=scores.device).manual_seed(seed) for seed in self.seeds]
+        probs = torch.softmax(scores.float() / self.temperature, dim=-1)
+        if self.top_k:
+            kth_probs = probs.topk(min(self.top_k, probs.shape[-1]), dim=-1).values[:, -1:]
+            probs[probs < kth_probs] = 0.0
+        if self.top_p < 1.0:
+            sorted_probs, sorted_idx = probs.sort(dim=-1, descending=True)
+            cumulative = sorted_probs.cumsum(dim=-1)
+            # Keep the smallest prefix whose mass reaches top_p (always at least one token)
+            sorted_probs[(cumulative - sorted_probs) > self.top_p * cumulative[:, -1:]] = 0.0
+            probs = torch.zeros_like(probs).scatter(-1, sorted_idx, sorted_probs)
+        next_tokens = torch.cat([torch.multinomial(probs[row], 1, generator=generator)
+                                 for row, generator in enumerate(self.generators)])
+        masked = torch.full_like(scores, -float("inf"))
+        masked[torch.arange(len(next_tokens), device=scores.device), next_tokens] = 0.0
+        return masked
+
+def _generate_samples_from_single_prefill(model, tokenizer, model_inputs, num_samples, seed,
+                                          max_new_tokens=8192, temperature=0.7, top_p=0.95, shared_prefix_len=0,
+                                          stop_on_module_complete=True, metrics=None, constrain_verilog2001=False):
+    """
+    Samples `num_samples` continuations of one prompt while running the prompt prefill only once.
+
+    All prompt tokens except the last are pushed through the model a single time; the
+    resulting KV cache is repeated `num_samples` times along the batch dimension and
+    `model.generate` only has to process the final prompt token for every sample.
+    Sample i is drawn with seed + i (PerSampleSeedSampler), like the sample batches of the
+    other backends. Returns a list of dicts: {"output", "output_tokens", "tokens_saved", "seed", "sample_index"}.
+    """
+    if temperature <= 0 and num_samples > 1:
+        print(f"Warning [generate_verilog]: num_samples={num_samples} with temperature={temperature} "
+              "uses greedy decoding, so all samples will be identical.")
+    if seed is None:
+        # Always record a seed so every sample of the sweep can be reproduced later
+        seed = random.randint(0, 2**31 - 1)
+
+    input_ids = model_inputs.input_ids
+    attention_mask = model_inputs.attention_mask
+    with (metrics.prompt_prefill() if metrics is not None else nullcontext()):
+        prompt_cache = _prefill_prompt_cache(model, input_ids, attention_mask, shared_prefix_len)
+    prompt_cache.batch_repeat_interleave(num_samples)
+    print(f"INFO [generate_verilog]: Prefilled {input_ids.shape[1]} prompt tokens once, "
+          f"sampling {num_samples} continuations in parallel (seeds {seed}..{seed + num_samples - 1}).")
+
+    stop_criteria, stop_kwargs = _module_stopping(tokenizer, stop_on_module_complete, metrics)
+    constraint, constraint_kwargs = _verilog2001_constraint(model, tokenizer, constrain_verilog2001)
+    logits_processor = constraint_kwargs.get("logits_processor", LogitsProcessorList())
+    if temperature > 0:
+        # After the constraint, so banned tokens are never sampled
+        logits_processor.append(PerSampleSeedSampler(
+            [seed + i for i in range(num_samples)], temperature, top_p,
+            top_k=getattr(getattr(model, "generation_config", None), "top_k", None)))
+    generated_ids = model.generate(
+        input_ids.repeat(num_samples, 1),
+        attention_mask=attention_mask.repeat(num_samples, 1),
+        past_key_values=prompt_cache,
+        max_new_tokens=max_new_tokens,
+        pad_token_id=tokenizer.pad_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        do_sample=False, # Sampling happens in PerSampleSeedSampler
+        logits_processor=logits_processor,
+        **stop_kwargs
+    )
+    stop_stats = _report_early_stop(stop_criteria, max_new_tokens)
+    _report_constraint(constraint)
+
+    input_token_len = input_ids.shape[1]
+    samples = []
+    for sample_index in range(num_samples):
+        output_tokens = generated_ids[sample_index][input_token_len:]
+        samples.append({
+            "output": tokenizer.decode(output_tokens, skip_special_tokens=True),
+            "output_tokens": _count_generated_tokens(output_tokens, tokenizer),
+            "tokens_saved": stop_stats[sample_index]["tokens_saved"] if stop_stats else 0,
+            "seed": seed + sample_index,
+            "sample_index": sample_index,
+        })
+    return samples
+
+def _count_generated_tokens(output_tokens, tokenizer):
+    """
+    Counts the generated tokens of one sequence up to and including the first
+    EOS token. Anything after that is padding added by batched generation.
+    """
+    token_list = output_tokens.tolist()
+    stop_ids = {tokenizer.eos_token_id, tokenizer.pad_token_id} - {None}
+    for i, token_id in enumerate(token_list):
+        if token_id in stop_ids:
+            return i + 1 if token_id == tokenizer.eos_token_id else i
+    return len(token_list)
+
+def _bucket_prompts_by_length(prompt_lengths, batch_size, bucket_width):
+    """
+    Groups prompt indices into batches of similar token length so that left padding
+    wastes as little compute as possible. Prompts are sorted by length, split into
+    buckets of `bucket_width` tokens, and each bucket is chunked into `batch_size` batches.
+    Returns a list of lists of prompt indices.
+    """
+    buckets = {}
+    for idx in sorted(range(len(prompt_lengths)), key=lambda i: prompt_lengths[i]):
+        buckets.setdefault(prompt_lengths[idx] // bucket_width, []).append(idx)
+
+    batches = []
+    for bucket_key in sorted(buckets):
+        bucket = buckets[bucket_key]
+        for start in range(0, len(bucket), batch_size):
+            batches.append(bucket[start:start + batch_size])
+    return batches
+
+def generate_verilog_batch(model, tokenizer, prompts, max_new_tokens=8192, temperature=0.7,
+                           top_p=0.95, batch_size=8, bucket_width=256, stop_on_module_complete=True):
+    """
+    Generates Verilog code for several fully formatted prompts at once.
+
+    Prompts are grouped into token-length buckets, left-padded and sent through
+    `model.generate` one batch at a time. Results are returned in the same order as
+    `prompts`, one dict per prompt:
+        {"output": decoded text, "input_tokens": int, "output_tokens": int, "tokens_saved": int}
+    """
+    if not prompts:
+        return []
+
+    prompt_lengths = [len(ids) for ids in tokenizer(list(prompts), add_special_tokens=False).input_ids]
+    batches = _bucket_prompts_by_length(prompt_lengths, batch_size, bucket_width)
+    print(f"INFO [generate_verilog_batch]: {len(prompts)} prompt(s) grouped into {len(batches)} batch(es) "
+          f"(batch_size={batch_size}, bucket_width={bucket_width} tokens).")
+
+    results = [None] * len(prompts)
+    # Decoder-only models must be left-padded so that generation continues directly after each prompt
+    original_padding_side = tokenizer.padding_side
+    tokenizer.padding_side = "left"
+    try:
+        for batch_indices in batches:
+            batch_prompts = [prompts[i] for i in batch_indices]
+            model_inputs = tokenizer(batch_prompts, return_tensors="pt", padding=True).to(model.device if hasattr(model, 'device') else "cuda")
+
+            stop_criteria, stop_kwargs = _module_stopping(tokenizer, stop_on_module_complete)
+            generated_ids = model.generate(
+                model_inputs.input_ids,
+                attention_mask=model_inputs.attention_mask,
+                max_new_tokens=max_new_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                pad_token_id=tokenizer.pad_token_id,
+                eos_token_id=tokenizer.eos_token_id,
+                do_sample=True if temperature > 0 else False,
+                **stop_kwargs
+            )
+            stop_stats = _report_early_stop(stop_criteria, max_new_tokens)
+
+            # With left padding every row's prompt ends at the same column
+            input_token_len = model_inputs.input_ids.shape[1]
+            for row, prompt_idx in enumerate(batch_indices):
+                output_tokens = generated_ids[row][input_token_len:]
+                results[prompt_idx] = {
+                    "output": tokenizer.decode(output_tokens, skip_special_tokens=True),
+                    "input_tokens": prompt_lengths[prompt_idx],
+                    "output_tokens": _count_generated_tokens(output_tokens, tokenizer),
+                    "tokens_saved": stop_stats[row]["tokens_saved"] if stop_stats else 0,
+                }
+    finally:
+        tokenizer.padding_side = original_padding_side
+
+    return results
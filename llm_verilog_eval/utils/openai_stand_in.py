@@ -0,0 +1,136 @@
+# llm_verilog_eval/utils/openai_stand_in.py
+"""
+Minimal OpenAI-compatible completions server backed by a generation backend (the replay
+backend by default). Stands in for vLLM & co. when testing OpenAICompatibleBackend or
+benchmarking the evaluation pipeline without a GPU.
+
+Usage:
+    python openai_stand_in.py --port 8000 --model /data/genai/models/Qwen3-0.6B --module simple_and
+
+Endpoints:
+    GET  /v1/models
+    POST /v1/completions    {"model", "prompt" (str or list), "max_tokens", "temperature", "top_p", "seed", "stream"}
+    POST /tokenize          {"model", "prompt"} -> {"count", "tokens"}
+"""
+import argparse
+import json
+import threading
+import time
+import traceback
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from generation_backends import create_backend
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+
+class OpenAIStandInHandler(BaseHTTPRequestHandler):
+    # self.server.backend / self.server.model_name are set by make_stand_in_server
+
+    def log_message(self, format, *args):
+        pass # Keep benchmark output readable
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_event(self, body):
+        self.wfile.write(f"data: {json.dumps(body) if isinstance(body, dict) else body}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path != "/v1/models":
+            self._send_json(404, {"error": f"Unknown endpoint {self.path}"})
+            return
+        self._send_json(200, {"object": "list", "data": [{"id": self.server.model_name, "object": "model"}]})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            self._send_json(400, {"error": f"Invalid JSON request: {e}"})
+            return
+        if payload.get("model") != self.server.model_name:
+            self._send_json(404, {"error": f"Model {payload.get('model')} is not served"})
+            return
+        try:
+            if self.path == "/tokenize":
+                # Approximate token ids; only the count is meaningful
+                count = self.server.backend.count_tokens(payload["prompt"])
+                self._send_json(200, {"count": count, "tokens": list(range(count))})
+            elif self.path == "/v1/completions":
+                self._completions(payload)
+            else:
+                self._send_json(404, {"error": f"Unknown endpoint {self.path}"})
+        except KeyError as e:
+            self._send_json(400, {"error": f"Missing field {e}"})
+        except Exception as e:
+            traceback.print_exc()
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def _completions(self, payload):
+        backend = self.server.backend
+        generate_kwargs = {"max_new_tokens": payload.get("max_tokens", 16), "temperature": payload.get("temperature", 1.0),
+                           "top_p": payload.get("top_p", 1.0), "seed": payload.get("seed")}
+        response = {"id": f"cmpl-{uuid.uuid4().hex}", "object": "text_completion", "created": int(time.time()),
+                    "model": self.server.model_name}
+        if payload.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for text in backend.stream(payload["prompt"], **generate_kwargs):
+                self._send_event({**response, "choices": [{"index": 0, "text": text, "finish_reason": None}]})
+            self._send_event({**response, "choices": [{"index": 0, "text": "", "finish_reason": "stop"}]})
+            self._send_event("[DONE]")
+            return
+
+        prompts = payload["prompt"] if isinstance(payload["prompt"], list) else [payload["prompt"]]
+        outputs = backend.generate_batch(prompts, **generate_kwargs)
+        prompt_tokens = sum(backend.count_tokens(p) for p in prompts)
+        completion_tokens = sum(backend.count_tokens(o) for o in outputs)
+        self._send_json(200, {
+            **response,
+            "choices": [{"index": i, "text": text, "finish_reason": "stop"} for i, text in enumerate(outputs)],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+def make_stand_in_server(backend, model_name, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Loads `model_name` into `backend` and returns the (not yet started) HTTP server."""
+    backend.load(model_name)
+    server = ThreadingHTTPServer((host, port), OpenAIStandInHandler)
+    server.backend = backend
+    server.model_name = model_name
+    return server
+
+def start_stand_in_server(backend, model_name, host=DEFAULT_HOST, port=0):
+    """Serves in a daemon thread (port 0 = any free port). Returns (server, base_url); stop with server.shutdown()."""
+    server = make_stand_in_server(backend, model_name, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stand-in server replaying generated RTL.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--model", required=True, help="Model name to serve (also selects the replayed files)")
+    parser.add_argument("--module", default=None, help="Only replay generated RTL of this module")
+    parser.add_argument("--mode", default=None, help="Only replay outputs of this experiment mode")
+    parser.add_argument("--generated-rtl-dir", default=None)
+    args = parser.parse_args()
+
+    replay_options = {"module_name": args.module, "mode": args.mode}
+    if args.generated_rtl_dir:
+        replay_options["generated_rtl_dir"] = args.generated_rtl_dir
+    server = make_stand_in_server(create_backend("replay", **replay_options), args.model, args.host, args.port)
+    print(f"INFO [openai_stand_in]: Serving {args.model} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("INFO [openai_stand_in]: Shutting down.")
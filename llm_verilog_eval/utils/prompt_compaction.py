@@ -0,0 +1,103 @@
+# llm_verilog_eval/utils/prompt_compaction.py
+"""
+Prompt compaction for Verilog sources placed into prompts.
+
+RTL taken from the repository carries a license banner, alignment padding and long
+explanatory comments that are prefilled for every sample without helping the model.
+`compact_verilog_prompt` strips the license banner, collapses whitespace and optionally
+drops comments that do not document a declaration. Comments containing the mask token
+or matching `keep_comment_patterns` (e.g. the "// LLM:" task instructions) are always kept,
+as are compiler directives such as `timescale.
+"""
+import re
+from masking_utils import DEFAULT_MASK_TOKEN
+from token_budget import count_tokens
+
+DEFAULT_PROMPT_COMPACTION = {
+    "enabled": True,
+    "strip_license": True,          # Drop leading comments mentioning a copyright/license
+    "collapse_whitespace": True,    # Strip trailing blanks, squeeze blank lines and alignment padding
+    "drop_comments": False,         # Drop comments that do not directly precede a declaration
+    "keep_comment_patterns": [r"\bLLM\b"],
+}
+
+# Comments (a run of consecutive // lines is one comment), and string literals so comment
+# markers inside strings are left alone
+_LEXEME_RE = re.compile(r'//[^\n]*(?:\n[ \t]*//[^\n]*)*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"', re.DOTALL)
+_STRING_RE = re.compile(r'"(?:\\.|[^"\\\n])*"')
+_LICENSE_RE = re.compile(r"copyright|permission is hereby granted|licen[sc]e|SPDX-License-Identifier", re.IGNORECASE)
+# Code a documenting comment is directly followed by
+_DECLARATION_RE = re.compile(r"\s*(module|input|output|inout|parameter|localparam|reg|wire|integer|"
+                             r"function|task|generate|genvar)\b")
+# Placeholder left where a comment was dropped, so lines holding nothing else can be removed
+_DROPPED = "\x00"
+
+def _is_code_before(text, pos):
+    """True if anything but whitespace and comments precedes `pos`."""
+    return bool(_LEXEME_RE.sub("", text[:pos]).strip())
+
+def _collapse_line(line):
+    indent = line[:len(line) - len(line.lstrip())]
+    body = line[len(indent):]
+    # Squeeze alignment padding outside string literals
+    parts = []
+    last = 0
+    for match in _STRING_RE.finditer(body):
+        parts.append(re.sub(r"[ \t]{2,}", " ", body[last:match.start()]))
+        parts.append(match.group())
+        last = match.end()
+    parts.append(re.sub(r"[ \t]{2,}", " ", body[last:]))
+    return indent + "".join(parts)
+
+def compact_verilog_prompt(code, options=None, mask_token=DEFAULT_MASK_TOKEN):
+    """Returns `code` compacted according to `options` (overrides of DEFAULT_PROMPT_COMPACTION)."""
+    config = dict(DEFAULT_PROMPT_COMPACTION)
+    config.update(options or {})
+    if not config["enabled"]:
+        return code
+    keep_patterns = [re.compile(p) for p in config["keep_comment_patterns"]]
+
+    def replace(match):
+        lexeme = match.group()
+        if lexeme.startswith('"') or mask_token in lexeme or any(p.search(lexeme) for p in keep_patterns):
+            return lexeme
+        if config["strip_license"] and _LICENSE_RE.search(lexeme) and not _is_code_before(code, match.start()):
+            return _DROPPED
+        if config["drop_comments"]:
+            # Comments trailing code on the same line or not followed by a declaration are not documentation
+            line_start = code.rfind("\n", 0, match.start()) + 1
+            trailing = bool(code[line_start:match.start()].strip())
+            if trailing or not _DECLARATION_RE.match(code, match.end()):
+                return _DROPPED
+        return lexeme
+
+    compacted = _LEXEME_RE.sub(replace, code)
+    lines = []
+    for line in compacted.splitlines():
+        if _DROPPED in line:
+            line = line.replace(_DROPPED, "")
+            if not line.strip():
+                continue # The line only held the dropped comment
+        if config["collapse_whitespace"]:
+            line = _collapse_line(line.rstrip())
+            if not line and (not lines or not lines[-1]):
+                continue # Squeeze runs of blank lines (and leading ones) into at most one
+        lines.append(line)
+    return "\n".join(lines).strip("\n") + ("\n" if code.endswith("\n") else "")
+
+def compact_prompt_with_stats(tokenizer, code, options=None, mask_token=DEFAULT_MASK_TOKEN, label="prompt"):
+    """Compacts `code` and logs its token count before and after. Returns (compacted code, stats dict)."""
+    compacted = compact_verilog_prompt(code, options, mask_token)
+    tokens_before = count_tokens(tokenizer, code)
+    tokens_after = count_tokens(tokenizer, compacted) if compacted != code else tokens_before
+    stats = {
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": tokens_before - tokens_after,
+        "chars_before": len(code),
+        "chars_after": len(compacted),
+    }
+    saved_pct = stats["tokens_saved"] / tokens_before if tokens_before else 0.0
+    print(f"INFO [prompt_compaction]: {label}: {tokens_before} -> {tokens_after} tokens "
+          f"({stats['tokens_saved']} saved, {saved_pct:.1%}).")
+    return compacted, stats
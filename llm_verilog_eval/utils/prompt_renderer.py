@@ -0,0 +1,129 @@
+# llm_verilog_eval/utils/prompt_renderer.py
+"""
+Per-model chat prompt renderers.
+
+`get_prompt_renderer` creates one renderer per tokenizer. Creating it validates the model's
+chat template once (a broken or missing template raises instead of silently falling back to a
+raw prompt), and for every system instruction the rendered and tokenized template text around
+the user message is cached. Rendering a prompt afterwards only concatenates and tokenizes the
+variable user content. Templates that cannot be split that way are still validated once and
+then rendered in full on every call.
+"""
+import re
+from generation_backends import render_chatml
+
+# Model families by name. Without "system_role" the system instruction is folded into the user
+# turn the way Gemma 3's template does it (Gemma 2's template rejects system messages).
+# "chatml_fallback" renders ChatML when the tokenizer ships no chat template.
+PROMPT_FAMILIES = {
+    "qwen": {"pattern": r"qwen", "system_role": True, "chatml_fallback": True},
+    "gemma": {"pattern": r"gemma", "system_role": False, "chatml_fallback": False},
+    "default": {"pattern": None, "system_role": True, "chatml_fallback": False},
+}
+
+_SENTINEL = "<<<PROMPT_RENDERER_USER_CONTENT>>>"
+# Whitespace-free probe, so templates that trim message content can still be split
+_PROBE_CONTENT = "Complete this Verilog module:\n```verilog\nmodule probe (input wire a, output wire y);\nendmodule\n```"
+
+class RenderedPrompt(str):
+    """A rendered prompt that also carries its token ids (None when it was not pre-tokenized)."""
+    def __new__(cls, text, token_ids=None):
+        prompt = super().__new__(cls, text)
+        prompt.token_ids = token_ids
+        return prompt
+
+def detect_prompt_family(model_name_or_path):
+    for family, options in PROMPT_FAMILIES.items():
+        if options["pattern"] and re.search(options["pattern"], model_name_or_path or "", re.IGNORECASE):
+            return family
+    return "default"
+
+class PromptRenderer:
+    """Renders single-turn chat prompts (optional system instruction + user content) for one tokenizer."""
+    def __init__(self, tokenizer, family="default"):
+        self.tokenizer = tokenizer
+        self.family = family
+        self.options = PROMPT_FAMILIES[family]
+        self.use_chatml = False
+        self.split_template = True
+        # Only local tokenizers can be called; remote ones (server/openai backends) just render text
+        self.pretokenize = callable(tokenizer)
+        self._parts = {} # system instruction -> (prefix text, suffix text, prefix ids, suffix ids)
+        self._validate()
+
+    def messages(self, user_content, system=None):
+        if system is None:
+            return [{"role": "user", "content": user_content}]
+        if self.options["system_role"]:
+            return [{"role": "system", "content": system}, {"role": "user", "content": user_content}]
+        return [{"role": "user", "content": f"{system}\n\n{user_content}"}]
+
+    def _apply_template(self, messages):
+        if self.use_chatml:
+            return render_chatml(messages)
+        return self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+    def _encode(self, text):
+        return list(self.tokenizer(text, add_special_tokens=False).input_ids)
+
+    def _validate(self):
+        if hasattr(self.tokenizer, "chat_template") and not self.tokenizer.chat_template:
+            if not self.options["chatml_fallback"]:
+                raise ValueError(f"Tokenizer {getattr(self.tokenizer, 'name_or_path', '')} has no chat template")
+            print(f"Warning [prompt_renderer]: No chat template, rendering ChatML for the {self.family} family.")
+            self.use_chatml = True
+        probe_system = "You are a probe."
+        try:
+            rendered = self._apply_template(self.messages(_PROBE_CONTENT, system=probe_system))
+        except Exception as e:
+            raise ValueError(f"Chat template of the {self.family} family failed to render: {e}") from e
+        if rendered.count(_PROBE_CONTENT) != 1:
+            raise ValueError("Chat template does not reproduce the user content verbatim")
+
+        prefix, suffix, prefix_ids, suffix_ids = self._get_parts(probe_system)
+        if prefix + _PROBE_CONTENT + suffix != rendered:
+            self.split_template = False
+        elif self.pretokenize and prefix_ids + self._encode(_PROBE_CONTENT) + suffix_ids != self._encode(rendered):
+            self.pretokenize = False # A token merges across the template/content boundary
+        self._parts.clear()
+        print(f"INFO [prompt_renderer]: Validated the {self.family} chat template "
+              f"(cached template parts: {self.split_template}, pre-tokenized: {self.pretokenize}).")
+
+    def _get_parts(self, system):
+        if system not in self._parts:
+            rendered = self._apply_template(self.messages(_SENTINEL, system=system))
+            prefix, _, suffix = rendered.partition(_SENTINEL)
+            ids = (self._encode(prefix), self._encode(suffix)) if self.pretokenize else (None, None)
+            self._parts[system] = (prefix, suffix, *ids)
+        return self._parts[system]
+
+    def render(self, user_content, system=None):
+        """Returns the RenderedPrompt for one user turn, ready for generate_verilog."""
+        # Leading/trailing whitespace may be trimmed by the template or merge with template tokens
+        if not self.split_template or user_content != user_content.strip():
+            text = self._apply_template(self.messages(user_content, system=system))
+            return RenderedPrompt(text, self._encode(text) if self.pretokenize else None)
+        prefix, suffix, prefix_ids, suffix_ids = self._get_parts(system)
+        token_ids = prefix_ids + self._encode(user_content) + suffix_ids if self.pretokenize else None
+        return RenderedPrompt(prefix + user_content + suffix, token_ids)
+
+# (model_name_or_path, tokenizer name_or_path) -> PromptRenderer. llm_interface drops the renderers of
+# the tokenizers of evicted models (forget_prompt_renderers), so they are not kept alive here.
+_renderers = {}
+
+def get_prompt_renderer(tokenizer, model_name_or_path=None):
+    """
+    Returns the cached renderer of `tokenizer`, creating (and validating) it on first use. The
+    family is detected from `model_name_or_path` (default: the tokenizer's name_or_path).
+    """
+    model_name_or_path = model_name_or_path or getattr(tokenizer, "name_or_path", None)
+    key = (model_name_or_path, getattr(tokenizer, "name_or_path", None))
+    renderer = _renderers.get(key)
+    if renderer is None or renderer.tokenizer is not tokenizer: # New, or the model was reloaded
+        renderer = _renderers[key] = PromptRenderer(tokenizer, detect_prompt_family(model_name_or_path))
+    return renderer
+
+def forget_prompt_renderers(tokenizer):
+    """Drops the cached renderers of `tokenizer`, e.g. when its model is evicted."""
+    for key in [key for key, renderer in _renderers.items() if renderer.tokenizer is tokenizer]:
+        del _renderers[key]
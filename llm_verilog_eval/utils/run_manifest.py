@@ -0,0 +1,80 @@
+# llm_verilog_eval/utils/run_manifest.py
+"""
+Per-run manifest for resumable sweeps.
+
+The manifest is one JSON file per run recording, for every sample of the run, its model,
+module, mode, sample index, seed and status:
+    pending   -> not generated yet
+    generated -> raw output persisted (`raw_output_path`), not evaluated yet
+    evaluated -> evaluation finished (`passed`)
+The manifest and the raw outputs are written atomically (temp file + rename), so a crash
+never leaves a half-written file and a restarted run can skip everything already done.
+"""
+import json
+import os
+import tempfile
+from datetime import datetime
+
+STATUSES = ("pending", "generated", "evaluated")
+
+def write_atomic(path, text):
+    """Writes `text` to `path` via a temp file in the same directory and an atomic rename."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class RunManifest:
+    """
+    Loads the manifest at `path` if it exists (a resumed run), otherwise starts a new one
+    from `run_info` (run name, model, module, mode, ...). Items are keyed by sample index.
+    """
+    def __init__(self, path, run_info):
+        self.path = path
+        self.resumed = os.path.exists(path)
+        if self.resumed:
+            with open(path, 'r') as f:
+                self.data = json.load(f)
+            mismatched = {k: (self.data.get(k), v) for k, v in run_info.items() if self.data.get(k) != v}
+            if mismatched:
+                raise ValueError(f"Run manifest {path} was created with different settings: {mismatched}")
+            counts = {status: len(self.indices(status)) for status in STATUSES}
+            print(f"INFO [run_manifest]: Resuming {os.path.basename(path)} ({counts}).")
+        else:
+            self.data = {**run_info, "created": datetime.now().isoformat(timespec="seconds"), "items": {}}
+
+    def add_item(self, sample_index, seed=None):
+        """Registers a sample of the sweep (no-op if the manifest already has it)."""
+        key = str(sample_index)
+        if key not in self.data["items"]:
+            self.data["items"][key] = {
+                "model": self.data.get("model"), "module": self.data.get("module"), "mode": self.data.get("mode"),
+                "sample_index": sample_index, "seed": seed, "status": "pending",
+            }
+
+    def item(self, sample_index):
+        return self.data["items"][str(sample_index)]
+
+    def indices(self, status):
+        return sorted(item["sample_index"] for item in self.data["items"].values() if item["status"] == status)
+
+    def mark(self, sample_index, status, **fields):
+        """Sets the status (and extra fields) of one sample and saves the manifest."""
+        if status not in STATUSES:
+            raise ValueError(f"Unknown status '{status}', expected one of {STATUSES}")
+        item = self.item(sample_index)
+        item.update(fields)
+        item["status"] = status
+        item["updated"] = datetime.now().isoformat(timespec="seconds")
+        self.save()
+
+    def save(self):
+        write_atomic(self.path, json.dumps(self.data, indent=2))
@@ -0,0 +1,57 @@
+# llm_verilog_eval/utils/token_budget.py
+import json
+import os
+from datetime import datetime
+
+# Used for modules whose MODULE_CONFIGS entry has no "token_budget" section
+DEFAULT_TOKEN_BUDGET = {
+    "multiplier": 2.0,   # Budget = multiplier x tokens of the reference RTL (or prompt header)
+    "min_tokens": 512,   # Leaves room for a short preamble/code fence around tiny modules
+    "max_tokens": 8192,  # Never exceed the old hardcoded limit
+}
+
+# Re-tokenizing decoded text is not exact, so outputs this close to the budget count as truncated
+TRUNCATION_SLACK_TOKENS = 8
+
+def count_tokens(tokenizer, text):
+    """Counts tokens of `text`, using the tokenizer's own count_tokens() when it has one (remote tokenizers)."""
+    if hasattr(tokenizer, "count_tokens"):
+        return tokenizer.count_tokens(text)
+    return len(tokenizer(text, add_special_tokens=False).input_ids)
+
+def compute_token_budget(tokenizer, reference_path, budget_config=None, module_name_for_ref="unknown_module"):
+    """
+    Derives a per-module `max_new_tokens` from the length of the reference text (usually
+    rtl/<module>.v, or the prompt header when no reference exists). Returns
+    (budget, reference_token_count).
+    """
+    config = dict(DEFAULT_TOKEN_BUDGET)
+    config.update(budget_config or {})
+
+    with open(reference_path, 'r') as f:
+        reference_tokens = count_tokens(tokenizer, f.read())
+    budget = int(reference_tokens * config["multiplier"])
+    budget = max(config["min_tokens"], min(config["max_tokens"], budget))
+    print(f"INFO [token_budget]: '{module_name_for_ref}' reference {os.path.basename(reference_path)} has "
+          f"{reference_tokens} tokens -> max_new_tokens={budget} "
+          f"(x{config['multiplier']}, clamped to [{config['min_tokens']}, {config['max_tokens']}]).")
+    return budget, reference_tokens
+
+def is_truncated(output_token_count, budget):
+    return output_token_count >= budget - TRUNCATION_SLACK_TOKENS
+
+def log_truncation_event(log_path, module_name, model_name_or_path, budget, output_token_count, **extra):
+    """Appends a truncation event as one JSON line to `log_path` and prints a warning."""
+    print(f"Warning [token_budget]: Output for '{module_name}' used {output_token_count} of its "
+          f"{budget}-token budget and was likely truncated. Logged to {log_path}")
+    record = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "module": module_name,
+        "model": model_name_or_path,
+        "budget": budget,
+        "output_tokens": output_token_count,
+        **extra,
+    }
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    with open(log_path, 'a') as f:
+        f.write(json.dumps(record) + "\n")
@@ -0,0 +1,166 @@
+# llm_verilog_eval/utils/verilog_stopping.py
+import re
+import torch
+from transformers import StoppingCriteria
+from transformers.generation.streamers import BaseStreamer
+
+_MODULE_RE = re.compile(r"\b(?:macro)?module\b")
+_ENDMODULE_RE = re.compile(r"\bendmodule\b")
+
+class VerilogCompletionTracker:
+    """
+    Follows the decoded text of one generated sequence line by line and decides when the
+    Verilog answer is complete: every `module` has its `endmodule` and, if the answer was
+    opened with a markdown code fence, that fence has been closed again.
+    """
+    def __init__(self):
+        self.text = ""
+        self.in_fence = False
+        self.saw_fence = False
+        self.in_block_comment = False
+        self.module_depth = 0
+        self.modules_closed = 0
+        self.complete = False
+
+    def _strip_comments(self, line):
+        code = ""
+        while line:
+            if self.in_block_comment:
+                end = line.find("*/")
+                if end == -1:
+                    return code
+                line = line[end + 2:]
+                self.in_block_comment = False
+            else:
+                start = line.find("/*")
+                line_comment = line.find("//")
+                if line_comment != -1 and (start == -1 or line_comment < start):
+                    return code + line[:line_comment]
+                if start == -1:
+                    return code + line
+                code += line[:start]
+                line = line[start + 2:]
+                self.in_block_comment = True
+        return code
+
+    def _module_balanced(self):
+        return self.modules_closed > 0 and self.module_depth == 0
+
+    def feed_line(self, line):
+        """Consumes one complete line of decoded text."""
+        if self.complete:
+            return
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            if self.in_fence and self._module_balanced():
+                self.complete = True
+            elif not self.in_fence and not self.saw_fence:
+                # Prose before the first fence may mention "module"; only the fenced code counts
+                self.module_depth = 0
+                self.modules_closed = 0
+            self.in_fence = not self.in_fence
+            self.saw_fence = True
+            return
+        if self.saw_fence and not self.in_fence:
+            return
+        code = self._strip_comments(line)
+        self.module_depth += len(_MODULE_RE.findall(code))
+        closed = len(_ENDMODULE_RE.findall(code))
+        self.module_depth -= closed
+        self.modules_closed += closed
+        # Unfenced answers are complete as soon as the outermost module is closed
+        if not self.saw_fence and closed and self._module_balanced():
+            self.complete = True
+
+    def pending_line_closes_fence(self, pending):
+        """True if a not yet terminated line is already the closing fence of a finished answer."""
+        return self.in_fence and self._module_balanced() and pending.strip().startswith("```")
+
+class VerilogCompletionStreamer(BaseStreamer):
+    """
+    Streamer passed to `model.generate` that incrementally decodes every sequence of the
+    batch and feeds completed lines into a VerilogCompletionTracker per sequence.
+    """
+    def __init__(self, tokenizer, skip_prompt=True):
+        self.tokenizer = tokenizer
+        self.skip_prompt = skip_prompt
+        self.next_tokens_are_prompt = True
+        self.trackers = []
+        self.token_caches = []
+        self.pending_text = []
+        self.num_generated = []
+        self.hit_eos = []
+
+    def put(self, value):
+        if self.skip_prompt and self.next_tokens_are_prompt:
+            self.next_tokens_are_prompt = False
+            return
+        # One new token per sequence in regular decoding, several accepted tokens at once in assisted decoding
+        if value.dim() == 1:
+            value = value.unsqueeze(-1)
+        if not self.trackers:
+            self.trackers = [VerilogCompletionTracker() for _ in range(value.shape[0])]
+            self.token_caches = [[] for _ in range(value.shape[0])]
+            self.pending_text = [""] * value.shape[0]
+            self.num_generated = [0] * value.shape[0]
+            self.hit_eos = [False] * value.shape[0]
+        for row, token_ids in enumerate(value.tolist()):
+            for token_id in token_ids:
+                self._put_token(row, token_id)
+
+    def _put_token(self, row, token_id):
+        tracker = self.trackers[row]
+        # Finished rows keep receiving padding from generate(); ignore it
+        if tracker.complete or self.hit_eos[row]:
+            return
+        self.num_generated[row] += 1
+        if token_id == self.tokenizer.eos_token_id:
+            self.hit_eos[row] = True
+            return
+        self.token_caches[row].append(token_id)
+        # Decode only the tokens of the current line and commit it once it ends in a newline
+        pending = self.pending_text[row] + self.tokenizer.decode(self.token_caches[row], skip_special_tokens=True)
+        if "\n" in pending and not pending.endswith("\ufffd"):
+            *full_lines, rest = pending.split("\n")
+            for line in full_lines:
+                tracker.feed_line(line)
+            tracker.text += pending[:len(pending) - len(rest)]
+            self.pending_text[row] = rest
+            self.token_caches[row] = []
+            pending = rest
+        if tracker.pending_line_closes_fence(pending):
+            tracker.complete = True
+            tracker.text += pending
+
+    def end(self):
+        self.next_tokens_are_prompt = True
+
+    def is_complete(self, row):
+        return bool(self.trackers) and self.trackers[row].complete
+
+class ModuleCompleteStoppingCriteria(StoppingCriteria):
+    """
+    Stops each sequence once its VerilogCompletionStreamer tracker reports a finished
+    module (and closed code fence), instead of running on to `max_new_tokens`.
+    """
+    def __init__(self, streamer):
+        self.streamer = streamer
+
+    def __call__(self, input_ids, scores, **kwargs):
+        done = [self.streamer.is_complete(row) for row in range(input_ids.shape[0])]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+    def report(self, max_new_tokens):
+        """
+        Returns per-sequence early-stop statistics. `tokens_saved` is measured against the
+        `max_new_tokens` budget, i.e. it is the upper bound of what the run would have cost.
+        """
+        stats = []
+        for row, tracker in enumerate(self.streamer.trackers):
+            generated = self.streamer.num_generated[row]
+            stats.append({
+                "stopped_early": tracker.complete,
+                "generated_tokens": generated,
+                "tokens_saved": max_new_tokens - generated if tracker.complete else 0,
+            })
+        return stats
@@ -227,6 +227,9 @@ def test_bench():
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
     #sim = Simulation(bench())
     traceSignals.name = os.path.basename(__file__).rsplit('.',1)[0]
+    # MODIFICATION: write the .vcd to BUILD_DIR when it is set (default: the current directory)
+    traceSignals.directory = os.environ.get("BUILD_DIR", ".")
+    os.makedirs(traceSignals.directory, exist_ok=True)
     sim = Simulation(traceSignals(bench))
     sim.run()
 
@@ -79,7 +79,11 @@ initial begin
     );
 
     // dump file
+`ifdef DUMPFILE
+    $dumpfile(`DUMPFILE); // Set by the testbench script (BUILD_DIR)
+`else
     $dumpfile("test_i2c_init.lxt");
+`endif
     $dumpvars(0, test_i2c_init);
 end
 
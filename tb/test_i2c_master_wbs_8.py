@@ -41,7 +41,16 @@ srcs.append("%s.v" % testbench)
 
 src = ' '.join(srcs)
 
-build_cmd = "iverilog -o %s.vvp %s" % (testbench, src)
+# MODIFICATION START
+# Build outputs (.vvp, .lxt) go to BUILD_DIR when it is set (default: the current directory),
+# so concurrent runs of this testbench do not overwrite each other's files
+build_dir = os.environ.get("BUILD_DIR", ".")
+os.makedirs(build_dir, exist_ok=True)
+vvp_file = os.path.join(build_dir, "%s.vvp" % testbench)
+lxt_file = os.path.join(build_dir, "%s.lxt" % testbench)
+
+build_cmd = 'iverilog -o %s -DDUMPFILE=\\"%s\\" %s' % (vvp_file, lxt_file, src)
+# MODIFICATION END
 
 def bench():
 
@@ -144,7 +153,7 @@ def bench():
         raise Exception("Error running build command")
     
     dut = Cosimulation(
-        "vvp -m myhdl %s.vvp -lxt2" % testbench,
+        "vvp -m myhdl %s -lxt2" % vvp_file,
         clk=clk,
         rst=rst,
         current_test=current_test,
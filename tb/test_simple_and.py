@@ -48,9 +48,13 @@ srcs.append(generated_dut_rtl_file)
 srcs.append(os.path.join(os.path.dirname(__file__), f"{testbench_verilog_wrapper_name}.v"))
 
 src_files_str = ' '.join(f'"{s}"' for s in srcs) # Enclose paths in quotes for safety
-# Output compiled file in the current directory (which will be tb/ when run by evaluate_rtl.sh)
-compiled_output_name = f"{testbench_verilog_wrapper_name}.vvp"
-build_cmd = f"iverilog -o {compiled_output_name} {src_files_str}"
+# Output compiled file and waveform into BUILD_DIR when it is set (a per-evaluation scratch directory,
+# so concurrent evaluations do not overwrite each other's files), else the current directory (tb/)
+build_dir = os.environ.get("BUILD_DIR", ".")
+os.makedirs(build_dir, exist_ok=True)
+compiled_output_name = os.path.join(build_dir, f"{testbench_verilog_wrapper_name}.vvp")
+dump_file_name = os.path.join(build_dir, f"{testbench_verilog_wrapper_name}.lxt")
+build_cmd = f'iverilog -o "{compiled_output_name}" -DDUMPFILE=\\"{dump_file_name}\\" {src_files_str}'
 
 print(f"MyHDL Test: Build command: {build_cmd}")
 
@@ -74,7 +78,7 @@ def simple_and_myhdl_tb():
     # Make sure myhdl.vpi can be found (via IVERILOG_VPI_MODULE_PATH)
     print(f"MyHDL Test: Starting Cosimulation with 'vvp -m myhdl {compiled_output_name}'")
     dut_cosim = Cosimulation(
-        f"vvp -m myhdl {compiled_output_name}", # Can add -lxt2 here for waveform dump
+        f'vvp -m myhdl "{compiled_output_name}"', # Can add -lxt2 here for waveform dump
         # Signal mapping: MyHDL signal = Verilog port name in wrapper
         clk_myhdl=clk, # Maps MyHDL 'clk' to Verilog 'clk_myhdl' in test_simple_and.v
         a_myhdl=a,     # Maps MyHDL 'a' to Verilog 'a_myhdl'
@@ -122,6 +126,9 @@ def simple_and_myhdl_tb():
 
     return instances() # Return all generators (clk_driver, stimulus_checker) and the Cosimulation instance
 
+# Entry point name shared with the other testbenches, used by evaluation_scripts/testbench_api.py
+bench = simple_and_myhdl_tb
+
 # Main function to run the simulation
 if __name__ == '__main__':
     print(f"--- Running MyHDL Testbench: {os.path.basename(__file__)} ---")
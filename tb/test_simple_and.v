@@ -22,7 +22,11 @@ initial begin
     );
 
     // Optional: waveform dumping for debugging
+`ifdef DUMPFILE
+    $dumpfile(`DUMPFILE); // Set by test_simple_and.py (BUILD_DIR, or the tb/ directory)
+`else
     $dumpfile("test_simple_and.lxt"); // Dumps into the tb/ directory when run
+`endif
     $dumpvars(0, test_simple_and);    // Dump all signals in this wrapper and below
 end
 